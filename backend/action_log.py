@@ -0,0 +1,111 @@
+import time
+import numpy as np
+from typing import Dict, List, Optional, Sequence
+
+ACTION_NAMES = ["EXTEND_NS", "EXTEND_EW", "SWITCH_NS", "SWITCH_EW"]
+
+
+class ActionLog:
+    """Fixed-capacity, array-backed log of agent decisions.
+
+    Entries live in preallocated NumPy columns indexed as a ring; each gets a
+    monotonically increasing sequence number so consumers can ask for "everything
+    after seq N" without re-reading what they already have. Tail queries touch only
+    the requested entries; filters run vectorised over the retained window.
+    """
+
+    def __init__(self, capacity: int = 4096, action_size: int = len(ACTION_NAMES)):
+        self.capacity = capacity
+        self.action_size = action_size
+        self.seq = np.zeros(capacity, dtype=np.int64)
+        self.action = np.zeros(capacity, dtype=np.int8)
+        self.q_values = np.full((capacity, action_size), np.nan, dtype=np.float32)
+        self.reward = np.zeros(capacity, dtype=np.float32)
+        self.epsilon = np.zeros(capacity, dtype=np.float32)
+        self.sim_time = np.zeros(capacity, dtype=np.float64)
+        self.wall_time = np.zeros(capacity, dtype=np.float64)
+        self.next_seq = 1
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, action: int, q_values: Optional[Sequence[float]], reward: float, epsilon: float,
+               sim_time: float, wall_time: Optional[float] = None) -> int:
+        """Record one decision; returns its sequence number"""
+        slot = (self.next_seq - 1) % self.capacity
+        seq = self.next_seq
+        self.seq[slot] = seq
+        self.action[slot] = action
+        if q_values is None:
+            self.q_values[slot] = np.nan  # Exploratory action, no forward pass was made
+        else:
+            self.q_values[slot] = q_values
+        self.reward[slot] = reward
+        self.epsilon[slot] = epsilon
+        self.sim_time[slot] = sim_time
+        self.wall_time[slot] = time.time() if wall_time is None else wall_time
+        self.next_seq += 1
+        self._count = min(self._count + 1, self.capacity)
+        return seq
+
+    def append_entry(self, entry: Dict) -> int:
+        """Record a decision received as a serialized entry (see `to_dicts`)"""
+        q_values = entry.get("qValues")
+        return self.append(
+            ACTION_NAMES.index(entry["action"]) if isinstance(entry["action"], str) else int(entry["action"]),
+            None if q_values is None else [np.nan if q is None else q for q in q_values],
+            entry.get("reward", 0.0),
+            entry.get("epsilon", 0.0),
+            entry.get("simulationTime", 0.0),
+            entry.get("wallTime"),
+        )
+
+    def _slots(self, first_seq: int, last_seq: int) -> np.ndarray:
+        """Ring slots for the retained sequence numbers in [first_seq, last_seq], oldest first"""
+        first_seq = max(first_seq, self.next_seq - self._count)
+        if last_seq < first_seq:
+            return np.empty(0, dtype=np.intp)
+        return np.arange(first_seq - 1, last_seq, dtype=np.intp) % self.capacity
+
+    def tail(self, k: int) -> List[Dict]:
+        """The `k` most recent decisions, newest first (O(k))"""
+        last = self.next_seq - 1
+        return self.to_dicts(self._slots(last - k + 1, last)[::-1])
+
+    def since(self, seq: int, limit: Optional[int] = None) -> List[Dict]:
+        """Decisions recorded after sequence number `seq`, oldest first"""
+        last = self.next_seq - 1
+        first = seq + 1
+        if limit is not None:
+            first = max(first, last - limit + 1)
+        return self.to_dicts(self._slots(first, last))
+
+    def query(self, action: Optional[int] = None, start_time: Optional[float] = None,
+              end_time: Optional[float] = None, limit: int = 100) -> List[Dict]:
+        """Most recent decisions matching an action and/or simulation-time range, newest first"""
+        slots = self._slots(1, self.next_seq - 1)
+        mask = np.ones(len(slots), dtype=bool)
+        if action is not None:
+            mask &= self.action[slots] == action
+        if start_time is not None:
+            mask &= self.sim_time[slots] >= start_time
+        if end_time is not None:
+            mask &= self.sim_time[slots] <= end_time
+        return self.to_dicts(slots[mask][::-1][:limit])
+
+    def to_dicts(self, slots: np.ndarray) -> List[Dict]:
+        entries = []
+        for slot in slots:
+            q_values = self.q_values[slot]
+            entries.append({
+                'seq': int(self.seq[slot]),
+                'time': time.strftime("%H:%M:%S", time.localtime(self.wall_time[slot])),
+                'wallTime': float(self.wall_time[slot]),
+                'simulationTime': float(self.sim_time[slot]),
+                'action': ACTION_NAMES[self.action[slot]],
+                'qValues': None if np.isnan(q_values).all() else [float(q) for q in q_values],
+                'reward': float(self.reward[slot]),
+                'epsilon': float(self.epsilon[slot]),
+            })
+        return entries
@@ -0,0 +1,92 @@
+import sys
+import time
+import random
+import threading
+import numpy as np
+from typing import Optional, Tuple
+
+from rl_agent import DQNAgent
+from policy import PolicySnapshot
+
+
+class AsyncLearner(threading.Thread):
+    """Train the DQN on a background thread while the simulation loop keeps acting.
+
+    The actor appends transitions and calls `notify_step()`; every `train_every` actor
+    steps the learner runs `gradient_steps` replay updates and publishes a fresh
+    `PolicySnapshot`. The actor only ever reads `self.snapshot`, a reference that is
+    replaced atomically, so choosing an action never waits on a Keras training pass.
+    """
+
+    def __init__(self, agent: DQNAgent, train_every: int = 1, gradient_steps: int = 1,
+                 min_buffer: Optional[int] = None):
+        super().__init__(name="dqn-learner", daemon=True)
+        self.agent = agent
+        self.train_every = max(1, train_every)
+        self.gradient_steps = max(1, gradient_steps)
+        self.min_buffer = agent.batch_size if min_buffer is None else min_buffer
+        self.snapshot: PolicySnapshot = agent.policy_snapshot()
+
+        self._cond = threading.Condition()
+        self._pending_steps = 0
+        self._sync_target = False
+        self._stopped = False
+        self.updates = 0
+        self.last_update_seconds = 0.0
+
+    def act(self, state: np.ndarray) -> int:
+        """Epsilon-greedy action from the latest published policy snapshot"""
+        return self.act_with_q_values(state)[0]
+
+    def act_with_q_values(self, state: np.ndarray) -> Tuple[int, Optional[np.ndarray]]:
+        if np.random.random() <= self.agent.epsilon:
+            return random.randrange(self.agent.action_size), None
+        q_values = self.snapshot.q_values(state)[0]
+        return int(np.argmax(q_values)), q_values
+
+    def notify_step(self):
+        """Called by the actor after each stored transition"""
+        with self._cond:
+            self._pending_steps += 1
+            if self._pending_steps >= self.train_every:
+                self._cond.notify()
+
+    def request_target_sync(self):
+        """Ask the learner to copy online weights to the target network between updates"""
+        with self._cond:
+            self._sync_target = True
+            self._cond.notify()
+
+    def stop(self, timeout: float = 5.0):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self.is_alive():  # cleanup may run after a failure that came before start()
+            self.join(timeout)
+
+    def run(self):
+        while True:
+            with self._cond:
+                while not self._stopped and not self._sync_target and self._pending_steps < self.train_every:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                sync_target = self._sync_target
+                self._sync_target = False
+                ready = self._pending_steps >= self.train_every
+                if ready:
+                    # Drop backlog beyond one update so a slow learner does not train in bursts
+                    self._pending_steps = min(self._pending_steps - self.train_every, self.train_every)
+
+            try:
+                if sync_target:
+                    self.agent.update_target_model()
+                if ready and len(self.agent.memory) > self.min_buffer:
+                    started = time.perf_counter()
+                    for _ in range(self.gradient_steps):
+                        self.agent.replay()
+                    self.snapshot = self.agent.policy_snapshot()
+                    self.updates += 1
+                    self.last_update_seconds = time.perf_counter() - started
+            except Exception as e:
+                print(f"Learner update failed: {e}", file=sys.stderr)
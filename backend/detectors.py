@@ -0,0 +1,157 @@
+import os
+import sys
+import argparse
+import tempfile
+import xml.etree.ElementTree as ET
+from operator import itemgetter
+from typing import List
+
+import numpy as np
+import traci
+import traci.constants as tc
+
+from net_index import load_net_index
+from sumo_bridge import DIRECTIONS, LaneIndex, net_file_from_config
+
+# Per-detector features, in tensor column order
+DETECTOR_FEATURES = ['count', 'halting', 'jam_length', 'occupancy']
+DETECTOR_VARS = [
+    tc.LAST_STEP_VEHICLE_NUMBER,
+    tc.LAST_STEP_VEHICLE_HALTING_NUMBER,
+    tc.JAM_LENGTH_METERS,
+    tc.LAST_STEP_OCCUPANCY,
+]
+# Stretch upstream of the stop line a detector covers; roughly what a stop-line camera sees
+DEFAULT_DETECTOR_LENGTH = 100.0
+# Aggregation interval of the (discarded) detector output file
+DETECTOR_PERIOD = 3600
+
+
+def detector_id(lane_id: str) -> str:
+    return f"e2_{lane_id}"
+
+
+def generate_detectors(net_file: str, length: float = DEFAULT_DETECTOR_LENGTH) -> str:
+    """Write an E2 lane-area detector on every incoming lane of every traffic light; returns the file.
+
+    Each detector ends at the stop line and reaches `length` metres upstream (or the
+    whole lane if it is shorter). The file lives next to the net's compiled index, so it
+    is written once per net and detector length and rebuilt when the net changes.
+    """
+    net = load_net_index(net_file)
+    path = os.path.join(net.directory, f"e2-{length:g}m.add.xml")
+    if os.path.exists(path):
+        return path
+
+    root = ET.Element("additional")
+    for tls_id in net.tls_ids:
+        lanes = np.unique(net.conn_from[net.controlled_connections(tls_id)])
+        for lane in lanes.tolist():
+            lane_id = str(net.lane_ids[lane])
+            lane_length = float(net.lane_length[lane])
+            covered = min(length, lane_length)
+            ET.SubElement(root, "laneAreaDetector", {
+                "id": detector_id(lane_id),
+                "lane": lane_id,
+                "pos": f"{lane_length - covered:.2f}",
+                "length": f"{covered:.2f}",
+                "period": str(DETECTOR_PERIOD),
+                "file": "NUL",  # Values are read over TraCI; SUMO writes nothing
+                "friendlyPos": "true",
+            })
+    ET.indent(root)
+    # Written aside and renamed so a concurrent run never loads a partial file
+    fd, tmp = tempfile.mkstemp(dir=net.directory, suffix=".xml")
+    with os.fdopen(fd, "wb") as f:
+        ET.ElementTree(root).write(f, encoding="UTF-8", xml_declaration=True)
+    os.replace(tmp, path)
+    return path
+
+
+def with_additional_file(sumo_args: List[str], config_file: str, path: str) -> List[str]:
+    """SUMO options that load `path` on top of the additional files already configured.
+
+    An --additional-files option replaces the configuration's value rather than adding to
+    it, so the configured files (and any already on the command line) are carried over.
+    """
+    args = list(sumo_args)
+    if "--additional-files" in args:
+        i = args.index("--additional-files") + 1
+        args[i] = f"{args[i]},{path}"
+        return args
+    files = []
+    configured = ET.parse(config_file).getroot().find('./input/additional-files')
+    if configured is not None:
+        base = os.path.dirname(os.path.abspath(config_file))
+        files = [os.path.join(base, name) for name in configured.get('value').split(",") if name.strip()]
+    return args + ["--additional-files", ",".join(files + [path])]
+
+
+class DetectorReader:
+    """Read the E2 detectors of one intersection into a preallocated tensor once per step.
+
+    Detector slots follow the LaneIndex lane slots. Every detector is subscribed to
+    DETECTOR_VARS, so a step costs one `traci.lanearea.getAllSubscriptionResults` call
+    however many detectors there are, and the agent only sees what the detectors see.
+    """
+
+    def __init__(self, lane_index: LaneIndex, length: float = DEFAULT_DETECTOR_LENGTH):
+        self.index = lane_index
+        self.length = length
+        self.detector_ids: List[str] = [detector_id(lane_id) for lane_id in lane_index.lane_ids]
+        self.raw = np.zeros((len(self.detector_ids), len(DETECTOR_FEATURES)), dtype=np.float32)
+        self.approach_totals = np.zeros((len(DIRECTIONS), len(DETECTOR_FEATURES)), dtype=np.float32)
+        self._lanes_per_approach = np.maximum(1, np.bincount(lane_index.approach, minlength=len(DIRECTIONS)))
+        self._values = itemgetter(*DETECTOR_VARS)
+        self._missing = dict.fromkeys(DETECTOR_VARS, 0.0)
+
+    def subscribe(self):
+        for det_id in self.detector_ids:
+            traci.lanearea.subscribe(det_id, DETECTOR_VARS)
+
+    def read(self) -> np.ndarray:
+        """Fill and return the raw (detectors x features) tensor from this step's subscriptions"""
+        results = traci.lanearea.getAllSubscriptionResults()
+        if self.detector_ids:
+            self.raw[:] = list(map(self._values, (results.get(det_id) or self._missing
+                                                   for det_id in self.detector_ids)))
+        return self.raw
+
+    def approach_features(self) -> np.ndarray:
+        """Last read reduced per approach (directions x features).
+
+        Counts and halting vehicles are summed over the approach's lanes, jam length is
+        the longest lane's and occupancy is the lane mean.
+        """
+        totals = self.approach_totals
+        totals.fill(0.0)
+        np.add.at(totals, self.index.approach, self.raw)
+        jam = DETECTOR_FEATURES.index('jam_length')
+        totals[:, jam] = 0.0
+        np.maximum.at(totals[:, jam], self.index.approach, self.raw[:, jam])
+        totals[:, DETECTOR_FEATURES.index('occupancy')] /= self._lanes_per_approach
+        return totals
+
+    def state_features(self) -> np.ndarray:
+        """Jam length (share of the detector length) then occupancy (share of 1) per approach, from the last reduction"""
+        jam = self.approach_totals[:, DETECTOR_FEATURES.index('jam_length')] / self.length
+        occupancy = self.approach_totals[:, DETECTOR_FEATURES.index('occupancy')] / 100.0
+        return np.concatenate([np.minimum(jam, 1.0), occupancy])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate E2 lane-area detectors for every signalised approach")
+    parser.add_argument("net", help=".net.xml(.gz) file, or a .sumo.cfg referencing it")
+    parser.add_argument("--length", type=float, default=DEFAULT_DETECTOR_LENGTH,
+                        help="Metres upstream of the stop line each detector covers")
+    args = parser.parse_args()
+
+    net_file = net_file_from_config(args.net) if args.net.endswith(".sumo.cfg") else args.net
+    path = generate_detectors(net_file, args.length)
+    count = len(ET.parse(path).getroot().findall("laneAreaDetector"))
+    print(f"{count} detectors in {path}", file=sys.stderr)
+    print(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import multiprocessing
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from sumo_output_parser import RunSummaryIndex, DEFAULT_INDEX_DIR, summarize_run
+
+SUMO_CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sumo_configs")
+DEFAULT_CONFIG = os.path.join(SUMO_CONFIG_DIR, "intersection.sumo.cfg")
+DEFAULT_ROUTES = os.path.join(SUMO_CONFIG_DIR, "traffic.rou.xml")
+CONTROLLERS = ("fixed_time", "actuated", "rl")
+
+
+class FixedTimeController:
+    """Leave the signal on its static program (SUMO's tlLogic, or the 30s/5s fallback cycle).
+
+    With `green` given, a cycle of that green time (and `yellow`) is uploaded to SUMO
+    once instead; SUMO then runs it with no per-step TraCI commands.
+    """
+
+    def __init__(self, green: Optional[float] = None, yellow: Optional[float] = None):
+        self.green = green
+        self.yellow = yellow
+
+    def prepare(self, sim):
+        if self.green is None:
+            return
+        sim.phase_duration['green'] = self.green
+        if self.yellow is not None:
+            sim.phase_duration['yellow'] = self.yellow
+        sim.phase_time_remaining = sim.phase_duration['green']
+        sim.upload_timing_plan(self.green, self.green, sim.phase_duration['yellow'])
+
+    def act(self, state: np.ndarray, sim) -> Optional[int]:
+        return None
+
+
+class ActuatedController:
+    """Queue-actuated control: hold green while the served approaches have queued
+    vehicles, switch once they clear (after a minimum green) or at the maximum green."""
+
+    def __init__(self, min_green: int = 10, max_green: int = 60, extend_threshold: int = 1):
+        self.min_green = min_green
+        self.max_green = max_green
+        self.extend_threshold = extend_threshold
+        self.green_elapsed = 0
+        self.last_phase = None
+
+    def act(self, state: np.ndarray, sim) -> Optional[int]:
+        phase = sim.current_phase
+        if phase != self.last_phase:
+            self.green_elapsed = 0
+            self.last_phase = phase
+        if phase not in ("NS_GREEN", "EW_GREEN"):
+            return None
+        self.green_elapsed += 1
+
+        ns_queue = state[0] + state[1]
+        ew_queue = state[2] + state[3]
+        served, opposing = (ns_queue, ew_queue) if phase == "NS_GREEN" else (ew_queue, ns_queue)
+        if self.green_elapsed >= self.max_green or (
+                self.green_elapsed >= self.min_green and served < self.extend_threshold and opposing > 0):
+            return 3 if phase == "NS_GREEN" else 2  # SWITCH_EW / SWITCH_NS
+        if served >= self.extend_threshold and sim.phase_time_remaining <= 1:
+            return 0 if phase == "NS_GREEN" else 1  # EXTEND_NS / EXTEND_EW
+        return None
+
+
+class RLController:
+    """Act with the DQN agent: greedily from a saved model, or learning online as in the live run"""
+
+    def __init__(self, model_path: Optional[str] = None):
+        self.model_path = model_path
+        self.last_transition = None
+
+    def prepare(self, sim):
+        if self.model_path:
+            sim.agent.load_model(self.model_path)
+            sim.agent.epsilon = 0.0
+
+    def act(self, state: np.ndarray, sim) -> Optional[int]:
+        action = int(sim.agent.act(state))
+        if not self.model_path:
+            # Learn from the previous decision now that its successor state is known
+            if self.last_transition is not None:
+                prev_state, prev_action = self.last_transition
+                reward = sim.calculate_reward(prev_state, prev_action)
+                sim.agent.remember(prev_state, prev_action, reward, state, False)
+                if len(sim.agent.memory) > sim.agent.batch_size:
+                    sim.agent.replay()
+            self.last_transition = (state, action)
+        return action
+
+
+def build_controller(name: str, model_path: Optional[str] = None, fixed_green: Optional[float] = None,
+                     fixed_yellow: Optional[float] = None):
+    if name == "fixed_time":
+        return FixedTimeController(fixed_green, fixed_yellow)
+    if name == "actuated":
+        return ActuatedController()
+    if name == "rl":
+        return RLController(model_path)
+    raise ValueError(f"Unknown controller: {name}")
+
+
+def write_seeded_routes(route_file: str, seed: int, output_dir: str, demand_scale: float = 1.0) -> str:
+    """Write a variant of `route_file` whose flows insert vehicles randomly.
+
+    `vehsPerHour` flows are deterministic in SUMO, so they are rewritten as per-second
+    insertion probabilities; combined with `--seed`, every controller evaluated on the
+    same seed then sees exactly the same stochastic demand.
+    """
+    tree = ET.parse(route_file)
+    for flow in tree.getroot().iter("flow"):
+        vehs_per_hour = flow.get("vehsPerHour")
+        if vehs_per_hour is None:
+            continue
+        del flow.attrib["vehsPerHour"]
+        flow.set("probability", f"{min(1.0, float(vehs_per_hour) * demand_scale / 3600.0):.6f}")
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"traffic.seed{seed}.rou.xml")
+    tree.write(path, encoding="UTF-8", xml_declaration=True)
+    return path
+
+
+def run_evaluation(job: Dict) -> Dict:
+    """Run one controller on one seed in this process and return its KPIs"""
+    # Imported here so the parent process never loads TensorFlow
+    from traffic_simulation import TrafficSimulation
+
+    random.seed(job["seed"])
+    np.random.seed(job["seed"])
+    run_dir = job["run_dir"]
+    os.makedirs(run_dir, exist_ok=True)
+    summary_path = os.path.join(run_dir, "summary.xml")
+    tripinfo_path = os.path.join(run_dir, "tripinfo.xml")
+
+    sim = TrafficSimulation(job["config"], gui=False, sumo_args=[
+        "--route-files", job["route_file"],
+        "--seed", str(job["seed"]),
+        "--summary-output", summary_path,
+        "--tripinfo-output", tripinfo_path,
+    ])
+    controller = build_controller(job["controller"], job.get("model_path"), job.get("fixed_green"),
+                                  job.get("fixed_yellow"))
+    started = time.time()
+    intervals = []
+    try:
+        if job.get("no_sumo"):
+            sim.start_meso()  # Seeded cell-transmission model rather than the random-walk fallback
+        else:
+            sim.start_sumo()
+        if hasattr(controller, "prepare"):
+            controller.prepare(sim)
+        if sim.sumo_available:
+            simulator = "sumo"
+        elif sim.meso is not None:
+            simulator = "meso"
+        else:
+            simulator = "random"
+        for step in range(job["steps"]):
+            performance = sim.run_controller_step(controller)
+            if (step + 1) % job["interval"] == 0:
+                intervals.append({"begin": step + 1 - job["interval"], "end": step + 1, **performance})
+    finally:
+        sim.cleanup()
+
+    engine_summary = sim.metrics.run_summary()
+    if simulator == "sumo" and os.path.exists(tripinfo_path):
+        kpis = summarize_run(summary_path, tripinfo_path, job["interval"])
+    else:
+        window_seconds = max(1, job["steps"])
+        kpis = {
+            "interval": job["interval"],
+            "intervals": intervals,
+            "totals": {
+                "meanWaitingTime": engine_summary["delayPerVehicle"],
+                "meanTimeLoss": engine_summary["delayPerVehicle"],
+                "arrivalsPerHour": engine_summary["arrived"] * 3600.0 / window_seconds,
+                "teleports": 0,
+                "trips": engine_summary["arrived"],
+                "duration": job["steps"],
+            },
+        }
+    return {
+        "runId": job["run_id"],
+        "controller": job["controller"],
+        "seed": job["seed"],
+        "simulator": simulator,
+        "greedy": job["controller"] != "rl" or bool(job.get("model_path")),
+        "kpis": kpis,
+        "maxQueue": engine_summary["peakQueue"],
+        "efficiencyScore": sim.metrics.snapshot()["efficiencyScore"],
+        "wallTime": time.time() - started,
+    }
+
+
+def plan_jobs(controllers: List[str], seeds: List[int], steps: int, output_dir: str,
+              route_file: str = DEFAULT_ROUTES, config: str = DEFAULT_CONFIG, interval: int = 300,
+              demand_scale: float = 1.0, model_path: Optional[str] = None, no_sumo: bool = False,
+              fixed_green: Optional[float] = None, fixed_yellow: Optional[float] = None) -> List[Dict]:
+    """One job per (controller, seed); all controllers share each seed's route variant"""
+    sweep_id = time.strftime("%Y%m%d-%H%M%S")
+    jobs = []
+    for seed in seeds:
+        routes = write_seeded_routes(route_file, seed, os.path.join(output_dir, "routes"), demand_scale)
+        for controller in controllers:
+            run_id = f"{sweep_id}-{controller}-s{seed}"
+            jobs.append({
+                "run_id": run_id,
+                "controller": controller,
+                "seed": seed,
+                "steps": steps,
+                "interval": interval,
+                "config": config,
+                "route_file": routes,
+                "run_dir": os.path.join(output_dir, run_id),
+                "model_path": model_path,
+                "no_sumo": no_sumo,
+                "fixed_green": fixed_green,
+                "fixed_yellow": fixed_yellow,
+            })
+    return jobs
+
+
+def run_sweep(jobs: List[Dict], workers: Optional[int] = None,
+              index: Optional[RunSummaryIndex] = None) -> List[Dict]:
+    """Execute jobs across a process pool, storing each result in the run index as it lands"""
+    results = []
+    # spawn keeps TensorFlow and TraCI state out of forked children
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=context) as pool:
+        futures = {pool.submit(run_evaluation, job): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Evaluation {job['run_id']} failed: {e}", file=sys.stderr)
+                continue
+            if index is not None:
+                index.add_run(result["runId"], result["kpis"], label=result["controller"],
+                              seed=result["seed"], simulator=result["simulator"], greedy=result["greedy"],
+                              maxQueue=result["maxQueue"], efficiencyScore=result["efficiencyScore"])
+            totals = result["kpis"]["totals"]
+            print(f"{result['runId']}: wait={totals['meanWaitingTime']:.1f}s "
+                  f"arrivals/h={totals['arrivalsPerHour']:.0f} ({result['simulator']}, {result['wallTime']:.1f}s)",
+                  file=sys.stderr)
+            results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate fixed-time, actuated and RL control on seeded demand")
+    parser.add_argument("--controllers", nargs="+", default=list(CONTROLLERS), choices=CONTROLLERS)
+    parser.add_argument("--seeds", type=int, default=20, help="Number of demand seeds")
+    parser.add_argument("--first-seed", type=int, default=0)
+    parser.add_argument("--steps", type=int, default=3600, help="Simulated seconds per run")
+    parser.add_argument("--interval", type=int, default=300, help="KPI interval length in seconds")
+    parser.add_argument("--demand-scale", type=float, default=1.0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--model", help="Saved DQN model for greedy RL evaluation")
+    parser.add_argument("--fixed-green", type=float,
+                        help="Green seconds of a fixed-time plan uploaded to SUMO (default: the net's own program)")
+    parser.add_argument("--fixed-yellow", type=float, help="Yellow seconds of the uploaded fixed-time plan")
+    parser.add_argument("--routes", default=DEFAULT_ROUTES)
+    parser.add_argument("--no-sumo", action="store_true", help="Use the mesoscopic model even if SUMO is installed "
+                             "(not yet calibrated against SUMO; see meso_model.py --run-sumo)")
+    parser.add_argument("--output-dir", default=os.path.join(SUMO_CONFIG_DIR, "evaluations"))
+    parser.add_argument("--index-dir", default=DEFAULT_INDEX_DIR)
+    args = parser.parse_args()
+
+    if "rl" in args.controllers and not args.model:
+        # The agent starts at epsilon 1.0, so without a saved model it mostly explores
+        print("Warning: no --model given; the RL controller learns online from a random policy "
+              "and its runs are recorded with greedy=false", file=sys.stderr)
+
+    seeds = list(range(args.first_seed, args.first_seed + args.seeds))
+    jobs = plan_jobs(args.controllers, seeds, args.steps, args.output_dir, route_file=args.routes,
+                     interval=args.interval, demand_scale=args.demand_scale,
+                     model_path=args.model, no_sumo=args.no_sumo, fixed_green=args.fixed_green,
+                     fixed_yellow=args.fixed_yellow)
+    index = RunSummaryIndex(args.index_dir)
+    results = run_sweep(jobs, workers=args.workers, index=index)
+    print(json.dumps({label: group for label, group in index.aggregate().items()
+                      if label in args.controllers}, indent=2))
+    if len(results) < len(jobs):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import io
+import csv
+import json
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+# Target size of each chunk handed to the HTTP response
+CHUNK_BYTES = 64 * 1024
+TRANSITION_CHUNK_ROWS = 4096
+
+
+def _json_default(obj: Any):
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return float(obj)
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    return str(obj)
+
+
+def _flatten(record: Dict, prefix: str = "") -> Dict:
+    """Flatten nested dicts into dotted column names for CSV"""
+    flat = {}
+    for key, value in record.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}."))
+        elif isinstance(value, (list, tuple)):
+            flat[name] = json.dumps(value, default=_json_default)
+        elif isinstance(value, datetime):
+            flat[name] = value.isoformat()
+        else:
+            flat[name] = value
+    return flat
+
+
+def _chunked(pieces: Iterable[bytes]) -> Iterator[bytes]:
+    """Coalesce small byte strings into ~CHUNK_BYTES chunks"""
+    buffer = bytearray()
+    for piece in pieces:
+        buffer += piece
+        if len(buffer) >= CHUNK_BYTES:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def gzip_stream(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Gzip-compress a byte stream incrementally"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip header
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def ndjson_stream(records: Iterable[Dict]) -> Iterator[bytes]:
+    """One JSON object per line"""
+    return _chunked(json.dumps(r, default=_json_default).encode("utf-8") + b"\n" for r in records)
+
+
+def csv_stream(records: Iterable[Dict], columns: Optional[List[str]] = None) -> Iterator[bytes]:
+    """CSV with dotted column names; columns default to those of the first record"""
+    def rows() -> Iterator[bytes]:
+        buffer = io.StringIO()
+        writer = None
+        for record in records:
+            flat = _flatten(record)
+            if writer is None:
+                writer = csv.DictWriter(buffer, fieldnames=columns or list(flat), extrasaction="ignore")
+                writer.writeheader()
+            writer.writerow(flat)
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    return _chunked(rows())
+
+
+def transition_dtype(state_size: int) -> np.dtype:
+    return np.dtype([
+        ("state", "<f4", (state_size,)),
+        ("action", "i1"),
+        ("reward", "<f4"),
+        ("next_state", "<f4", (state_size,)),
+        ("simulation_time", "<u4"),
+    ])
+
+
+def npy_chunk_stream(transitions: Iterable[Dict], chunk_rows: int = TRANSITION_CHUNK_ROWS) -> Iterator[bytes]:
+    """Transitions as a sequence of concatenated .npy arrays of up to `chunk_rows` rows.
+
+    Read back with repeated `np.load(f)` calls on the same file object until EOF.
+    """
+    chunk = None
+    fill = 0
+    for t in transitions:
+        if chunk is None:
+            chunk = np.zeros(chunk_rows, dtype=transition_dtype(len(t["state"])))
+        row = chunk[fill]
+        row["state"] = t["state"]
+        row["action"] = t["action"]
+        row["reward"] = t["reward"]
+        row["next_state"] = t["nextState"]
+        row["simulation_time"] = t.get("simulationTime", 0)
+        fill += 1
+        if fill == chunk_rows:
+            yield _npy_bytes(chunk)
+            fill = 0
+    if chunk is not None and fill:
+        yield _npy_bytes(chunk[:fill])
+
+
+def _npy_bytes(array: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    np.save(buffer, array, allow_pickle=False)
+    return buffer.getvalue()
+
+
+def read_npy_chunks(path: str) -> Iterator[np.ndarray]:
+    """Iterate over the chunks of a transition export"""
+    with open(path, "rb") as f:
+        while f.peek(1):
+            yield np.load(f, allow_pickle=False)
+
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "npy": "application/octet-stream",
+}
+
+
+def export_stream(records: Iterable[Dict], fmt: str, compress: bool = False) -> Iterator[bytes]:
+    """Byte stream for `records` in the requested format"""
+    if fmt == "ndjson":
+        stream = ndjson_stream(records)
+    elif fmt == "csv":
+        stream = csv_stream(records)
+    elif fmt == "npy":
+        stream = npy_chunk_stream(records)
+    else:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    return gzip_stream(stream) if compress else stream
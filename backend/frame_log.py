@@ -0,0 +1,177 @@
+import os
+import re
+import mmap
+import struct
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+FRAME_LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings")
+MAGIC = b"TSFRAME1"
+LENGTH = struct.Struct("<I")
+INDEX_DTYPE = np.dtype([("time", "<f8"), ("offset", "<u8")])
+RUN_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+MIN_PLAYBACK_SPEED = 1.0
+MAX_PLAYBACK_SPEED = 100.0
+
+
+def log_paths(directory: str, run_id: str):
+    if not RUN_ID_PATTERN.match(run_id):
+        raise ValueError(f"Invalid run id: {run_id}")
+    base = os.path.join(directory, run_id)
+    return base + ".frames", base + ".idx"
+
+
+class FrameLogWriter:
+    """Append-only log of serialized frames with a (simulation time, byte offset) index.
+
+    `<run>.frames` holds the magic followed by length-prefixed frame bodies exactly as
+    they were streamed, so replay never re-serializes. `<run>.idx` is a flat array of
+    INDEX_DTYPE rows. Data is flushed before its index row, so a reader never sees an
+    index entry whose frame is incomplete. Times are clamped to be non-decreasing,
+    which keeps the index binary-searchable.
+    """
+
+    def __init__(self, run_id: str, directory: str = FRAME_LOG_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.run_id = run_id
+        self.data_path, self.index_path = log_paths(directory, run_id)
+        # Exclusive create: a name collision must fail rather than truncate another run's recording
+        self._data = open(self.data_path, "xb")
+        self._index = open(self.index_path, "xb")
+        self._data.write(MAGIC)
+        self.offset = len(MAGIC)
+        self.last_time = float("-inf")
+        self.frames = 0
+
+    def append(self, sim_time: float, body: bytes):
+        sim_time = max(float(sim_time), self.last_time)
+        self._data.write(LENGTH.pack(len(body)))
+        self._data.write(body)
+        self._data.flush()
+        self._index.write(np.array([(sim_time, self.offset)], dtype=INDEX_DTYPE).tobytes())
+        self._index.flush()
+        self.offset += LENGTH.size + len(body)
+        self.last_time = sim_time
+        self.frames += 1
+
+    def close(self):
+        self._data.close()
+        self._index.close()
+
+
+class FrameLogReader:
+    """Random access to a frame log through memory maps.
+
+    Both files are mapped read-only, so every viewer of a run shares the same page
+    cache and reading a frame copies only that frame's bytes. `seek` is a binary
+    search over the time column.
+    """
+
+    def __init__(self, run_id: str, directory: str = FRAME_LOG_DIR):
+        self.run_id = run_id
+        self.data_path, self.index_path = log_paths(directory, run_id)
+        # Index size first, data second: the writer flushes a frame before its index row, so
+        # every row counted here points inside the data mapped below even while recording
+        self.index_size = os.path.getsize(self.index_path)
+        with open(self.data_path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{self.data_path} is not a frame log")
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # Ignore a trailing partial row if the writer was interrupted mid-append
+        rows = self.index_size // INDEX_DTYPE.itemsize
+        self.index = (np.memmap(self.index_path, dtype=INDEX_DTYPE, mode="r", shape=(rows,))
+                      if rows else np.zeros(0, dtype=INDEX_DTYPE))
+        self.times = self.index["time"]
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def seek(self, sim_time: float) -> int:
+        """Position of the first frame at or after `sim_time`"""
+        return int(np.searchsorted(self.times, sim_time, side="left"))
+
+    def frame(self, position: int) -> bytes:
+        offset = int(self.index["offset"][position])
+        (length,) = LENGTH.unpack_from(self._data, offset)
+        start = offset + LENGTH.size
+        return self._data[start:start + length]
+
+    def time_at(self, position: int) -> float:
+        return float(self.times[position])
+
+    def describe(self) -> Dict:
+        return {
+            "runId": self.run_id,
+            "frames": len(self),
+            "startTime": self.time_at(0) if len(self) else None,
+            "endTime": self.time_at(len(self) - 1) if len(self) else None,
+            "bytes": len(self._data),
+        }
+
+    def close(self):
+        self._data.close()
+
+
+class FrameLogRegistry:
+    """Share one reader per run between all viewers, reopening it when the log has grown"""
+
+    def __init__(self, directory: str = FRAME_LOG_DIR):
+        self.directory = directory
+        self._readers: Dict[str, FrameLogReader] = {}
+        self._lock = threading.Lock()
+
+    def open(self, run_id: str) -> FrameLogReader:
+        _, index_path = log_paths(self.directory, run_id)
+        size = os.path.getsize(index_path)  # Raises FileNotFoundError for unknown runs
+        with self._lock:
+            reader = self._readers.get(run_id)
+            if reader is None or reader.index_size != size:
+                # Replaced readers are left to the garbage collector; viewers may still hold them
+                reader = FrameLogReader(run_id, self.directory)
+                self._readers[run_id] = reader
+            return reader
+
+    def runs(self) -> List[Dict]:
+        if not os.path.isdir(self.directory):
+            return []
+        run_ids = sorted(name[:-len(".idx")] for name in os.listdir(self.directory) if name.endswith(".idx"))
+        entries = []
+        for run_id in run_ids:
+            try:
+                entries.append(self.open(run_id).describe())
+            except (OSError, ValueError):
+                continue
+        return entries
+
+
+class PlaybackCursor:
+    """Position, speed and pause state of one viewer replaying a frame log"""
+
+    def __init__(self, reader: FrameLogReader, speed: float = 1.0, start: Optional[float] = None):
+        self.reader = reader
+        self.speed = 1.0
+        self.set_speed(speed)
+        self.position = reader.seek(start) if start is not None else 0
+        self.paused = False
+
+    def set_speed(self, speed: float):
+        self.speed = min(MAX_PLAYBACK_SPEED, max(MIN_PLAYBACK_SPEED, float(speed)))
+
+    def seek(self, sim_time: float):
+        self.position = self.reader.seek(sim_time)
+
+    @property
+    def finished(self) -> bool:
+        return self.position >= len(self.reader)
+
+    def advance(self) -> Tuple[bytes, Optional[float]]:
+        """Current frame, plus the wall-clock delay before the next one (None at the end)"""
+        position = self.position
+        frame = self.reader.frame(position)
+        self.position += 1
+        if self.finished:
+            return frame, None
+        gap = self.reader.time_at(self.position) - self.reader.time_at(position)
+        return frame, gap / self.speed
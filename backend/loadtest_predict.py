@@ -0,0 +1,205 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+from typing import Dict, List
+
+import numpy as np
+import websockets
+
+from policy import PolicySnapshot
+from loadtest_ws import AppTarget, CONNECT_CONCURRENCY, raise_fd_limit, _percentiles
+
+# Layer sizes of DQNAgent._build_model for the 5-value state and 4 actions
+LAYER_SIZES = (5, 64, 64, 32, 4)
+
+
+def synthetic_policy(seed: int = 0) -> PolicySnapshot:
+    rng = np.random.default_rng(seed)
+    weights = []
+    for fan_in, fan_out in zip(LAYER_SIZES, LAYER_SIZES[1:]):
+        weights += [rng.normal(0, 1 / np.sqrt(fan_in), (fan_in, fan_out)), np.zeros(fan_out)]
+    return PolicySnapshot(weights, version=1)
+
+
+async def _ws_caller(url: str, states: np.ndarray, go: asyncio.Event, stop_at: List[float],
+                     latencies: List[float], errors: List[int], ready: List[int], semaphore: asyncio.Semaphore):
+    async with semaphore:
+        ws = await websockets.connect(url, open_timeout=60, ping_interval=None, close_timeout=1)
+    ready[0] += 1
+    await go.wait()
+    i = 0
+    try:
+        while time.perf_counter() < stop_at[0]:
+            started = time.perf_counter()
+            await ws.send(json.dumps({"id": i, "state": states[i % len(states)].tolist()}))
+            reply = json.loads(await ws.recv())
+            if "error" in reply:
+                errors[0] += 1
+            else:
+                latencies.append(time.perf_counter() - started)
+            i += 1
+    finally:
+        await ws.close()
+
+
+async def _http_post(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, host: str, body: bytes) -> int:
+    """One keep-alive HTTP/1.1 POST to the predict endpoint; returns the status code"""
+    writer.write(b"POST /api/agent/predict HTTP/1.1\r\nHost: " + host.encode() +
+                 b"\r\nContent-Type: application/json\r\nContent-Length: " + str(len(body)).encode() +
+                 b"\r\n\r\n" + body)
+    head = await reader.readuntil(b"\r\n\r\n")
+    length = 0
+    for line in head.split(b"\r\n")[1:]:
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":", 1)[1])
+    await reader.readexactly(length)
+    return int(head.split(b" ", 2)[1])
+
+
+async def _http_caller(host: str, port: int, states: np.ndarray, go: asyncio.Event, stop_at: List[float],
+                       latencies: List[float], errors: List[int], ready: List[int], semaphore: asyncio.Semaphore):
+    # A minimal client on raw streams; general-purpose HTTP clients cost more CPU than the server under test
+    async with semaphore:
+        reader, writer = await asyncio.open_connection(host, port)
+    ready[0] += 1
+    await go.wait()
+    i = 0
+    try:
+        while time.perf_counter() < stop_at[0]:
+            started = time.perf_counter()
+            body = json.dumps({"state": states[i % len(states)].tolist()}).encode()
+            status = await _http_post(reader, writer, host, body)
+            if status == 200:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors[0] += 1
+            i += 1
+    finally:
+        writer.close()
+
+
+async def _run_callers(host: str, port: int, transport: str, callers: int, duration: float, ready_queue,
+                       go_event) -> Dict:
+    states = np.random.default_rng(os.getpid()).uniform(0, 20, (256, LAYER_SIZES[0])).round(1)
+    go = asyncio.Event()
+    stop_at = [0.0]
+    latencies: List[float] = []
+    errors, ready = [0], [0]
+    semaphore = asyncio.Semaphore(CONNECT_CONCURRENCY)
+    if transport == "ws":
+        url = f"ws://{host}:{port}/ws/agent/predict"
+        tasks = [asyncio.create_task(_ws_caller(url, states, go, stop_at, latencies, errors, ready, semaphore))
+                 for _ in range(callers)]
+    else:
+        tasks = [asyncio.create_task(_http_caller(host, port, states, go, stop_at, latencies, errors, ready,
+                                                  semaphore))
+                 for _ in range(callers)]
+    while ready[0] < callers:
+        await asyncio.sleep(0.05)
+    ready_queue.put(callers)
+    await asyncio.to_thread(go_event.wait)
+    stop_at[0] = time.perf_counter() + duration
+    go.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return {"latencies": np.asarray(latencies, dtype=np.float32), "errors": errors[0]}
+
+
+def caller_process(host: str, port: int, transport: str, callers: int, duration: float, ready_queue, go_event,
+                   results):
+    """Client worker: hold `callers` closed-loop callers, each sending its next request when the last returns"""
+    raise_fd_limit()
+    results.put(asyncio.run(_run_callers(host, port, transport, callers, duration, ready_queue, go_event)))
+
+
+async def run_level(target: AppTarget, host: str, port: int, transport: str, callers: int, duration: float,
+                    processes: int) -> Dict:
+    batcher = target.app_module.policy_batcher
+    ctx = multiprocessing.get_context("spawn")
+    ready_queue, results, go_event = ctx.Queue(), ctx.Queue(), ctx.Event()
+    processes = max(1, min(processes, callers))
+    workers = []
+    for i in range(processes):
+        share = callers // processes + (i < callers % processes)
+        worker = ctx.Process(target=caller_process, daemon=True,
+                             args=(host, port, transport, share, duration, ready_queue, go_event, results))
+        worker.start()
+        workers.append(worker)
+    for _ in workers:
+        await asyncio.to_thread(ready_queue.get)
+
+    batches, requests = batcher.batches, batcher.requests
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    go_event.set()
+    parts = [await asyncio.to_thread(results.get) for _ in workers]
+    cpu_seconds, wall_seconds = time.process_time() - cpu_start, time.perf_counter() - wall_start
+    for worker in workers:
+        worker.join()
+
+    latencies = np.concatenate([p["latencies"] for p in parts])
+    batches, requests = batcher.batches - batches, batcher.requests - requests
+    return {
+        "callers": callers,
+        "requests": int(len(latencies)),
+        "errors": sum(p["errors"] for p in parts),
+        "throughputPerSecond": len(latencies) / duration,
+        "latencyMs": _percentiles(latencies * 1000),
+        "batches": batches,
+        "meanRequestsPerBatch": requests / batches if batches else None,
+        "serverCpuPercent": 100.0 * cpu_seconds / wall_seconds,
+    }
+
+
+async def run_benchmark(levels: List[int], transport: str = "ws", duration: float = 10.0, max_wait_ms: float = 2.0,
+                        max_batch: int = 1024, processes: int = 1, host: str = "127.0.0.1", port: int = 8766) -> Dict:
+    raise_fd_limit()
+    target = AppTarget(host, port)
+    policy_dir = tempfile.mkdtemp(prefix="policies-")
+    synthetic_policy().save(os.path.join(policy_dir, "current.npz"))
+    target.app_module.policy_registry.directory = policy_dir
+    target.app_module.policy_batcher.max_wait = max_wait_ms / 1000.0
+    target.app_module.policy_batcher.max_batch = max_batch
+    await target.start()
+
+    results = []
+    try:
+        for callers in levels:
+            print(f"{callers} concurrent {transport} callers for {duration}s", file=sys.stderr)
+            results.append(await run_level(target, host, port, transport, callers, duration, processes))
+    finally:
+        await target.stop()
+    return {
+        "config": {"transport": transport, "durationSeconds": duration, "maxWaitMs": max_wait_ms,
+                   "maxBatch": max_batch, "clientProcesses": processes, "cpus": os.cpu_count()},
+        "levels": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput and latency of /api/agent/predict under concurrent callers")
+    parser.add_argument("--callers", type=int, nargs="+", default=[1, 100, 1000])
+    parser.add_argument("--transport", choices=("ws", "http"), default="ws")
+    parser.add_argument("--duration", type=float, default=10.0, help="Measured seconds per concurrency level")
+    parser.add_argument("--max-wait-ms", type=float, default=2.0, help="Micro-batching window")
+    parser.add_argument("--max-batch", type=int, default=1024, help="1 disables batching")
+    parser.add_argument("--processes", type=int, default=1, help="Client processes")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_benchmark(args.callers, args.transport, args.duration, args.max_wait_ms,
+                                       args.max_batch, args.processes, args.host, args.port))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import multiprocessing
+from typing import Dict, List, Optional
+
+import numpy as np
+import websockets
+
+from websocket_manager import WebSocketManager, generate_mock_data
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+# Limit on simultaneous handshakes per client process so connection storms don't hit the accept backlog
+CONNECT_CONCURRENCY = 256
+# Finite ceiling for the raised descriptor limit
+MAX_OPEN_FILES = 1 << 20
+
+
+def rss_bytes() -> int:
+    """Resident set size of this process"""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+def raise_fd_limit():
+    """Each connection costs a file descriptor on both ends; lift the soft limit to the hard one (capped)"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    # The kernel rejects an infinite descriptor limit (it is capped by fs.nr_open)
+    target = MAX_OPEN_FILES if hard == resource.RLIM_INFINITY else min(hard, MAX_OPEN_FILES)
+    if soft != resource.RLIM_INFINITY and soft < target:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+
+
+class ClientStats:
+    """Per-class (fast/slow) counters collected in a client process"""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.connected = 0
+        self.connect_failures = 0
+        self.disconnects = 0
+        self.received = 0
+        self.gaps = 0
+
+    def to_dict(self) -> Dict:
+        return {
+            "latencies": np.asarray(self.latencies, dtype=np.float32),
+            "connected": self.connected,
+            "connectFailures": self.connect_failures,
+            "disconnects": self.disconnects,
+            "received": self.received,
+            "gaps": self.gaps,
+        }
+
+
+async def _client(url: str, stats: ClientStats, slow_delay: float, semaphore: asyncio.Semaphore):
+    try:
+        async with semaphore:
+            ws = await websockets.connect(url, max_size=None, open_timeout=60, ping_interval=None,
+                                          close_timeout=1)
+    except Exception:
+        stats.connect_failures += 1
+        return
+    stats.connected += 1
+    last_seq = None
+    try:
+        async for message in ws:
+            received_at = time.time()
+            frame = json.loads(message)
+            data = frame.get("data", frame)  # main.py wraps frames as {"type", "data", "isRunning"}
+            seq = data.get("seq") if isinstance(data, dict) else None
+            if seq is None:
+                continue  # initial_data and other control messages
+            stats.latencies.append(received_at - data["sentAt"])
+            stats.received += 1
+            if last_seq is not None and seq > last_seq + 1:
+                stats.gaps += seq - last_seq - 1
+            last_seq = seq
+            if slow_delay:
+                await asyncio.sleep(slow_delay)
+    except websockets.exceptions.ConnectionClosed:
+        stats.disconnects += 1
+    finally:
+        await ws.close()
+
+
+async def _run_clients(url: str, fast: int, slow: int, slow_delay: float, stop_event) -> Dict:
+    semaphore = asyncio.Semaphore(CONNECT_CONCURRENCY)
+    fast_stats, slow_stats = ClientStats(), ClientStats()
+    tasks = [asyncio.create_task(_client(url, fast_stats, 0.0, semaphore)) for _ in range(fast)]
+    tasks += [asyncio.create_task(_client(url, slow_stats, slow_delay, semaphore)) for _ in range(slow)]
+    await asyncio.to_thread(stop_event.wait)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return {"fast": fast_stats.to_dict(), "slow": slow_stats.to_dict()}
+
+
+def client_process(url: str, fast: int, slow: int, slow_delay: float, stop_event, results):
+    """Entry point of a client worker: hold `fast + slow` connections until `stop_event` is set"""
+    raise_fd_limit()
+    results.put(asyncio.run(_run_clients(url, fast, slow, slow_delay, stop_event)))
+
+
+class ManagerTarget:
+    """`WebSocketManager` served by the `websockets` library, as in websocket_manager.py"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.manager = WebSocketManager()
+        self.server = None
+        self.url = f"ws://{host}:{port}"
+
+    async def start(self):
+        async def handler(connection):
+            await self.manager.client_handler(connection, connection.request.path)
+        self.server = await websockets.serve(handler, self.host, self.port, max_size=None,
+                                             ping_interval=None, backlog=4096)
+
+    def connection_count(self) -> int:
+        return self.manager.get_connection_count()
+
+    async def broadcast(self, frame: Dict):
+        await self.manager.broadcast(frame)
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+class AppTarget:
+    """main.py's FastAPI `/ws` endpoint under uvicorn, fed through `broadcast_simulation_update`"""
+
+    def __init__(self, host: str, port: int):
+        import uvicorn
+        # main.py imports its siblings as `backend.*`
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        from backend import main as app_module
+
+        self.app_module = app_module
+        self.server = uvicorn.Server(uvicorn.Config(app_module.app, host=host, port=port, log_level="warning",
+                                                    backlog=4096, ws_ping_interval=None))
+        self.url = f"ws://{host}:{port}/ws"
+        self.task = None
+
+    async def start(self):
+        self.task = asyncio.create_task(self.server.serve())
+        while not self.server.started:
+            await asyncio.sleep(0.05)
+
+    def connection_count(self) -> int:
+        return len(self.app_module.active_websockets)
+
+    async def broadcast(self, frame: Dict):
+        await self.app_module.broadcast_simulation_update({"type": "simulation_update", "data": frame,
+                                                           "isRunning": True})
+
+    async def stop(self):
+        self.server.should_exit = True
+        await self.task
+
+
+async def produce(target, rate: float, duration: float) -> Dict:
+    """Broadcast mock frames at `rate` Hz for `duration` seconds, stamped with seq and send time.
+
+    A broadcast that takes longer than the frame interval delays the following frames
+    rather than dropping them, so `lagSeconds` shows how far the producer fell behind.
+    """
+    interval = 1.0 / rate
+    frames = int(duration * rate)
+    fanout = np.zeros(frames)
+    started = time.perf_counter()
+    for seq in range(frames):
+        delay = started + seq * interval - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        frame = generate_mock_data()
+        frame["seq"] = seq
+        frame["sentAt"] = time.time()
+        t0 = time.perf_counter()
+        await target.broadcast(frame)
+        fanout[seq] = time.perf_counter() - t0
+    elapsed = time.perf_counter() - started
+    return {
+        "frames": frames,
+        "elapsedSeconds": elapsed,
+        "lagSeconds": max(0.0, elapsed - duration),
+        "fanoutMs": _percentiles(fanout * 1000),
+    }
+
+
+def _percentiles(values: np.ndarray) -> Optional[Dict]:
+    if len(values) == 0:
+        return None
+    p50, p90, p99, p999 = np.percentile(values, [50, 90, 99, 99.9])
+    return {"p50": float(p50), "p90": float(p90), "p99": float(p99), "p99.9": float(p999),
+            "max": float(values.max()), "mean": float(values.mean())}
+
+
+def _summarize(parts: List[Dict], frames: int) -> Dict:
+    latencies = np.concatenate([p["latencies"] for p in parts]) if parts else np.empty(0)
+    connected = sum(p["connected"] for p in parts)
+    received = sum(p["received"] for p in parts)
+    expected = connected * frames
+    return {
+        "clients": connected,
+        "connectFailures": sum(p["connectFailures"] for p in parts),
+        "disconnects": sum(p["disconnects"] for p in parts),
+        "framesReceived": received,
+        "gaps": sum(p["gaps"] for p in parts),
+        # Frames sent while a client was connected that it never read, including backlog at shutdown
+        "dropRate": 1.0 - received / expected if expected else None,
+        "latencyMs": _percentiles(latencies * 1000),
+    }
+
+
+async def run_load_test(target_name: str = "manager", clients: int = 100, slow_fraction: float = 0.0,
+                        slow_delay: float = 0.5, rate: float = 10.0, duration: float = 30.0,
+                        processes: Optional[int] = None, host: str = "127.0.0.1", port: int = 8765,
+                        connect_timeout: float = 120.0, drain_seconds: float = 2.0) -> Dict:
+    raise_fd_limit()
+    target = ManagerTarget(host, port) if target_name == "manager" else AppTarget(host, port)
+    await target.start()
+    rss_idle = rss_bytes()
+
+    processes = processes or min(os.cpu_count() or 1, max(1, clients // 500))
+    slow_total = int(round(clients * slow_fraction))
+    ctx = multiprocessing.get_context("spawn")
+    stop_event = ctx.Event()
+    results = ctx.Queue()
+    workers = []
+    for i in range(processes):
+        # Spread fast and slow readers evenly over the client processes
+        share = clients // processes + (i < clients % processes)
+        slow = slow_total // processes + (i < slow_total % processes)
+        worker = ctx.Process(target=client_process, args=(target.url, share - slow, slow, slow_delay,
+                                                          stop_event, results), daemon=True)
+        worker.start()
+        workers.append(worker)
+
+    deadline = time.monotonic() + connect_timeout
+    while target.connection_count() < clients and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    connected = target.connection_count()
+    rss_connected = rss_bytes()
+    print(f"{connected}/{clients} clients connected; producing at {rate} Hz for {duration}s", file=sys.stderr)
+
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    producer = await produce(target, rate, duration)
+    cpu_seconds, wall_seconds = time.process_time() - cpu_start, time.perf_counter() - wall_start
+    await asyncio.sleep(drain_seconds)
+    rss_peak = rss_bytes()
+
+    stop_event.set()
+    parts = [await asyncio.to_thread(results.get) for _ in workers]
+    for worker in workers:
+        worker.join()
+    await target.stop()
+
+    fast = _summarize([p["fast"] for p in parts], producer["frames"])
+    slow = _summarize([p["slow"] for p in parts], producer["frames"])
+    everyone = _summarize([p[k] for p in parts for k in ("fast", "slow")], producer["frames"])
+    return {
+        "target": target_name,
+        "config": {"clients": clients, "slowClients": slow_total, "slowDelaySeconds": slow_delay,
+                   "rateHz": rate, "durationSeconds": duration, "clientProcesses": processes},
+        "producer": producer,
+        "server": {
+            "connectedAtStart": connected,
+            "cpuPercent": 100.0 * cpu_seconds / wall_seconds,
+            "rssIdleMb": rss_idle / 2**20,
+            "rssConnectedMb": rss_connected / 2**20,
+            "rssPeakMb": rss_peak / 2**20,
+            "bytesPerConnection": (rss_connected - rss_idle) / connected if connected else None,
+        },
+        "all": everyone,
+        "fast": fast,
+        "slow": slow,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Websocket fan-out load test with synthetic clients")
+    parser.add_argument("--target", choices=("manager", "app"), default="manager",
+                        help="manager: WebSocketManager on the websockets server; app: main.py /ws under uvicorn")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--slow-fraction", type=float, default=0.0, help="Share of clients that read slowly")
+    parser.add_argument("--slow-delay", type=float, default=0.5, help="Seconds a slow client sleeps per frame")
+    parser.add_argument("--rate", type=float, default=10.0, help="Frames per second broadcast by the producer")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--processes", type=int, help="Client processes (default: one per 500 clients)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    if not 1 <= args.clients <= 10000:
+        parser.error("--clients must be between 1 and 10000")
+    report = asyncio.run(run_load_test(args.target, args.clients, args.slow_fraction, args.slow_delay, args.rate,
+                                       args.duration, args.processes, args.host, args.port))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+import os
+import sys
+import json
+import time
+import argparse
+import shutil
+import tempfile
+import multiprocessing
+from multiprocessing.connection import wait
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import traci
+import traci.constants as tc
+
+from action_log import ACTION_NAMES
+from meso_model import MesoscopicModel
+from sumo_bridge import SignalCommander
+
+# Controller phase -> (next phase, duration key of the next phase)
+PHASE_SEQUENCE = {
+    'NS_GREEN': ('NS_YELLOW', 'yellow'),
+    'NS_YELLOW': ('EW_GREEN', 'green'),
+    'EW_GREEN': ('EW_YELLOW', 'yellow'),
+    'EW_YELLOW': ('NS_GREEN', 'green'),
+}
+# Longest green an EXTEND action can build up
+MAX_GREEN = 60
+# Most distinct phase plans the four actions lead to (extend, switch, leave the timer running)
+MAX_PLANS = 3
+# Controller phase -> phase index of the generated net's tlLogic
+PHASE_INDEX = {'NS_GREEN': 0, 'NS_YELLOW': 1, 'EW_GREEN': 2, 'EW_YELLOW': 3}
+
+
+def phase_after_action(phase: str, remaining: float, action: int, durations: Dict[str, float]) -> Tuple[str, float]:
+    """Controller phase and time remaining once `action` is applied"""
+    name = ACTION_NAMES[action]
+    if name == "EXTEND_NS" and phase == "NS_GREEN":
+        return phase, min(remaining + 10, MAX_GREEN)
+    if name == "EXTEND_EW" and phase == "EW_GREEN":
+        return phase, min(remaining + 10, MAX_GREEN)
+    if name == "SWITCH_NS" and phase == "EW_GREEN":
+        return "EW_YELLOW", durations['yellow']
+    if name == "SWITCH_EW" and phase == "NS_GREEN":
+        return "NS_YELLOW", durations['yellow']
+    return phase, remaining
+
+
+def advance_phase(phase: str, remaining: float, durations: Dict[str, float]) -> Tuple[str, float, bool]:
+    """One second of the phase timer; the flag is set when a cycle completes"""
+    remaining -= 1
+    if remaining > 0:
+        return phase, remaining, False
+    next_phase, key = PHASE_SEQUENCE[phase]
+    return next_phase, durations[key], next_phase == 'NS_GREEN'
+
+
+def phase_plan(phase: str, remaining: float, action: int, durations: Dict[str, float],
+               horizon: int) -> Tuple[int, ...]:
+    """Signal phase indices for the next `horizon` steps if `action` is taken now and no other after it"""
+    phase, remaining = phase_after_action(phase, remaining, action, durations)
+    plan = []
+    for _ in range(horizon):
+        phase, remaining, _ = advance_phase(phase, remaining, durations)
+        plan.append(PHASE_INDEX[phase])
+    return tuple(plan)
+
+
+def _worker_sumo_args(sumo_args: Sequence[str]) -> List[str]:
+    """The run's SUMO options minus its output files, which lookahead runs must not overwrite"""
+    args, i = [], 0
+    while i < len(sumo_args):
+        flag = sumo_args[i]
+        has_value = i + 1 < len(sumo_args) and not sumo_args[i + 1].startswith("--")
+        if not flag.endswith("-output"):
+            args += sumo_args[i:i + 1 + has_value]
+        i += 1 + has_value
+    return args
+
+
+def sumo_worker(conn, config_path: str, sumo_args: List[str], tls_id: str, lane_ids: List[str]):
+    """Lookahead worker: keep one SUMO warm and score phase plans from saved states.
+
+    Jobs are (seq, state_path, plan); the reply is (seq, cost) with cost the summed
+    halting vehicles plus vehicles waiting for insertion over the plan's steps, or None
+    if the rollout failed. The insertion backlog counts because a red approach whose
+    lanes are full stops adding halting vehicles while its demand keeps queueing.
+    """
+    try:
+        traci.start(["sumo", "--configuration-file", config_path, "--start", "--no-step-log", "--no-warnings"]
+                    + sumo_args)
+    except Exception as e:
+        conn.send(("error", str(e)))
+        return
+    conn.send(("ready", None))
+    signals = SignalCommander()
+    while True:
+        job = conn.recv()
+        if job is None:
+            break
+        seq, state_path, plan = job
+        try:
+            traci.simulation.loadState(state_path)
+            signals.invalidate()
+            for lane_id in lane_ids:
+                traci.lane.subscribe(lane_id, [tc.LAST_STEP_VEHICLE_HALTING_NUMBER])
+            traci.simulation.subscribe([tc.VAR_PENDING_VEHICLES])
+            cost = 0.0
+            for phase_index in plan:
+                signals.hold_phase(tls_id, phase_index)
+                signals.flush()
+                traci.simulationStep()
+                results = traci.lane.getAllSubscriptionResults()
+                cost += sum(values[tc.LAST_STEP_VEHICLE_HALTING_NUMBER] for values in results.values())
+                cost += len(traci.simulation.getSubscriptionResults().get(tc.VAR_PENDING_VEHICLES, ()))
+            conn.send((seq, cost))
+        except Exception as e:
+            print(f"Lookahead rollout failed: {e}", file=sys.stderr)
+            conn.send((seq, None))
+    traci.close()
+
+
+class SumoLookahead:
+    """Pool of warm SUMO workers scoring candidate plans in parallel from `saveState` files.
+
+    Each worker is a spawned process running its own SUMO on the same configuration;
+    SUMO is started once and reused, so a rollout costs a `loadState` plus the horizon's
+    steps. With fewer idle workers than plans, the plans are scored in rounds. A rollout
+    that misses its deadline is left to finish in the background; its late reply is
+    discarded before the worker is used again.
+    """
+
+    def __init__(self, config_path: str, sumo_args: Sequence[str], tls_id: str, lane_ids: List[str],
+                 workers: int = MAX_PLANS):
+        if workers < MAX_PLANS:
+            print(f"Lookahead with {workers} SUMO worker(s) scores its {MAX_PLANS} candidate plans in rounds",
+                  file=sys.stderr)
+        # Saved states are read back immediately; keep them in memory-backed storage when available
+        self.state_dir = tempfile.mkdtemp(prefix="lookahead-", dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+        ctx = multiprocessing.get_context("spawn")
+        self.conns = []
+        self.processes = []
+        for _ in range(workers):
+            parent, child = ctx.Pipe()
+            process = ctx.Process(target=sumo_worker, daemon=True,
+                                  args=(child, config_path, _worker_sumo_args(sumo_args), tls_id, list(lane_ids)))
+            process.start()
+            self.conns.append(parent)
+            self.processes.append(process)
+        self.ready = set()
+        self.dead = set()
+        self.busy: Dict[int, int] = {}  # worker -> seq of its outstanding job
+        self.seq = 0
+
+    def _drain(self, timeout: float = 0.0):
+        """Collect startup messages and stale replies without blocking past `timeout`"""
+        pending = [self.conns[w] for w in range(len(self.conns))
+                   if w not in self.dead and (w in self.busy or w not in self.ready)]
+        for conn in wait(pending, timeout) if pending else ():
+            worker = self.conns.index(conn)
+            try:
+                tag, payload = conn.recv()
+            except EOFError:
+                self.dead.add(worker)
+                self.busy.pop(worker, None)
+                continue
+            if tag == "ready":
+                self.ready.add(worker)
+            elif tag == "error":
+                print(f"Lookahead worker {worker} could not start SUMO: {payload}", file=sys.stderr)
+                self.dead.add(worker)
+            else:
+                self.busy.pop(worker, None)
+        self._remove_stale_states()
+
+    def _remove_stale_states(self):
+        in_use = set(self.busy.values())
+        for name in os.listdir(self.state_dir):
+            if int(name.split(".")[0]) not in in_use:
+                os.remove(os.path.join(self.state_dir, name))
+
+    def idle_workers(self) -> List[int]:
+        return [w for w in sorted(self.ready) if w not in self.busy and w not in self.dead]
+
+    def evaluate(self, plans: List[Tuple[int, ...]], deadline: float) -> Optional[List[float]]:
+        """Cost of every plan, or None if no worker is idle, a rollout failed or time ran out"""
+        self._drain()
+        free = self.idle_workers()
+        if not free:
+            return None
+        self.seq += 1
+        state_path = os.path.join(self.state_dir, f"{self.seq}.xml")
+        traci.simulation.saveState(state_path)
+
+        costs: List[Optional[float]] = [None] * len(plans)
+        queued = list(range(len(plans)))
+        waiting: Dict = {}  # conn -> (worker, plan position)
+        while queued or waiting:
+            while queued and free:
+                worker, position = free.pop(0), queued.pop(0)
+                self.conns[worker].send((self.seq, state_path, plans[position]))
+                self.busy[worker] = self.seq
+                waiting[self.conns[worker]] = (worker, position)
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return None
+            for conn in wait(list(waiting), remaining):
+                worker, position = waiting.pop(conn)
+                try:
+                    seq, cost = conn.recv()
+                except EOFError:
+                    self.dead.add(worker)
+                    self.busy.pop(worker, None)
+                    return None
+                self.busy.pop(worker, None)
+                if cost is None:
+                    return None
+                costs[position] = cost
+                free.append(worker)
+        self._remove_stale_states()
+        return costs
+
+    def close(self):
+        for worker, conn in enumerate(self.conns):
+            if worker not in self.dead:
+                try:
+                    conn.send(None)
+                except (OSError, BrokenPipeError):
+                    pass
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.kill()
+        shutil.rmtree(self.state_dir, ignore_errors=True)
+
+
+class MesoLookahead:
+    """Score candidate plans on the mesoscopic model, one replica per candidate.
+
+    The live model's state is copied into every replica of a second model, and all
+    candidates advance together in one vectorised pass, so K plans cost about as much
+    as one. The deadline is checked between steps. Cost per step is the halting
+    vehicles in the lanes plus the insertion backlog, so holding a full approach at red
+    is not free once its lanes stop absorbing arrivals.
+    """
+
+    def __init__(self, model: MesoscopicModel, candidates: int = MAX_PLANS):
+        self.model = model
+        # Always room for every distinct plan; replicas are cheap
+        self.shadow = MesoscopicModel(model.net_file, model.route_files, step_length=model.dt,
+                                      approach_edges=model.approach_edges, replicas=max(candidates, MAX_PLANS))
+
+    def evaluate(self, plans: List[Tuple[int, ...]], deadline: float) -> Optional[List[float]]:
+        shadow = self.shadow
+        if len(plans) > shadow.replicas:
+            return None
+        shadow.load_state(self.model.save_state())
+        # Spare replicas repeat the last plan; their costs are ignored
+        rows = list(plans) + [plans[-1]] * (shadow.replicas - len(plans))
+        cost = np.zeros(shadow.replicas)
+        for t in range(len(plans[0])):
+            if time.perf_counter() > deadline:
+                return None
+            for replica, plan in enumerate(rows):
+                shadow.set_phase(plan[t], replica=replica)
+            shadow.step()
+            cost += np.maximum(shadow.stayed, 0.0).sum(axis=1) + shadow.source_queue.sum(axis=1)
+        return cost[:len(plans)].tolist()
+
+    def close(self):
+        pass
+
+
+class LookaheadPlanner:
+    """Model-predictive check of the DQN's action at critical decisions.
+
+    A decision is critical when the signal is green and at least `min_queue` vehicles
+    are queued. The four actions are reduced to the distinct phase plans they lead to
+    over the next `horizon` seconds (assuming no further action), the plans are rolled
+    out from the current state, and the action with the lowest summed halting wins.
+    If the rollouts do not finish within `budget` seconds the DQN action stands.
+
+    Extending actions that would take the current green past MAX_GREEN seconds are
+    not candidates, so repeated extensions cannot hold one green forever. `decide`
+    is expected once per simulated second; it counts the green's age from its calls.
+    """
+
+    def __init__(self, backend, horizon: int = 60, budget: float = 0.2, min_queue: int = 10):
+        self.backend = backend
+        self.horizon = horizon
+        self.budget = budget
+        self.min_queue = min_queue
+        self.decisions = 0
+        self.overrides = 0
+        self.fallbacks = 0
+        self.last_latency = 0.0
+        self._phase: Optional[str] = None
+        self._phase_age = 0
+
+    def is_critical(self, state: np.ndarray, phase: str) -> bool:
+        return phase in ("NS_GREEN", "EW_GREEN") and sum(state[:4]) >= self.min_queue
+
+    def decide(self, state: np.ndarray, dqn_action: int, phase: str, remaining: float,
+               durations: Dict[str, float]) -> int:
+        """Action to take: the best rolled-out plan, or `dqn_action` if not critical or out of time"""
+        if phase != self._phase:
+            self._phase, self._phase_age = phase, 0
+        else:
+            self._phase_age += 1
+        if not self.is_critical(state, phase):
+            return dqn_action
+        started = time.perf_counter()
+        self.decisions += 1
+
+        # Actions that lead to the same plan share one rollout; the DQN's choice breaks ties
+        plans: Dict[Tuple[int, ...], List[int]] = {}
+        for action in [dqn_action] + [a for a in range(len(ACTION_NAMES)) if a != dqn_action]:
+            next_phase, next_remaining = phase_after_action(phase, remaining, action, durations)
+            if next_phase == phase and next_remaining > remaining and self._phase_age + next_remaining > MAX_GREEN:
+                continue  # Would stretch this green past MAX_GREEN
+            plans.setdefault(phase_plan(phase, remaining, action, durations, self.horizon), []).append(action)
+        candidates = list(plans)
+        try:
+            costs = self.backend.evaluate(candidates, started + self.budget)
+        except Exception as e:
+            print(f"Lookahead failed: {e}", file=sys.stderr)
+            costs = None
+        self.last_latency = time.perf_counter() - started
+        if costs is None:
+            self.fallbacks += 1
+            return dqn_action
+
+        best = plans[candidates[int(np.argmin(costs))]]
+        action = dqn_action if dqn_action in best else best[0]
+        if action != dqn_action:
+            self.overrides += 1
+        return action
+
+    def summary(self) -> Dict:
+        return {
+            "decisions": self.decisions,
+            "overrides": self.overrides,
+            "fallbacks": self.fallbacks,
+            "lastLatencyMs": self.last_latency * 1000,
+        }
+
+    def close(self):
+        self.backend.close()
+
+
+def check_phase_cycling(config_path: str, steps: int = 300, horizon: int = 60, min_queue: int = 10,
+                        seed: int = 0) -> Dict:
+    """Run the planner on the mesoscopic model and report whether the signal keeps cycling.
+
+    The DQN is replaced by a stand-in that never changes the plan (it extends the
+    direction that is not green), so every phase change comes from the timer or from
+    a lookahead override. Greens must end within MAX_GREEN and full cycles must complete.
+    """
+    model = MesoscopicModel.from_config(config_path, stochastic=True, seed=seed)
+    planner = LookaheadPlanner(MesoLookahead(model), horizon=horizon, min_queue=min_queue)
+    durations = {'green': 30, 'yellow': 5}
+    phase, remaining = 'NS_GREEN', float(durations['green'])
+    cycles, green_started, longest_green = 0, 0, 0
+    for t in range(steps):
+        model.set_phase(PHASE_INDEX[phase])
+        model.step()
+        counts = model.approach_totals(model.lane_vehicles())[0]
+        state = np.array([*np.round(counts), 0.0])
+        idle = ACTION_NAMES.index("EXTEND_EW" if phase.startswith("NS") else "EXTEND_NS")
+        action = planner.decide(state, idle, phase, remaining, durations)
+        previous = phase
+        phase, remaining = phase_after_action(phase, remaining, action, durations)
+        phase, remaining, cycle_done = advance_phase(phase, remaining, durations)
+        cycles += cycle_done
+        if phase != previous:
+            if previous.endswith("GREEN"):
+                longest_green = max(longest_green, t + 1 - green_started)
+            if phase.endswith("GREEN"):
+                green_started = t + 1
+    if phase.endswith("GREEN"):
+        longest_green = max(longest_green, steps - green_started)
+    planner.close()
+    return {
+        "steps": steps,
+        "cycles": cycles,
+        "longestGreen": longest_green,
+        **planner.summary(),
+        "ok": cycles > 0 and longest_green <= MAX_GREEN,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Regression check: the signal keeps cycling under lookahead")
+    parser.add_argument("--config", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                         "sumo_configs", "intersection.sumo.cfg"))
+    parser.add_argument("--steps", type=int, default=300)
+    parser.add_argument("--horizon", type=int, default=60)
+    parser.add_argument("--min-queue", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    report = check_phase_cycling(args.config, args.steps, args.horizon, args.min_queue, args.seed)
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
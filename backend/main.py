@@ -1,8 +1,12 @@
-from fastapi import FastAPI, BackgroundTasks, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, BackgroundTasks, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Dict, Any, Optional, Set
+from fastapi.responses import Response, StreamingResponse
+from typing import Dict, Any, List, Literal, Optional, Set
+from pydantic import BaseModel, ConfigDict, Field
+from pydantic.alias_generators import to_camel
 from datetime import datetime
 import asyncio
+import uuid
 import subprocess
 import os
 import sys
@@ -11,6 +15,13 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 import json
 from backend.storage import storage
+from backend.export import export_stream, EXPORT_MEDIA_TYPES
+from backend.action_log import ACTION_NAMES
+from backend.status_cache import StatusCache, CachedBody
+from backend.storage import MemStorage
+from backend.session_manager import SessionManager, SessionLimitError
+from backend.frame_log import FrameLogWriter, FrameLogRegistry, PlaybackCursor
+from backend.policy_server import PolicyRegistry, MicroBatcher, NoPolicyError, policy_path, DEFAULT_POLICY
 
 app = FastAPI()
 
@@ -29,12 +40,41 @@ app.add_middleware(
 )
 
 simulation_process: Optional[subprocess.Popen] = None
+frame_log: Optional[FrameLogWriter] = None
+frame_logs = FrameLogRegistry()
+status_cache = StatusCache()
+session_manager = SessionManager(
+    max_sessions=int(os.environ.get("MAX_SESSIONS", 4)),
+    cpus_per_session=int(os.environ.get("SESSION_CPUS", 1)),
+    cpu_seconds=int(os.environ["SESSION_CPU_SECONDS"]) if os.environ.get("SESSION_CPU_SECONDS") else None,
+    memory_mb=int(os.environ["SESSION_MEMORY_MB"]) if os.environ.get("SESSION_MEMORY_MB") else None,
+    finished_ttl=float(os.environ.get("SESSION_TTL_SECONDS", 3600)),
+)
 active_websockets: Set[WebSocket] = set()
+policy_registry = PolicyRegistry()
+policy_batcher = MicroBatcher(
+    policy_registry,
+    max_wait=float(os.environ.get("POLICY_MAX_WAIT_MS", 2)) / 1000.0,
+    max_batch=int(os.environ.get("POLICY_MAX_BATCH", 1024)),
+)
 
 @app.get("/")
 async def root():
     return {"message": "Hello from FastAPI backend!"}
 
+def is_running() -> bool:
+    return simulation_process is not None and simulation_process.poll() is None
+
+def cache_version():
+    """Everything the cached status payloads depend on"""
+    return (storage.version, is_running())
+
+def cached_json_response(request: Request, entry: CachedBody) -> Response:
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if entry.matches(request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
 async def broadcast_simulation_update(data: Dict):
     for websocket in list(active_websockets): # Iterate over a copy to avoid modification during iteration
         try:
@@ -46,13 +86,15 @@ async def broadcast_simulation_update(data: Dict):
             active_websockets.remove(websocket)
 
 async def run_simulation_process():
-    global simulation_process
+    global simulation_process, frame_log
     script_path = os.path.join(os.getcwd(), "backend", "traffic_simulation.py")
     print(f"Attempting to start simulation process: python {script_path}")
     
     try:
+        # Suffixed so two runs started within the same second get separate recordings
+        frame_log = FrameLogWriter(datetime.now().strftime("run-%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6])
         simulation_process = subprocess.Popen(
-            ["python", script_path],
+            ["python", script_path, "--policy-export", policy_path(DEFAULT_POLICY)],
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True, # Decode stdout/stderr as text
@@ -70,6 +112,9 @@ async def run_simulation_process():
         print(f"Error starting or running simulation process: {e}")
     finally:
         simulation_process = None # Ensure simulation_process is set to None when it finishes
+        if frame_log is not None:
+            frame_log.close()
+            frame_log = None
 
 async def read_stream_in_thread(stream, callback):
     loop = asyncio.get_event_loop()
@@ -84,9 +129,9 @@ async def read_stdout_callback(line: str):
     try:
         json_data = json.loads(line)
         # Store data
-        await storage.insert_traffic_state(json_data.get("intersection", {}))
-        await storage.insert_performance_metrics(json_data.get("performance", {}))
-        await storage.insert_agent_status(json_data.get("agent", {}))
+        await storage.insert_frame(json_data)
+        if frame_log is not None:
+            frame_log.append(json_data.get("simulationTime", 0), line.encode("utf-8"))
         
         # Broadcast data only if parsing and storing were successful
         await broadcast_simulation_update({"type": "simulation_update", 
@@ -101,27 +146,20 @@ async def read_stdout_callback(line: str):
 async def read_stderr_callback(line: str):
     print(f"Simulation Error (stderr): {line}")
 
-@app.get("/api/simulation/status")
-async def get_simulation_status():
-    latest_state = await storage.get_latest_traffic_state()
-    latest_metrics = await storage.get_latest_performance_metrics()
-    latest_agent = await storage.get_latest_agent_status()
-
-    # Convert datetime objects to ISO format strings for JSON serialization
-    if latest_state and "timestamp" in latest_state and isinstance(latest_state["timestamp"], datetime):
-        latest_state["timestamp"] = latest_state["timestamp"].isoformat()
-    if latest_metrics and "timestamp" in latest_metrics and isinstance(latest_metrics["timestamp"], datetime):
-        latest_metrics["timestamp"] = latest_metrics["timestamp"].isoformat()
-    if latest_agent and "timestamp" in latest_agent and isinstance(latest_agent["timestamp"], datetime):
-        latest_agent["timestamp"] = latest_agent["timestamp"].isoformat()
-
+async def build_simulation_status() -> Dict[str, Any]:
+    # Datetimes are serialized by the cache; stored records are not modified
     return {
-        "isRunning": simulation_process is not None and simulation_process.poll() is None,
-        "currentState": latest_state,
-        "performance": latest_metrics,
-        "agent": latest_agent,
+        "isRunning": is_running(),
+        "currentState": await storage.get_latest_traffic_state(),
+        "performance": await storage.get_latest_performance_metrics(),
+        "agent": await storage.get_latest_agent_status(),
     }
 
+@app.get("/api/simulation/status")
+async def get_simulation_status(request: Request):
+    entry = await status_cache.get("status", cache_version(), build_simulation_status)
+    return cached_json_response(request, entry)
+
 @app.post("/api/simulation/start")
 async def start_simulation(background_tasks: BackgroundTasks):
     global simulation_process
@@ -172,17 +210,25 @@ async def get_performance_history(limit: int = 100):
     return history
 
 @app.get("/api/performance/comparison")
-async def get_baseline_comparison():
-    comparison = await storage.get_baseline_comparison()
-    for item in comparison["rl"]:
-        if "timestamp" in item and isinstance(item["timestamp"], datetime): item["timestamp"] = item["timestamp"].isoformat()
-    for item in comparison["baseline"]:
-        if "timestamp" in item and isinstance(item["timestamp"], datetime): item["timestamp"] = item["timestamp"].isoformat()
-    return comparison
+async def get_baseline_comparison(request: Request, label: Optional[str] = None, limit: int = 20):
+    version = (cache_version(), storage.run_index.version())
+    entry = await status_cache.get(("comparison", label, limit), version,
+                                   lambda: storage.get_baseline_comparison(label=label, limit=limit))
+    return cached_json_response(request, entry)
+
+@app.get("/api/performance/runs/{run_id}")
+async def get_run_intervals(run_id: str):
+    intervals = await storage.get_run_intervals(run_id)
+    if not intervals:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return intervals
 
 @app.get("/api/agent/actions")
-async def get_agent_actions(limit: int = 10):
-    actions = await storage.get_recent_agent_actions(limit)
+async def get_agent_actions(limit: int = 10, action: Optional[str] = None,
+                            start_time: Optional[float] = None, end_time: Optional[float] = None):
+    if action is not None and action not in ACTION_NAMES:
+        raise HTTPException(status_code=400, detail=f"Unknown action, expected one of {ACTION_NAMES}")
+    actions = await storage.get_recent_agent_actions(limit, action=action, start_time=start_time, end_time=end_time)
     for item in actions:
         if "timestamp" in item and isinstance(item["timestamp"], datetime): item["timestamp"] = item["timestamp"].isoformat()
     return actions
@@ -194,11 +240,30 @@ async def save_model():
     print("Backend: Received request to save model.")
     return {"message": "Model save initiated (placeholder)"}
 
+EXPORT_DATASETS = ("all", "traffic_states", "performance", "agent", "transitions")
+
+@app.get("/api/simulation/export-data")
 @app.post("/api/simulation/export-data")
-async def export_data():
-    # Placeholder: In a real scenario, you'd fetch data from storage and write to a file.
-    print("Backend: Received request to export data.")
-    return {"message": "Data export initiated (placeholder)"}
+async def export_data(dataset: str = "all", export_format: str = Query("ndjson", alias="format"),
+                      compress: bool = Query(False, alias="gzip")):
+    if dataset not in EXPORT_DATASETS:
+        raise HTTPException(status_code=400, detail=f"Unknown dataset, expected one of {EXPORT_DATASETS}")
+    if export_format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown format, expected one of {tuple(EXPORT_MEDIA_TYPES)}")
+    if export_format == "npy" and dataset != "transitions":
+        raise HTTPException(status_code=400, detail="The npy format is only available for transitions")
+    if export_format == "csv" and dataset == "all":
+        # One header cannot describe every dataset's columns
+        raise HTTPException(status_code=400, detail="The csv format needs a single dataset")
+
+    # The generator pulls records from storage as the client reads, so memory stays flat
+    body = export_stream(storage.iter_records(dataset), export_format, compress=compress)
+    filename = f"{dataset}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{export_format}" + (".gz" if compress else "")
+    return StreamingResponse(
+        body,
+        media_type="application/gzip" if compress else EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 @app.post("/api/simulation/configure-agent")
 async def configure_agent():
@@ -207,92 +272,226 @@ async def configure_agent():
     print("Backend: Received request to configure agent.")
     return {"message": "Agent configuration initiated (placeholder)"}
 
-@app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
-    active_websockets.add(websocket)
+class SessionRequest(BaseModel):
+    """Scenario and agent settings for one simulation session"""
+    model_config = ConfigDict(alias_generator=to_camel, populate_by_name=True)
+
+    sumo_config: Optional[str] = None
+    route_files: List[str] = []
+    realtime_factor: Optional[float] = Field(None, gt=0)
+    steps: Optional[int] = Field(None, gt=0)
+    learning_rate: Optional[float] = Field(None, gt=0)
+    gamma: Optional[float] = Field(None, ge=0, le=1)
+    epsilon_decay: Optional[float] = Field(None, gt=0, le=1)
+    batch_size: Optional[int] = Field(None, gt=0)
+    memory_size: Optional[int] = Field(None, gt=0)
+    episode_length: Optional[int] = Field(None, gt=0)
+    target_sync_episodes: Optional[int] = Field(None, gt=0)
+    async_learner: bool = False
+    train_every: Optional[int] = Field(None, gt=0)
+    gradient_steps: Optional[int] = Field(None, gt=0)
+    sensing: Optional[Literal["lanes", "e2"]] = None
+    detector_length: Optional[float] = Field(None, gt=0)
+
+def get_session_or_404(session_id: str):
+    session = session_manager.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Unknown session: {session_id}")
+    return session
+
+@app.post("/api/sessions", status_code=201)
+async def create_session(request: SessionRequest):
     try:
-        # Send initial data to the new client
-        latest_state = await storage.get_latest_traffic_state()
-        latest_metrics = await storage.get_latest_performance_metrics()
-        latest_agent = await storage.get_latest_agent_status()
-
-        # Prepare a default simulation data structure
-        current_sim_data = {
-            "simulationTime": 0,
-            "cycleNumber": 0,
-            "intersection": {
-                "northQueue": 0,
-                "southQueue": 0,
-                "eastQueue": 0,
-                "westQueue": 0,
-                "currentPhase": "NS_GREEN", # Default valid enum value
-                "phaseTimeRemaining": 0,
-                "vehicles": []
-            },
-            "performance": {
-                "avgWaitTime": 0.0,
-                "throughput": 0,
-                "maxQueue": 0,
-                "efficiencyScore": 0.0
-            },
-            "agent": {
-                "lastAction": "",
-                "epsilon": 0.0,
-                "episode": 0,
-                "replayBufferFull": 0.0,
-                "recentActions": []
-            },
+        session = await session_manager.create(request.model_dump(exclude_none=True))
+    except SessionLimitError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return session.to_dict()
+
+@app.get("/api/sessions")
+async def list_sessions():
+    return {"maxSessions": session_manager.max_sessions, "sessions": session_manager.describe()}
+
+@app.get("/api/sessions/{session_id}")
+async def get_session(session_id: str):
+    return get_session_or_404(session_id).to_dict()
+
+@app.get("/api/sessions/{session_id}/status")
+async def get_session_status(session_id: str, request: Request):
+    session = get_session_or_404(session_id)
+    store = session.storage
+    async def build():
+        return {
+            "isRunning": session.is_running(),
+            "currentState": await store.get_latest_traffic_state(),
+            "performance": await store.get_latest_performance_metrics(),
+            "agent": await store.get_latest_agent_status(),
         }
+    entry = await status_cache.get(("status", session_id), (store.version, session.is_running()), build)
+    return cached_json_response(request, entry)
+
+@app.get("/api/sessions/{session_id}/performance/history")
+async def get_session_performance_history(session_id: str, limit: int = 100):
+    return await get_session_or_404(session_id).storage.get_performance_history(limit)
+
+@app.post("/api/sessions/{session_id}/stop")
+async def stop_session(session_id: str):
+    get_session_or_404(session_id)
+    session = await session_manager.stop(session_id)
+    return session.to_dict()
+
+@app.delete("/api/sessions/{session_id}")
+async def delete_session(session_id: str):
+    get_session_or_404(session_id)
+    await session_manager.remove(session_id)
+    return {"message": f"Session {session_id} removed"}
+
+@app.get("/api/recordings")
+async def list_recordings():
+    return frame_logs.runs()
+
+class PredictRequest(BaseModel):
+    """One state vector or a batch of them"""
+    state: Optional[List[float]] = None
+    states: Optional[List[List[float]]] = None
+
+class PolicySelection(BaseModel):
+    name: str
+
+async def predict_response(states) -> Dict[str, Any]:
+    actions, q_values, version = await policy_batcher.predict(states)
+    return {
+        "actions": actions.tolist(),
+        "actionNames": [ACTION_NAMES[a] for a in actions],
+        "qValues": q_values.tolist(),
+        "modelVersion": version,
+        "model": policy_registry.name,
+    }
 
-        # Override with actual latest data if available
-        if latest_state:
-            current_sim_data["intersection"].update({
-                "northQueue": latest_state.get("northQueue", 0),
-                "southQueue": latest_state.get("southQueue", 0),
-                "eastQueue": latest_state.get("eastQueue", 0),
-                "westQueue": latest_state.get("westQueue", 0),
-                "currentPhase": latest_state.get("currentPhase", "NS_GREEN"),
-                "phaseTimeRemaining": latest_state.get("phaseTimeRemaining", 0),
-                "vehicles": latest_state.get("vehicles", []),
-            })
-            if "simulationTime" in latest_state: current_sim_data["simulationTime"] = latest_state["simulationTime"]
-            if "cycleNumber" in latest_state: current_sim_data["cycleNumber"] = latest_state["cycleNumber"]
+@app.post("/api/agent/predict")
+async def predict_actions(request: PredictRequest):
+    if (request.state is None) == (request.states is None):
+        raise HTTPException(status_code=400, detail="Send exactly one of state or states")
+    try:
+        return await predict_response(request.states if request.states is not None else request.state)
+    except NoPolicyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/agent/model")
+async def get_agent_model():
+    return {**policy_registry.describe(), "batching": policy_batcher.describe()}
+
+@app.post("/api/agent/model")
+async def select_agent_model(selection: PolicySelection):
+    try:
+        policy_registry.select(selection.name)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"No policy exported as {selection.name}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await get_agent_model()
+
+@app.on_event("startup")
+async def start_policy_batcher():
+    policy_batcher.start()
+
+@app.on_event("shutdown")
+async def stop_sessions():
+    await session_manager.shutdown()
+    await policy_batcher.stop()
+
+async def build_initial_data(store: MemStorage, running: bool) -> Dict[str, Any]:
+    latest_state = await store.get_latest_traffic_state()
+    latest_metrics = await store.get_latest_performance_metrics()
+    latest_agent = await store.get_latest_agent_status()
+
+    # Prepare a default simulation data structure
+    current_sim_data = {
+        "simulationTime": 0,
+        "cycleNumber": 0,
+        "intersection": {
+            "northQueue": 0,
+            "southQueue": 0,
+            "eastQueue": 0,
+            "westQueue": 0,
+            "currentPhase": "NS_GREEN", # Default valid enum value
+            "phaseTimeRemaining": 0,
+            "vehicles": []
+        },
+        "performance": {
+            "avgWaitTime": 0.0,
+            "throughput": 0,
+            "maxQueue": 0,
+            "efficiencyScore": 0.0
+        },
+        "agent": {
+            "lastAction": "",
+            "epsilon": 0.0,
+            "episode": 0,
+            "replayBufferFull": 0.0,
+            "recentActions": []
+        },
+    }
+
+    # Override with actual latest data if available
+    if latest_state:
+        current_sim_data["intersection"].update({
+            "northQueue": latest_state.get("northQueue", 0),
+            "southQueue": latest_state.get("southQueue", 0),
+            "eastQueue": latest_state.get("eastQueue", 0),
+            "westQueue": latest_state.get("westQueue", 0),
+            "currentPhase": latest_state.get("currentPhase", "NS_GREEN"),
+            "phaseTimeRemaining": latest_state.get("phaseTimeRemaining", 0),
+            "vehicles": latest_state.get("vehicles", []),
+        })
+        if "simulationTime" in latest_state: current_sim_data["simulationTime"] = latest_state["simulationTime"]
+        if "cycleNumber" in latest_state: current_sim_data["cycleNumber"] = latest_state["cycleNumber"]
+    
+    if latest_metrics:
+        current_sim_data["performance"].update({
+            "avgWaitTime": latest_metrics.get("avgWaitTime", 0.0),
+            "throughput": latest_metrics.get("throughput", 0),
+            "maxQueue": latest_metrics.get("maxQueue", 0),
+            "efficiencyScore": latest_metrics.get("efficiencyScore", 0.0)
+        })
         
-        if latest_metrics:
-            current_sim_data["performance"].update({
-                "avgWaitTime": latest_metrics.get("avgWaitTime", 0.0),
-                "throughput": latest_metrics.get("throughput", 0),
-                "maxQueue": latest_metrics.get("maxQueue", 0),
-                "efficiencyScore": latest_metrics.get("efficiencyScore", 0.0)
-            })
-            
-        if latest_agent:
-            current_sim_data["agent"].update({
-                "lastAction": latest_agent.get("lastAction", ""),
-                "epsilon": latest_agent.get("epsilon", 0.0),
-                "episode": latest_agent.get("episode", 0),
-                "replayBufferFull": latest_agent.get("replayBufferFull", 0.0),
-                "recentActions": latest_agent.get("recentActions", []),
-            })
-            
-        # Apply timestamp formatting to the initial data (only if they are datetime objects)
-        if latest_state and "timestamp" in latest_state and isinstance(latest_state["timestamp"], datetime):
-            # We are assigning to the top-level simulationTime/cycleNumber if they were in latest_state
-            # so these should only be datetime objects if from latest_state
-            current_sim_data["intersection"]["timestamp"] = latest_state["timestamp"].isoformat()
-        if latest_metrics and "timestamp" in latest_metrics and isinstance(latest_metrics["timestamp"], datetime):
-            current_sim_data["performance"]["timestamp"] = latest_metrics["timestamp"].isoformat()
-        if latest_agent and "timestamp" in latest_agent and isinstance(latest_agent["timestamp"], datetime):
-            current_sim_data["agent"]["timestamp"] = latest_agent["timestamp"].isoformat()
-            
-        initial_data = {
-            "type": "initial_data",
-            "isRunning": simulation_process is not None and simulation_process.poll() is None,
-            "data": current_sim_data,
-        }
+    if latest_agent:
+        current_sim_data["agent"].update({
+            "lastAction": latest_agent.get("lastAction", ""),
+            "epsilon": latest_agent.get("epsilon", 0.0),
+            "episode": latest_agent.get("episode", 0),
+            "replayBufferFull": latest_agent.get("replayBufferFull", 0.0),
+            "recentActions": await store.get_recent_agent_actions(10),
+        })
+        
+    # Apply timestamp formatting to the initial data (only if they are datetime objects)
+    if latest_state and "timestamp" in latest_state and isinstance(latest_state["timestamp"], datetime):
+        # We are assigning to the top-level simulationTime/cycleNumber if they were in latest_state
+        # so these should only be datetime objects if from latest_state
+        current_sim_data["intersection"]["timestamp"] = latest_state["timestamp"].isoformat()
+    if latest_metrics and "timestamp" in latest_metrics and isinstance(latest_metrics["timestamp"], datetime):
+        current_sim_data["performance"]["timestamp"] = latest_metrics["timestamp"].isoformat()
+    if latest_agent and "timestamp" in latest_agent and isinstance(latest_agent["timestamp"], datetime):
+        current_sim_data["agent"]["timestamp"] = latest_agent["timestamp"].isoformat()
+        
+    return {
+        "type": "initial_data",
+        "isRunning": running,
+        "data": current_sim_data,
+    }
 
-        await websocket.send_json(initial_data)
+@app.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket):
+    await websocket.accept()
+    active_websockets.add(websocket)
+    try:
+        # Send initial data to the new client; built once per data version for all connections
+        entry = await status_cache.get("initial_data", cache_version(),
+                                       lambda: build_initial_data(storage, is_running()))
+        await websocket.send_text(entry.text)
 
         while True:
             # Keep the connection alive, listen for messages if needed
@@ -304,3 +503,112 @@ async def websocket_endpoint(websocket: WebSocket):
         print(f"WebSocket error: {e}")
     finally:
         active_websockets.remove(websocket)
+
+@app.websocket("/ws/{session_id}")
+async def session_websocket_endpoint(websocket: WebSocket, session_id: str):
+    session = session_manager.get(session_id)
+    if session is None:
+        await websocket.close(code=4404)
+        return
+    await websocket.accept()
+    session.websockets.add(websocket)
+    try:
+        entry = await status_cache.get(("initial_data", session_id), (session.storage.version, session.is_running()),
+                                       lambda: build_initial_data(session.storage, session.is_running()))
+        await websocket.send_text(entry.text)
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"Session {session_id} websocket error: {e}")
+    finally:
+        session.websockets.discard(websocket)
+
+@app.websocket("/ws/playback/{run_id}")
+async def playback_websocket_endpoint(websocket: WebSocket, run_id: str, speed: float = 1.0,
+                                      start: Optional[float] = None):
+    """Replay a recorded run; clients send {"type": "seek"|"speed"|"pause"|"resume", ...} to control it"""
+    try:
+        reader = frame_logs.open(run_id)
+    except (OSError, ValueError):
+        await websocket.close(code=4404)
+        return
+    await websocket.accept()
+    cursor = PlaybackCursor(reader, speed, start)
+    await websocket.send_json({"type": "playback_started", **reader.describe(), "speed": cursor.speed})
+    control = asyncio.create_task(websocket.receive_json())
+    try:
+        while True:
+            delay = None
+            if not cursor.paused and not cursor.finished:
+                frame, delay = cursor.advance()
+                # Recorded frames are already JSON; wrap them without re-serializing
+                await websocket.send_text('{"type":"simulation_update","isRunning":false,"playback":true,"data":'
+                                          + frame.decode("utf-8") + "}")
+                if cursor.finished:
+                    await websocket.send_json({"type": "playback_ended", "runId": run_id})
+            done, _ = await asyncio.wait({control}, timeout=delay)
+            if control not in done:
+                continue
+            message = control.result()
+            control = asyncio.create_task(websocket.receive_json())
+            kind = message.get("type") if isinstance(message, dict) else None
+            if kind == "seek":
+                cursor.seek(float(message.get("time", 0)))
+            elif kind == "speed":
+                cursor.set_speed(message.get("value", 1.0))
+            elif kind == "pause":
+                cursor.paused = True
+            elif kind == "resume":
+                cursor.paused = False
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"Playback websocket error: {e}")
+    finally:
+        control.cancel()
+
+@app.websocket("/ws/agent/predict")
+async def predict_websocket_endpoint(websocket: WebSocket):
+    """Predict over a websocket: {"id", "state" | "states"} in, the HTTP response body plus "id" out.
+
+    Messages are handled concurrently, so one connection can keep many predictions in
+    flight; replies carry the request's id and may arrive out of order.
+    """
+    await websocket.accept()
+    send_lock = asyncio.Lock()
+    tasks: Set[asyncio.Task] = set()
+
+    async def handle(message: Dict[str, Any]):
+        try:
+            states = message["states"] if "states" in message else message["state"]
+            reply = await predict_response(states)
+        except KeyError:
+            reply = {"error": "Send state or states"}
+        except (NoPolicyError, TypeError, ValueError) as e:
+            reply = {"error": str(e)}
+        except Exception as e:
+            # Every message gets a reply, whatever went wrong
+            reply = {"error": f"Prediction failed: {e}"}
+        reply["id"] = message.get("id")
+        async with send_lock:
+            try:
+                await websocket.send_json(reply)
+            except Exception:
+                pass  # Client went away; the receive loop notices
+
+    try:
+        while True:
+            message = await websocket.receive_json()
+            if not isinstance(message, dict):
+                await websocket.send_json({"error": "Expected a JSON object"})
+                continue
+            task = asyncio.create_task(handle(message))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,508 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from net_index import load_net_index
+from sumo_bridge import DIRECTIONS, LaneIndex, net_file_from_config
+from sumo_output_parser import iter_summary_steps
+
+# SUMO defaults for vType attributes the route file leaves out
+DEFAULT_VTYPE = {"length": 5.0, "minGap": 2.5, "tau": 1.0, "maxSpeed": 55.55}
+# Share of saturation flow that still crosses the stop line on yellow
+YELLOW_FLOW_FRACTION = 0.5
+SIGNAL_FLOW = {"G": 1.0, "g": 1.0, "O": 1.0, "o": 1.0, "y": YELLOW_FLOW_FRACTION, "Y": YELLOW_FLOW_FRACTION}
+# Per-replica arrays that make up the dynamic state (signal gates included)
+STATE_FIELDS = ("n", "stayed", "source_queue", "arrived", "inserted", "loaded", "last_arrived", "link_gate")
+
+
+def _route_files_from_config(config_file: str) -> List[str]:
+    root = ET.parse(config_file).getroot()
+    routes = root.find("./input/route-files")
+    if routes is None:
+        return []
+    base = os.path.dirname(os.path.abspath(config_file))
+    return [os.path.join(base, f.strip()) for f in routes.get("value").split(",") if f.strip()]
+
+
+def _flow_rate(elem: ET.Element) -> float:
+    """Vehicles per second implied by a <flow>'s vehsPerHour / period / probability / number"""
+    begin, end = float(elem.get("begin", 0)), float(elem.get("end", 3600))
+    if elem.get("vehsPerHour") is not None:
+        return float(elem.get("vehsPerHour")) / 3600.0
+    if elem.get("period") is not None:
+        return 1.0 / float(elem.get("period").replace("exp(", "").rstrip(")"))
+    if elem.get("probability") is not None:
+        return float(elem.get("probability"))
+    if elem.get("number") is not None and end > begin:
+        return float(elem.get("number")) / (end - begin)
+    return 0.0
+
+
+class Demand:
+    """Route-file demand reduced to what a macroscopic model needs.
+
+    Flows become (begin, end, rate, first edge) rows, explicit vehicles a per-second
+    departure schedule, and every route contributes its rate to edge-to-edge turning
+    counts. Vehicle types are averaged, weighted by flow, into one jam spacing and
+    reaction time.
+    """
+
+    def __init__(self, route_files: Sequence[str]):
+        self.flows: List[Dict] = []
+        self.vehicles: List[Dict] = []
+        self.turns: Dict[str, Dict[str, float]] = {}
+        vtypes: Dict[str, Dict] = {}
+        routes: Dict[str, List[str]] = {}
+        for path in route_files:
+            for _, elem in ET.iterparse(path, events=("end",)):
+                if elem.tag == "vType":
+                    vtypes[elem.get("id")] = {k: float(elem.get(k, v)) for k, v in DEFAULT_VTYPE.items()}
+                elif elem.tag == "route" and elem.get("id") is not None:
+                    routes[elem.get("id")] = elem.get("edges").split()
+                elif elem.tag in ("flow", "vehicle"):
+                    nested = elem.find("route")
+                    edges = nested.get("edges").split() if nested is not None else routes.get(elem.get("route"))
+                    if not edges:
+                        print(f"Skipping {elem.tag} {elem.get('id')}: trips without an explicit route are not supported",
+                              file=sys.stderr)
+                        continue
+                    vtype = vtypes.get(elem.get("type"), DEFAULT_VTYPE)
+                    if elem.tag == "flow":
+                        self.flows.append({"begin": float(elem.get("begin", 0)), "end": float(elem.get("end", 3600)),
+                                           "rate": _flow_rate(elem), "edges": edges, "vtype": vtype})
+                    else:
+                        self.vehicles.append({"depart": float(elem.get("depart", 0)), "edges": edges, "vtype": vtype})
+
+        weights, spacing, tau = [], [], []
+        for item in self.flows + self.vehicles:
+            weight = item.get("rate", 1.0) * (item["end"] - item["begin"]) if "rate" in item else 1.0
+            weights.append(weight)
+            spacing.append(item["vtype"]["length"] + item["vtype"]["minGap"])
+            tau.append(item["vtype"]["tau"])
+            for a, b in zip(item["edges"], item["edges"][1:]):
+                self.turns.setdefault(a, {}).setdefault(b, 0.0)
+                self.turns[a][b] += weight
+        total = sum(weights)
+        self.jam_spacing = float(np.dot(weights, spacing) / total) if total else DEFAULT_VTYPE["length"] + DEFAULT_VTYPE["minGap"]
+        self.tau = float(np.dot(weights, tau) / total) if total else DEFAULT_VTYPE["tau"]
+
+
+class MesoscopicModel:
+    """Vectorised cell-transmission model (CTM) of a SUMO network.
+
+    Every lane is cut into cells one free-flow step long. Each step, cells send
+    min(n, Q) vehicles and receive min(Q, delta * (N - n)). Q is the saturation flow
+    of the triangular fundamental diagram implied by the lane speed, the demand's jam
+    spacing and the reaction time. Flow between cells and across junction connections
+    is limited by the receiving cell, with proportional merges and FIFO diverges.
+    Signalised connections are gated by the current signal state. Demand enters
+    through per-edge insertion queues, which play the role of SUMO's "waiting"
+    vehicles, and leaves at lanes with no outgoing connection.
+
+    State is held as (replicas x cells) arrays and every step is a fixed sequence of
+    NumPy operations over all replicas at once. Each replica has its own signal gates,
+    so a batch of independent episodes (e.g. one per policy or seed) advances for
+    roughly the cost of one.
+    """
+
+    def __init__(self, net_file: str, route_files: Sequence[str], step_length: float = 1.0,
+                 saturation_flow: Optional[float] = None, approach_edges: Optional[Dict[str, str]] = None,
+                 stochastic: bool = False, seed: Optional[int] = None, replicas: int = 1):
+        self.net_file = net_file
+        self.route_files = list(route_files)
+        self.approach_edges = approach_edges
+        self.dt = step_length
+        self.replicas = replicas
+        self.demand = Demand(route_files)
+        self.rng = np.random.default_rng(seed)
+        self.stochastic = stochastic
+        net = load_net_index(net_file)
+
+        lanes = np.flatnonzero(net.lane_passenger)
+        self.lane_ids = net.lane_ids[lanes].tolist()
+        lane_slot = {int(net_lane): i for i, net_lane in enumerate(lanes)}
+        lane_edge = net.edge_ids[net.lane_edge[lanes]].tolist()
+        edge_ids = sorted(set(lane_edge))
+        self.edge_slot = {edge_id: i for i, edge_id in enumerate(edge_ids)}
+        lengths, speeds = net.lane_length[lanes].tolist(), net.lane_speed[lanes].tolist()
+
+        # Cells: free-flow travel of one cell takes at least one step, which keeps the CTM stable
+        spacing, tau = self.demand.jam_spacing, self.demand.tau
+        cell_lane, cell_len, cell_speed = [], [], []
+        self.lane_first = np.zeros(len(lanes), dtype=np.intp)
+        self.lane_last = np.zeros(len(lanes), dtype=np.intp)
+        for i, (length, speed) in enumerate(zip(lengths, speeds)):
+            count = max(1, int(length // (speed * step_length)))
+            self.lane_first[i] = len(cell_lane)
+            cell_lane += [i] * count
+            cell_len += [length / count] * count
+            cell_speed += [speed] * count
+            self.lane_last[i] = len(cell_lane) - 1
+        self.cell_lane = np.array(cell_lane, dtype=np.intp)
+        speed = np.array(cell_speed)
+        wave_speed = spacing / tau
+        self.capacity = np.array(cell_len) / spacing                      # N: jam storage per cell
+        if saturation_flow is not None:
+            flow = np.full(len(speed), saturation_flow / 3600.0)
+        else:
+            flow = speed / (speed * tau + spacing)                         # veh/s at critical density
+        self.max_flow = flow * step_length                                 # Q per step
+        self.delta = np.minimum(1.0, wave_speed / speed)
+
+        # Links: cell -> next cell inside a lane, plus junction connections weighted by route turning shares
+        up, down, share, tls_ids, tls_links = [], [], [], [], []
+        outgoing = net.outgoing()
+        for i, net_lane in enumerate(lanes):
+            for c in range(self.lane_first[i], self.lane_last[i]):
+                up.append(c); down.append(c + 1); share.append(1.0); tls_ids.append(None); tls_links.append(-1)
+            connections = [c for c in outgoing[net_lane].tolist() if net.conn_to[c] in lane_slot]
+            if not connections:
+                continue
+            turns = self.demand.turns.get(lane_edge[i], {})
+            targets: Dict[str, List] = {}
+            for conn in connections:
+                targets.setdefault(lane_edge[lane_slot[int(net.conn_to[conn])]], []).append(conn)
+            weights = {edge: turns.get(edge, 0.0) for edge in targets}
+            if not any(weights.values()):
+                weights = {edge: 1.0 for edge in targets}  # No route uses this lane: split evenly
+            total = sum(weights.values())
+            for edge, conns in targets.items():
+                for conn in conns:
+                    if weights[edge] == 0.0:
+                        continue
+                    up.append(self.lane_last[i])
+                    down.append(self.lane_first[lane_slot[int(net.conn_to[conn])]])
+                    share.append(weights[edge] / total / len(conns))
+                    tls_ids.append(net.tls_ids[net.conn_tls[conn]] if net.conn_tls[conn] >= 0 else None)
+                    tls_links.append(int(net.conn_link[conn]))
+
+        order = np.argsort(up, kind="stable")
+        self.link_up = np.array(up, dtype=np.intp)[order]
+        self.link_down = np.array(down, dtype=np.intp)[order]
+        self.link_share = np.array(share)[order]
+        self.link_gate = np.ones((replicas, len(order)))
+        tls_ids = [tls_ids[k] for k in order]
+        tls_links = np.array(tls_links, dtype=np.intp)[order]
+        self._signal_links = {}
+        for tls_id in {t for t in tls_ids if t}:
+            positions = np.array([k for k, t in enumerate(tls_ids) if t == tls_id], dtype=np.intp)
+            self._signal_links[tls_id] = (positions, tls_links[positions])
+        self._up_cells, self._up_starts = np.unique(self.link_up, return_index=True)
+        self.sink_cells = np.setdiff1d(self.lane_last, self.link_up)
+
+        # Sources: each route's first edge feeds the first cells of that edge's lanes
+        self.source_queue = np.zeros((replicas, len(edge_ids)))
+        self._edge_lanes = np.array([self.edge_slot[edge] for edge in lane_edge], dtype=np.intp)
+        self._edge_lane_count = np.bincount(self._edge_lanes, minlength=len(edge_ids))
+
+        # Scatter-adds over the replica axis run as one bincount on flattened (replica, target) indices
+        cells = len(self.cell_lane)
+        self._scatter_up = self._flat_index(self.link_up, cells)
+        self._scatter_down = self._flat_index(self.link_down, cells)
+        self._scatter_edges = self._flat_index(self._edge_lanes, len(edge_ids))
+        self._scatter_lanes = self._flat_index(self.cell_lane, len(lanes))
+        flows = [f for f in self.demand.flows if f["edges"][0] in self.edge_slot]
+        self._flow_begin = np.array([f["begin"] for f in flows])
+        self._flow_end = np.array([f["end"] for f in flows])
+        self._flow_rate = np.array([f["rate"] for f in flows])
+        self._flow_edge = np.array([self.edge_slot[f["edges"][0]] for f in flows], dtype=np.intp)
+        self._departures: Dict[int, np.ndarray] = {}
+        for v in self.demand.vehicles:
+            if v["edges"][0] in self.edge_slot:
+                counts = self._departures.setdefault(int(v["depart"] // step_length), np.zeros(len(edge_ids)))
+                counts[self.edge_slot[v["edges"][0]]] += 1
+
+        # Signal programs, for fixed-time runs and for mapping controller phases to states
+        self.programs = {tls_id: program for tls_id, program in net.programs.items() if program}
+        self.default_tls = next(iter(self.programs), None)
+
+        # Approach slots, in the same lane order and direction labelling as the SUMO feature path
+        self.lane_index = LaneIndex(net_file, self.default_tls, approach_edges) if self.default_tls else None
+        if self.lane_index is not None:
+            slot = {lane_id: i for i, lane_id in enumerate(self.lane_ids)}
+            self._approach_lanes = np.array([slot[l] for l in self.lane_index.lane_ids], dtype=np.intp)
+
+        self.reset()
+
+    def _flat_index(self, index: np.ndarray, size: int):
+        offsets = (np.arange(self.replicas)[:, None] * size + index[None, :]).ravel()
+        return offsets, size
+
+    def _scatter(self, flat, values: np.ndarray) -> np.ndarray:
+        """Row-wise `bincount`: sum (replicas x K) `values` into (replicas x size) targets"""
+        offsets, size = flat
+        return np.bincount(offsets, weights=values.ravel(), minlength=self.replicas * size).reshape(self.replicas, size)
+
+    @classmethod
+    def from_config(cls, config_file: str, route_files: Optional[Sequence[str]] = None, **kwargs) -> "MesoscopicModel":
+        """Build the model for the net and route files referenced by a .sumo.cfg"""
+        root = ET.parse(config_file).getroot()
+        step = root.find("./time/step-length")
+        return cls(net_file_from_config(config_file), route_files or _route_files_from_config(config_file),
+                   step_length=float(step.get("value")) if step is not None else 1.0, **kwargs)
+
+    def reset(self):
+        self.time = 0.0
+        self.n = np.zeros((self.replicas, len(self.cell_lane)))
+        self.source_queue.fill(0.0)
+        self.stayed = np.zeros_like(self.n)
+        self.arrived = np.zeros(self.replicas)
+        self.inserted = np.zeros(self.replicas)
+        self.loaded = np.zeros(self.replicas)
+        self.last_arrived = np.zeros(self.replicas)
+        for tls_id, program in self.programs.items():
+            self.set_signal_state(program[0][0], tls_id)
+
+    def save_state(self, replica: int = 0) -> Dict:
+        """Copy of one replica's dynamic state, the model's analogue of SUMO's saveState"""
+        state = {name: getattr(self, name)[replica].copy() for name in STATE_FIELDS}
+        state["time"] = self.time
+        return state
+
+    def load_state(self, state: Dict, replica: Optional[int] = None):
+        """Load a saved replica state into every replica, or only into `replica`"""
+        rows = slice(None) if replica is None else replica
+        for name in STATE_FIELDS:
+            getattr(self, name)[rows] = state[name]
+        self.time = state["time"]
+
+    def set_signal_state(self, state: str, tls_id: Optional[str] = None, replica: Optional[int] = None):
+        """Gate a traffic light's connections with a SUMO red/yellow/green state string.
+
+        Applies to every replica unless `replica` is given.
+        """
+        positions, links = self._signal_links[tls_id or self.default_tls]
+        gates = [SIGNAL_FLOW.get(state[k], 0.0) if k < len(state) else 0.0 for k in links]
+        rows = slice(None) if replica is None else replica
+        self.link_gate[rows, positions] = gates
+
+    def set_phase(self, phase_index: int, tls_id: Optional[str] = None, replica: Optional[int] = None):
+        """Apply phase `phase_index` of the light's program from the net file"""
+        tls_id = tls_id or self.default_tls
+        self.set_signal_state(self.programs[tls_id][phase_index][0], tls_id, replica)
+
+    def program_phase_at(self, t: float, tls_id: Optional[str] = None) -> int:
+        """Phase index the static program would show at time `t`"""
+        program = self.programs[tls_id or self.default_tls]
+        cycle = sum(duration for _, duration in program)
+        offset = t % cycle
+        for index, (_, duration) in enumerate(program):
+            if offset < duration:
+                return index
+            offset -= duration
+        return len(program) - 1
+
+    def _arrivals(self) -> np.ndarray:
+        active = (self._flow_begin <= self.time) & (self.time < self._flow_end)
+        expected = np.bincount(self._flow_edge[active], weights=self._flow_rate[active] * self.dt,
+                               minlength=self.source_queue.shape[1])
+        if self.stochastic:
+            arrivals = self.rng.poisson(expected, size=self.source_queue.shape).astype(float)
+        else:
+            arrivals = np.broadcast_to(expected, self.source_queue.shape)
+        scheduled = self._departures.get(int(self.time // self.dt))
+        return arrivals + scheduled if scheduled is not None else arrivals
+
+    def step(self):
+        """Advance every replica by one step"""
+        n = self.n
+        send = np.minimum(n, self.max_flow)
+        receive = np.minimum(self.max_flow, self.delta * (self.capacity - n))
+
+        # Link demand, merges scaled to what the receiving cell can take
+        demand = send[:, self.link_up] * self.link_share
+        wanted = self._scatter(self._scatter_down, demand)
+        scale = np.divide(receive, wanted, out=np.ones_like(receive), where=wanted > receive)
+        allowed = demand * scale[:, self.link_down] * self.link_gate
+        # FIFO diverge: a blocked movement holds back the whole upstream cell
+        ratio = np.divide(allowed, demand, out=np.ones_like(demand), where=demand > 0)
+        ratio[(self.link_gate == 0) & (self.link_share > 0)] = 0.0
+        cell_ratio = np.ones_like(n)
+        if ratio.shape[1]:
+            cell_ratio[:, self._up_cells] = np.minimum.reduceat(ratio, self._up_starts, axis=1)
+        flow = demand * cell_ratio[:, self.link_up]
+
+        outflow = self._scatter(self._scatter_up, flow)
+        inflow = self._scatter(self._scatter_down, flow)
+        exits = send[:, self.sink_cells]
+        outflow[:, self.sink_cells] += exits
+
+        # Insertion from the per-edge queues into the first cell of each lane
+        arrivals = self._arrivals()
+        self.loaded += arrivals.sum(axis=1)
+        self.source_queue += arrivals
+        first = self.lane_first
+        room = np.maximum(0.0, receive[:, first] - inflow[:, first])
+        want = self.source_queue[:, self._edge_lanes] / self._edge_lane_count[self._edge_lanes]
+        inserted = np.minimum(want, room)
+        self.source_queue -= self._scatter(self._scatter_edges, inserted)
+        inflow[:, first] += inserted
+
+        self.stayed = n - outflow
+        self.n = n + inflow - outflow
+        self.last_arrived = exits.sum(axis=1)
+        self.arrived += self.last_arrived
+        self.inserted += inserted.sum(axis=1)
+        self.time += self.dt
+
+    def lane_vehicles(self) -> np.ndarray:
+        """(replicas x lanes) vehicle counts"""
+        return self._scatter(self._scatter_lanes, self.n)
+
+    def lane_halting(self) -> np.ndarray:
+        """(replicas x lanes) vehicles that could not advance a cell in the last step"""
+        return self._scatter(self._scatter_lanes, np.maximum(self.stayed, 0.0))
+
+    def approach_totals(self, per_lane: np.ndarray) -> np.ndarray:
+        """Sum a (replicas x lanes) quantity over the incoming lanes of each approach, in DIRECTIONS order"""
+        totals = np.zeros((self.replicas, len(DIRECTIONS)))
+        np.add.at(totals, (slice(None), self.lane_index.approach), per_lane[:, self._approach_lanes])
+        return totals
+
+    def summary(self, replica: int = 0) -> Dict[str, float]:
+        """Network totals of one replica, named like SUMO summary-output attributes"""
+        return {
+            "time": self.time,
+            "loaded": float(self.loaded[replica]),
+            "inserted": float(self.inserted[replica]),
+            "running": float(self.n[replica].sum()),
+            "waiting": float(self.source_queue[replica].sum()),
+            "arrived": float(self.arrived[replica]),
+            "halting": float(np.maximum(self.stayed[replica], 0.0).sum()),
+        }
+
+
+def _compare(model: np.ndarray, reference: np.ndarray) -> Dict[str, float]:
+    error = model - reference
+    corr = float(np.corrcoef(model, reference)[0, 1]) if model.std() > 0 and reference.std() > 0 else None
+    return {"sumoMean": float(reference.mean()), "mesoMean": float(model.mean()),
+            "bias": float(error.mean()), "mae": float(np.abs(error).mean()),
+            "rmse": float(np.sqrt((error ** 2).mean())), "correlation": corr}
+
+
+def run_sumo_reference(config_file: str, route_files: Optional[Sequence[str]], steps: int,
+                       output_dir: str) -> str:
+    """Run SUMO headless on `config_file` (and `route_files`) for `steps` seconds; returns its summary-output"""
+    summary_path = os.path.join(output_dir, "summary.xml")
+    command = ["sumo", "--configuration-file", config_file, "--end", str(steps),
+               "--summary-output", summary_path, "--no-step-log", "--no-warnings"]
+    if route_files:
+        command += ["--route-files", ",".join(route_files)]
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    return summary_path
+
+
+def calibration_report(model: MesoscopicModel, summary_path: str, demand_tolerance: float = 0.05) -> Dict:
+    """Replay the net's fixed-time program in the model and compare it with a SUMO summary-output.
+
+    Series are compared step by step (running, halting, waiting, cumulative arrived);
+    throughput is compared as arrivals per hour. SUMO's own step cost is taken from the
+    summary's per-step `duration` (ms), giving the speed-up measured on the same run.
+
+    The summary must come from the model's own routes: if SUMO loaded a different number
+    of vehicles (beyond `demand_tolerance`), the comparison would measure the demand
+    rather than the model, so a ValueError is raised instead.
+    """
+    steps = list(iter_summary_steps(summary_path))
+    if not steps:
+        raise ValueError(f"No <step> records in {summary_path}")
+    fields = ("loaded", "running", "halting", "waiting", "arrived")
+    sumo = {f: np.array([s[f] for s in steps]) for f in fields}
+    meso = {f: np.zeros(len(steps)) for f in fields}
+
+    model.reset()
+    model.time = steps[0]["time"]
+    started = time.perf_counter()
+    for i, s in enumerate(steps):
+        # SUMO reports the state after executing step `time`
+        if model.default_tls is not None:
+            model.set_phase(model.program_phase_at(model.time))
+        model.step()
+        totals = model.summary()
+        for f in fields:
+            meso[f][i] = totals[f]
+    meso_seconds = time.perf_counter() - started
+
+    sumo_loaded, meso_loaded = sumo["loaded"][-1], meso["loaded"][-1]
+    if abs(meso_loaded - sumo_loaded) > demand_tolerance * max(sumo_loaded, 1.0):
+        raise ValueError(f"{summary_path} loaded {sumo_loaded:.0f} vehicles by t={steps[-1]['time']:g} but the "
+                         f"model's routes load {meso_loaded:.0f}; the summary comes from different demand "
+                         "(regenerate it with --run-sumo)")
+
+    duration = steps[-1]["time"] - steps[0]["time"] + model.dt
+    sumo_seconds = sum(s.get("duration", 0.0) for s in steps) / 1000.0
+    return {
+        "summary": summary_path,
+        "steps": len(steps),
+        "series": {f: _compare(meso[f], sumo[f]) for f in fields},
+        "throughput": {
+            "sumoArrivalsPerHour": float(sumo["arrived"][-1] * 3600.0 / duration),
+            "mesoArrivalsPerHour": float(meso["arrived"][-1] * 3600.0 / duration),
+        },
+        "timing": {
+            "mesoSeconds": meso_seconds,
+            "mesoStepsPerSecond": len(steps) / meso_seconds if meso_seconds else None,
+            "sumoSeconds": sumo_seconds or None,
+            "speedup": sumo_seconds / meso_seconds if sumo_seconds and meso_seconds else None,
+        },
+        "parameters": {
+            "jamSpacing": model.demand.jam_spacing,
+            "tau": model.demand.tau,
+            "saturationFlowPerLaneHour": float(model.max_flow.mean() / model.dt * 3600.0),
+            "cells": model.n.shape[1],
+            "links": len(model.link_up),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cell-transmission model of a SUMO scenario")
+    parser.add_argument("--config", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                         "sumo_configs", "intersection.sumo.cfg"))
+    parser.add_argument("--route-files", help="Comma-separated route files (default: those in the config)")
+    parser.add_argument("--saturation-flow", type=float, help="Override saturation flow (veh/h/lane)")
+    parser.add_argument("--calibrate", metavar="SUMMARY_XML",
+                        help="Compare against a SUMO summary-output produced from the same config and routes")
+    parser.add_argument("--run-sumo", action="store_true",
+                        help="Run SUMO on the same config and routes for --steps seconds and calibrate against it")
+    parser.add_argument("--steps", type=int, default=3600, help="Steps to run (or to run SUMO for with --run-sumo)")
+    parser.add_argument("--replicas", type=int, default=1, help="Independent copies advanced together")
+    args = parser.parse_args()
+
+    route_files = args.route_files.split(",") if args.route_files else None
+    calibrate = args.calibrate or args.run_sumo
+    model = MesoscopicModel.from_config(args.config, route_files, saturation_flow=args.saturation_flow,
+                                        replicas=1 if calibrate else args.replicas)
+    if calibrate:
+        try:
+            if args.run_sumo:
+                with tempfile.TemporaryDirectory() as output_dir:
+                    summary = run_sumo_reference(args.config, route_files, args.steps, output_dir)
+                    report = calibration_report(model, summary)
+            else:
+                report = calibration_report(model, args.calibrate)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+        print(json.dumps(report, indent=2))
+        return
+    started = time.perf_counter()
+    for _ in range(args.steps):
+        if model.default_tls is not None:
+            model.set_phase(model.program_phase_at(model.time))
+        model.step()
+    elapsed = time.perf_counter() - started
+    print(json.dumps({**model.summary(), "wallSeconds": elapsed, "stepsPerSecond": args.steps / elapsed,
+                      "replicaStepsPerSecond": args.steps * args.replicas / elapsed}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
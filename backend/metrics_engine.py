@@ -0,0 +1,195 @@
+import math
+import numpy as np
+from typing import Dict, List, Optional
+
+import traci
+import traci.constants as tc
+
+
+class RunningStats:
+    """Constant-memory mean/variance/min/max using Welford's online algorithm"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def push(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def variance(self) -> float:
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+    def to_dict(self) -> Dict:
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'std': self.std,
+            'min': self.min if self.count else 0.0,
+            'max': self.max if self.count else 0.0,
+        }
+
+
+class RingWindow:
+    """Fixed-size sliding window over a preallocated array with an O(1) running sum"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._values = np.zeros(size, dtype=np.float64)
+        self._pos = 0
+        self._filled = 0
+        self._sum = 0.0
+
+    def push(self, value: float):
+        self._sum += float(value) - float(self._values[self._pos])
+        self._values[self._pos] = value
+        self._pos = (self._pos + 1) % self.size
+        if self._filled < self.size:
+            self._filled += 1
+        if self._pos == 0:
+            # Re-sum once per wrap so floating-point drift cannot accumulate
+            self._sum = float(self._values.sum())
+
+    def __len__(self) -> int:
+        return self._filled
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    @property
+    def mean(self) -> float:
+        return self._sum / self._filled if self._filled else 0.0
+
+    def max(self) -> float:
+        return float(self._values[:self._filled].max()) if self._filled else 0.0
+
+    def percentile(self, q: float) -> float:
+        return float(np.percentile(self._values[:self._filled], q)) if self._filled else 0.0
+
+
+class OnlineMetricsEngine:
+    """Performance KPIs computed from per-step measurements in constant memory.
+
+    Each step is reduced to a handful of network totals (vehicles, halting vehicles,
+    accumulated waiting time, arrivals) which feed sliding windows for the live
+    dashboard and Welford accumulators for whole-run statistics. Per-step cost does not
+    depend on the number of vehicles: in SUMO mode the totals come from lane and
+    simulation subscriptions rather than per-vehicle queries.
+    """
+
+    def __init__(self, window: int = 300, step_length: float = 1.0):
+        self.window = window
+        self.step_length = step_length
+        self.lanes: List[str] = []
+
+        self.halting_window = RingWindow(window)
+        self.vehicle_window = RingWindow(window)
+        self.arrival_window = RingWindow(window)
+        self.waiting_window = RingWindow(window)
+
+        self.wait_time_stats = RunningStats()
+        self.queue_stats = RunningStats()
+        self.total_arrived = 0
+        self.total_halting_seconds = 0.0
+        self.max_queue = 0
+        self.current_queue = 0
+
+    def subscribe(self, lanes: List[str]):
+        """Register TraCI subscriptions for the lanes whose traffic is measured"""
+        self.lanes = list(lanes)
+        for lane in self.lanes:
+            traci.lane.subscribe(lane, [tc.LAST_STEP_VEHICLE_NUMBER,
+                                        tc.LAST_STEP_VEHICLE_HALTING_NUMBER,
+                                        tc.VAR_WAITING_TIME])
+        traci.simulation.subscribe([tc.VAR_ARRIVED_VEHICLES_NUMBER])
+
+    def update_from_subscriptions(self):
+        """Consume this step's subscription results"""
+        lane_results = traci.lane.getAllSubscriptionResults()
+        vehicles = 0
+        halting = 0
+        waiting = 0.0
+        max_queue = 0
+        for lane in self.lanes:
+            values = lane_results.get(lane)
+            if not values:
+                continue
+            vehicles += values[tc.LAST_STEP_VEHICLE_NUMBER]
+            lane_halting = values[tc.LAST_STEP_VEHICLE_HALTING_NUMBER]
+            halting += lane_halting
+            waiting += values[tc.VAR_WAITING_TIME]
+            max_queue = max(max_queue, lane_halting)
+        sim_results = traci.simulation.getSubscriptionResults()
+        arrived = sim_results.get(tc.VAR_ARRIVED_VEHICLES_NUMBER, 0)
+        self.update(vehicles, halting, arrived, max_queue, waiting)
+
+    def update(self, vehicles: int, halting: int, arrived: int, max_queue: int,
+               waiting_time: Optional[float] = None):
+        """Feed one step of network totals (used directly by replay and fallback modes)"""
+        if waiting_time is None:
+            # Every halting vehicle has waited one more step
+            waiting_time = halting * self.step_length
+        self.vehicle_window.push(vehicles)
+        self.halting_window.push(halting)
+        self.arrival_window.push(arrived)
+        self.waiting_window.push(waiting_time / vehicles if vehicles else 0.0)
+
+        self.total_arrived += arrived
+        self.total_halting_seconds += halting * self.step_length
+        self.current_queue = max_queue
+        self.max_queue = max(self.max_queue, max_queue)
+        self.queue_stats.push(max_queue)
+        self.wait_time_stats.push(self.average_wait_time())
+
+    def average_wait_time(self) -> float:
+        """Mean delay per served vehicle over the window.
+
+        Halting vehicle-seconds divided by arrivals is the mean delay per trip once the
+        network is in steady state; before any arrivals the mean accumulated waiting time
+        of vehicles on the measured lanes is used instead.
+        """
+        arrivals = self.arrival_window.sum
+        if arrivals > 0:
+            return self.halting_window.sum * self.step_length / arrivals
+        return self.waiting_window.mean
+
+    def snapshot(self) -> Dict:
+        """Current KPIs in the performance payload format; reading them changes nothing"""
+        avg_wait_time = self.average_wait_time()
+
+        window_seconds = len(self.arrival_window) * self.step_length
+        throughput = self.arrival_window.sum * 3600.0 / window_seconds if window_seconds else 0.0
+        vehicles = self.vehicle_window.sum
+        efficiency_score = 100.0 * (1.0 - self.halting_window.sum / vehicles) if vehicles else 100.0
+
+        return {
+            'avgWaitTime': avg_wait_time,
+            'throughput': int(round(throughput)),
+            'maxQueue': int(self.current_queue),
+            'efficiencyScore': efficiency_score,
+        }
+
+    def run_summary(self) -> Dict:
+        """Whole-run statistics"""
+        return {
+            'avgWaitTime': self.wait_time_stats.to_dict(),
+            'maxQueue': self.queue_stats.to_dict(),
+            'peakQueue': self.max_queue,
+            'arrived': self.total_arrived,
+            'delayPerVehicle': self.total_halting_seconds / self.total_arrived if self.total_arrived else 0.0,
+        }
@@ -0,0 +1,310 @@
+import os
+import sys
+import gzip
+import json
+import math
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+NET_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "net_cache")
+# Bump when the compiled layout changes so stale caches are rebuilt, not misread
+FORMAT_VERSION = 1
+# Approach labels by compass side; must match sumo_bridge.DIRECTIONS
+DIRECTIONS = ['north', 'south', 'east', 'west']
+# Arrays written by compile_net, memory-mapped by NetIndex
+ARRAYS = ("lane_ids", "lane_edge", "lane_length", "lane_speed", "lane_passenger", "lane_end",
+          "edge_ids", "edge_from_xy", "conn_from", "conn_to", "conn_tls", "conn_link", "conn_approach")
+
+
+def _open_xml(path: str):
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+
+def _allows_passenger(allow: Optional[str], disallow: Optional[str]) -> bool:
+    """sumolib's Lane.allows("passenger") for the raw allow/disallow attributes"""
+    if allow is not None:
+        classes = allow.split()
+        return "all" in classes or "passenger" in classes
+    if disallow is not None:
+        classes = disallow.split()
+        return "all" not in classes and "passenger" not in classes
+    return True
+
+
+def content_hash(net_file: str) -> str:
+    """sha256 of the net file, remembered per (path, size, mtime) so unchanged nets are not rehashed"""
+    stat = os.stat(net_file)
+    sources_path = os.path.join(NET_CACHE_DIR, "sources.json")
+    path = os.path.abspath(net_file)
+    try:
+        with open(sources_path) as f:
+            sources = json.load(f)
+    except (OSError, ValueError):
+        sources = {}
+    known = sources.get(path)
+    if known and known["size"] == stat.st_size and known["mtimeNs"] == stat.st_mtime_ns:
+        return known["sha256"]
+
+    digest = hashlib.sha256()
+    with open(net_file, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    sources[path] = {"size": stat.st_size, "mtimeNs": stat.st_mtime_ns, "sha256": digest.hexdigest()}
+    os.makedirs(NET_CACHE_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=NET_CACHE_DIR, suffix=".json")
+    with os.fdopen(fd, "w") as f:
+        json.dump(sources, f)
+    os.replace(tmp, sources_path)
+    return sources[path]["sha256"]
+
+
+def _parse_net(net_file: str) -> Tuple[Dict[str, np.ndarray], Dict]:
+    """Stream the net XML once, keeping only what the simulators and feature builders use.
+
+    Mirrors sumolib.net.readNet(withPrograms=True) without internal edges: lanes in
+    file order, connections between non-internal lanes in file order, traffic lights
+    in order of first mention and the first program of each.
+    """
+    lane_ids, lane_edge, lane_length, lane_speed, lane_passenger, lane_end = [], [], [], [], [], []
+    edge_ids, edge_nodes = [], []
+    node_xy: Dict[str, Tuple[float, float]] = {}
+    connections = []
+    tls_ids: List[str] = []
+    programs: Dict[str, List[Tuple[str, float]]] = {}
+    edge_slot: Dict[str, int] = {}
+    current_edge = None
+    current_program = None
+    root = None
+
+    with _open_xml(net_file) as source:
+        for event, elem in ET.iterparse(source, events=("start", "end")):
+            tag = elem.tag
+            if event == "start":
+                if root is None:
+                    root = elem
+                if tag == "edge":
+                    internal = elem.get("function") == "internal" or elem.get("id", "").startswith(":")
+                    current_edge = None if internal else elem.get("id")
+                    if current_edge is not None:
+                        edge_slot[current_edge] = len(edge_ids)
+                        edge_ids.append(current_edge)
+                        edge_nodes.append((elem.get("from"), elem.get("to")))
+                elif tag == "tlLogic":
+                    tls_id = elem.get("id")
+                    if tls_id not in programs:
+                        if tls_id not in tls_ids:
+                            tls_ids.append(tls_id)
+                        programs[tls_id] = []
+                        current_program = programs[tls_id]
+                continue
+
+            if tag == "lane" and current_edge is not None:
+                lane_ids.append(elem.get("id"))
+                lane_edge.append(edge_slot[current_edge])
+                lane_length.append(float(elem.get("length")))
+                lane_speed.append(float(elem.get("speed")))
+                lane_passenger.append(_allows_passenger(elem.get("allow"), elem.get("disallow")))
+                x, y = elem.get("shape").split()[-1].split(",")[:2]
+                lane_end.append((float(x), float(y)))
+            elif tag == "edge":
+                current_edge = None
+            elif tag == "junction":
+                node_xy[elem.get("id")] = (float(elem.get("x")), float(elem.get("y")))
+            elif tag == "phase" and current_program is not None:
+                current_program.append((elem.get("state"), float(elem.get("duration"))))
+            elif tag == "tlLogic":
+                current_program = None
+            elif tag == "connection":
+                connections.append((elem.get("from"), elem.get("fromLane"), elem.get("to"), elem.get("toLane"),
+                                    elem.get("tl"), int(elem.get("linkIndex", -1))))
+            if tag in ("edge", "junction", "connection", "tlLogic"):
+                root.clear()  # Drop finished top-level elements so memory stays flat on city-scale nets
+
+    lane_slot = {lane_id: i for i, lane_id in enumerate(lane_ids)}
+    tls_slot = {tls_id: i for i, tls_id in enumerate(tls_ids)}
+    conn_from, conn_to, conn_tls, conn_link = [], [], [], []
+    for from_edge, from_lane, to_edge, to_lane, tl, link in connections:
+        source = lane_slot.get(f"{from_edge}_{from_lane}")
+        target = lane_slot.get(f"{to_edge}_{to_lane}")
+        if source is None or target is None:
+            continue  # Involves an internal edge
+        if tl and tl not in tls_slot:
+            tls_slot[tl] = len(tls_ids)
+            tls_ids.append(tl)
+        conn_from.append(source)
+        conn_to.append(target)
+        conn_tls.append(tls_slot[tl] if tl else -1)
+        conn_link.append(link)
+
+    arrays = {
+        "lane_ids": np.array(lane_ids, dtype=str),
+        "lane_edge": np.array(lane_edge, dtype=np.int32),
+        "lane_length": np.array(lane_length, dtype=np.float64),
+        "lane_speed": np.array(lane_speed, dtype=np.float64),
+        "lane_passenger": np.array(lane_passenger, dtype=bool),
+        "lane_end": np.array(lane_end, dtype=np.float64).reshape(-1, 2),
+        "edge_ids": np.array(edge_ids, dtype=str),
+        "edge_from_xy": np.array([node_xy.get(a, (math.nan, math.nan)) for a, _ in edge_nodes],
+                                 dtype=np.float64).reshape(-1, 2),
+        "conn_from": np.array(conn_from, dtype=np.int32),
+        "conn_to": np.array(conn_to, dtype=np.int32),
+        "conn_tls": np.array(conn_tls, dtype=np.int32),
+        "conn_link": np.array(conn_link, dtype=np.int32),
+    }
+    arrays["conn_approach"] = _approach_groups(arrays, len(tls_ids))
+    meta = {"tlsIds": tls_ids, "programs": {tls_id: programs.get(tls_id, []) for tls_id in tls_ids}}
+    return arrays, meta
+
+
+def _approach_groups(arrays: Dict[str, np.ndarray], tls_count: int) -> np.ndarray:
+    """Compass side (DIRECTIONS index) each signalised connection's incoming edge arrives from.
+
+    The side is the angle from the centre of the light's stop lines to the edge's
+    start node; SUMO's y axis points north.
+    """
+    approach = np.full(len(arrays["conn_from"]), -1, dtype=np.int8)
+    conns = np.flatnonzero(arrays["conn_tls"] >= 0)
+    tls, lanes = arrays["conn_tls"][conns], arrays["conn_from"][conns]
+
+    # Centre of each light's distinct incoming stop lines
+    pairs = np.unique(tls.astype(np.int64) * len(arrays["lane_ids"]) + lanes)
+    pair_tls, pair_lane = np.divmod(pairs, len(arrays["lane_ids"]))
+    count = np.bincount(pair_tls, minlength=tls_count)
+    ends = arrays["lane_end"][pair_lane]
+    cx = np.bincount(pair_tls, weights=ends[:, 0], minlength=tls_count) / np.maximum(count, 1)
+    cy = np.bincount(pair_tls, weights=ends[:, 1], minlength=tls_count) / np.maximum(count, 1)
+
+    x, y = arrays["edge_from_xy"][arrays["lane_edge"][lanes]].T
+    angle = np.degrees(np.arctan2(y - cy[tls], x - cx[tls])) % 360
+    side = ((angle + 45) % 360 // 90).astype(int)                    # 0 east, 1 north, 2 west, 3 south
+    approach[conns] = np.array([DIRECTIONS.index(d) for d in ('east', 'north', 'west', 'south')])[side]
+    return approach
+
+
+def compile_net(net_file: str, key: Optional[str] = None) -> str:
+    """Compile `net_file` into the cache (if not already there) and return its directory"""
+    key = key or content_hash(net_file)
+    target = os.path.join(NET_CACHE_DIR, key)
+    if os.path.exists(os.path.join(target, "meta.json")):
+        return target
+    arrays, meta = _parse_net(net_file)
+    meta.update({"formatVersion": FORMAT_VERSION, "sha256": key, "source": os.path.abspath(net_file),
+                 "compiledAt": time.time()})
+
+    # Built in a scratch directory and renamed into place, so readers never see half a cache
+    os.makedirs(NET_CACHE_DIR, exist_ok=True)
+    scratch = tempfile.mkdtemp(dir=NET_CACHE_DIR, prefix=".build-")
+    try:
+        for name in ARRAYS:
+            np.save(os.path.join(scratch, name + ".npy"), arrays[name])
+        with open(os.path.join(scratch, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        os.rename(scratch, target)
+    except OSError:
+        # Another process compiled the same net first
+        shutil.rmtree(scratch, ignore_errors=True)
+        if not os.path.exists(os.path.join(target, "meta.json")):
+            raise
+    return target
+
+
+class NetIndex:
+    """Read-only view of a compiled net; arrays are memory-mapped from the cache.
+
+    Lanes are the non-internal lanes in file order (`lane_*` arrays), connections link
+    lane slots (`conn_*`, with `conn_tls` indexing `tls_ids` or -1 and `conn_approach`
+    the DIRECTIONS index of a signalised connection's approach).
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json")) as f:
+            self.meta = json.load(f)
+        if self.meta.get("formatVersion") != FORMAT_VERSION:
+            raise ValueError(f"{directory} was compiled with an incompatible format")
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(directory, name + ".npy"), mmap_mode="r"))
+        self.tls_ids: List[str] = self.meta["tlsIds"]
+        self.programs: Dict[str, List[Tuple[str, float]]] = {
+            tls_id: [(state, duration) for state, duration in phases]
+            for tls_id, phases in self.meta["programs"].items()
+        }
+        self._lane_slot: Optional[Dict[str, int]] = None
+
+    @property
+    def lane_slot(self) -> Dict[str, int]:
+        if self._lane_slot is None:
+            self._lane_slot = {lane_id: i for i, lane_id in enumerate(self.lane_ids.tolist())}
+        return self._lane_slot
+
+    def controlled_connections(self, tls_id: str) -> np.ndarray:
+        """Positions of the light's connections, in link-index order"""
+        conns = np.flatnonzero(np.asarray(self.conn_tls) == self.tls_ids.index(tls_id))
+        return conns[np.argsort(self.conn_link[conns], kind="stable")]
+
+    def outgoing(self) -> List[np.ndarray]:
+        """Connection positions leaving each lane, in file order"""
+        order = np.argsort(self.conn_from, kind="stable")
+        bounds = np.searchsorted(self.conn_from[order], np.arange(len(self.lane_ids) + 1))
+        return [order[bounds[i]:bounds[i + 1]] for i in range(len(self.lane_ids))]
+
+    def describe(self) -> Dict:
+        return {
+            "sha256": self.meta["sha256"],
+            "source": self.meta["source"],
+            "lanes": len(self.lane_ids),
+            "edges": len(self.edge_ids),
+            "connections": len(self.conn_from),
+            "trafficLights": len(self.tls_ids),
+        }
+
+
+_loaded: Dict[str, NetIndex] = {}
+
+
+def load_net_index(net_file: str) -> NetIndex:
+    """Compiled index of `net_file`, compiling it on first use or after the file changed"""
+    key = content_hash(net_file)
+    index = _loaded.get(key)
+    if index is None:
+        try:
+            index = NetIndex(compile_net(net_file, key))
+        except ValueError:
+            # Stale format: recompile in place
+            shutil.rmtree(os.path.join(NET_CACHE_DIR, key), ignore_errors=True)
+            index = NetIndex(compile_net(net_file, key))
+        _loaded[key] = index
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile SUMO nets into the memory-mapped index cache")
+    parser.add_argument("nets", nargs="+", help=".net.xml(.gz) files, or .sumo.cfg files referencing them")
+    parser.add_argument("--force", action="store_true", help="Recompile even if a cached index exists")
+    args = parser.parse_args()
+
+    from sumo_bridge import net_file_from_config
+    for path in args.nets:
+        net_file = net_file_from_config(path) if path.endswith(".sumo.cfg") else path
+        key = content_hash(net_file)
+        if args.force:
+            shutil.rmtree(os.path.join(NET_CACHE_DIR, key), ignore_errors=True)
+        started = time.perf_counter()
+        compile_net(net_file, key)
+        compiled = time.perf_counter() - started
+        _loaded.pop(key, None)
+        started = time.perf_counter()
+        index = load_net_index(net_file)
+        loaded = time.perf_counter() - started
+        print(json.dumps({**index.describe(), "compileSeconds": compiled, "loadSeconds": loaded}), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
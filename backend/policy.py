@@ -0,0 +1,55 @@
+import numpy as np
+from typing import List, Optional
+
+
+class PolicySnapshot:
+    """Immutable copy of the Q-network's weights with a NumPy forward pass.
+
+    Matches the Dense/ReLU stack built by `DQNAgent._build_model` (linear output layer).
+    Snapshots are never modified after construction, so readers on other threads can
+    use one without locking while a newer snapshot is being published.
+    """
+
+    def __init__(self, weights: List[np.ndarray], version: int = 0):
+        if len(weights) % 2:
+            raise ValueError("Expected alternating kernel/bias arrays")
+        self.layers = [(np.array(weights[i], dtype=np.float32), np.array(weights[i + 1], dtype=np.float32))
+                       for i in range(0, len(weights), 2)]
+        for kernel, bias in self.layers:
+            kernel.setflags(write=False)
+            bias.setflags(write=False)
+        self.version = version
+        self.state_size = self.layers[0][0].shape[0]
+        self.action_size = self.layers[-1][0].shape[1]
+
+    def q_values(self, states: np.ndarray) -> np.ndarray:
+        """Q-values for a batch of states, shape (batch, action_size)"""
+        x = np.asarray(states, dtype=np.float32).reshape(-1, self.state_size)
+        last = len(self.layers) - 1
+        for i, (kernel, bias) in enumerate(self.layers):
+            x = x @ kernel + bias
+            if i < last:
+                np.maximum(x, 0.0, out=x)
+        return x
+
+    def act(self, state: np.ndarray) -> int:
+        """Greedy action for a single state"""
+        return int(np.argmax(self.q_values(state)[0]))
+
+    def save(self, filepath: str):
+        """Write the weights as an .npz archive (no TensorFlow needed to load it)"""
+        arrays = {}
+        for i, (kernel, bias) in enumerate(self.layers):
+            arrays[f"kernel_{i}"] = kernel
+            arrays[f"bias_{i}"] = bias
+        np.savez(filepath, version=np.int64(self.version), **arrays)
+
+    @classmethod
+    def load(cls, filepath: str, version: Optional[int] = None) -> "PolicySnapshot":
+        with np.load(filepath) as data:
+            count = sum(1 for key in data.files if key.startswith("kernel_"))
+            weights = []
+            for i in range(count):
+                weights.extend([data[f"kernel_{i}"], data[f"bias_{i}"]])
+            stored_version = int(data["version"]) if "version" in data.files else 0
+        return cls(weights, stored_version if version is None else version)
@@ -0,0 +1,237 @@
+import os
+import re
+import sys
+import time
+import asyncio
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from backend.policy import PolicySnapshot
+
+POLICY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "policies")
+# Exported by the main simulation run; sessions export as session-<id>
+DEFAULT_POLICY = "current"
+POLICY_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+class NoPolicyError(Exception):
+    """Raised when a prediction is requested before any policy has been exported"""
+
+
+def policy_path(name: str, directory: str = POLICY_DIR) -> str:
+    if not POLICY_NAME_PATTERN.match(name):
+        raise ValueError(f"Invalid policy name: {name}")
+    return os.path.join(directory, name + ".npz")
+
+
+class PolicyRegistry:
+    """The policy served by the predict endpoints, swapped in place when a newer file appears.
+
+    The active policy's file is re-checked at most every `check_interval` seconds, so
+    a training run that keeps exporting is picked up without a restart. Swapping only
+    replaces the `snapshot` reference; batches already running keep the one they took.
+    """
+
+    def __init__(self, directory: str = POLICY_DIR, name: str = DEFAULT_POLICY, check_interval: float = 0.5):
+        self.directory = directory
+        self.name = name
+        self.check_interval = check_interval
+        self.snapshot: Optional[PolicySnapshot] = None
+        self.loaded_at: Optional[float] = None
+        self.swaps = 0
+        self._mtime_ns: Optional[int] = None
+        self._checked_at = 0.0
+
+    def current(self) -> Optional[PolicySnapshot]:
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            try:
+                self._load_if_changed()
+            except Exception as e:
+                # Keep serving the previous policy
+                print(f"Could not reload policy {self.name}: {e}", file=sys.stderr)
+        return self.snapshot
+
+    def _load_if_changed(self):
+        path = policy_path(self.name, self.directory)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime_ns == self._mtime_ns:
+            return
+        self.snapshot = PolicySnapshot.load(path)
+        self._mtime_ns = mtime_ns
+        self.loaded_at = time.time()
+        self.swaps += 1
+
+    def select(self, name: str) -> PolicySnapshot:
+        """Serve the policy exported under `name` from now on"""
+        path = policy_path(name, self.directory)
+        snapshot = PolicySnapshot.load(path)  # Raises before anything is swapped
+        self.name, self.snapshot = name, snapshot
+        self._mtime_ns = os.stat(path).st_mtime_ns
+        self._checked_at = time.monotonic()
+        self.loaded_at = time.time()
+        self.swaps += 1
+        return snapshot
+
+    def available(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-len(".npz")] for name in os.listdir(self.directory)
+                      if name.endswith(".npz") and not name.endswith(".tmp.npz"))
+
+    def describe(self) -> Dict:
+        snapshot = self.current()
+        return {
+            "name": self.name,
+            "loaded": snapshot is not None,
+            "version": snapshot.version if snapshot else None,
+            "stateSize": snapshot.state_size if snapshot else None,
+            "actionSize": snapshot.action_size if snapshot else None,
+            "loadedAt": self.loaded_at,
+            "swaps": self.swaps,
+            "available": self.available(),
+        }
+
+
+class _Request:
+    __slots__ = ("states", "future")
+
+    def __init__(self, states: np.ndarray, future: asyncio.Future):
+        self.states = states
+        self.future = future
+
+
+class MicroBatcher:
+    """Coalesce concurrent predict calls into single forward passes.
+
+    Requests are queued and a single loop task runs them as one batch. Under load
+    (the previous batch held more than one request) the loop holds a batch open for
+    up to `max_wait` seconds, or until `max_batch` states are queued, to let more
+    callers join; a lone caller is served at once instead of paying the wait. A batch
+    holds at most `max_batch` states (but always at least one request). Each
+    batch takes the registry's current snapshot once, so a hot swap never splits or
+    drops a batch.
+    """
+
+    def __init__(self, registry: PolicyRegistry, max_wait: float = 0.002, max_batch: int = 1024):
+        self.registry = registry
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self._pending: Deque[_Request] = deque()
+        self._pending_rows = 0
+        self._arrived: Optional[asyncio.Event] = None
+        self._full: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_batch_requests = 0
+        self.batches = 0
+        self.requests = 0
+        self.rows = 0
+
+    def start(self):
+        if self._task is None:
+            self._arrived = asyncio.Event()
+            self._full = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def predict(self, states) -> Tuple[np.ndarray, np.ndarray, int]:
+        """Greedy actions, Q-values and policy version for one state or a batch of states"""
+        self.start()
+        states = np.asarray(states, dtype=np.float32)
+        if states.ndim == 1:
+            states = states[None, :]
+        if states.ndim != 2 or len(states) == 0:
+            raise ValueError("Expected a state vector or a non-empty list of state vectors")
+        snapshot = self.registry.current()
+        if snapshot is None:
+            raise NoPolicyError(f"No policy exported as {self.registry.name!r} yet")
+        if states.shape[1] != snapshot.state_size:
+            raise ValueError(f"Expected states of length {snapshot.state_size}, got {states.shape[1]}")
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(_Request(states, future))
+        self._pending_rows += len(states)
+        self._arrived.set()
+        if self._pending_rows >= self.max_batch:
+            self._full.set()
+        return await future
+
+    async def _run(self):
+        while True:
+            await self._arrived.wait()
+            if self.max_wait > 0 and self._last_batch_requests > 1 and self._pending_rows < self.max_batch:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.max_wait)
+                except asyncio.TimeoutError:
+                    pass
+            batch, rows = [], 0
+            while self._pending and (rows < self.max_batch or not batch):
+                request = self._pending.popleft()
+                batch.append(request)
+                rows += len(request.states)
+            self._pending_rows -= rows
+            if not self._pending:
+                self._arrived.clear()
+            if self._pending_rows < self.max_batch:
+                self._full.clear()
+            self._last_batch_requests = len(batch)
+            self._execute(batch)
+            await asyncio.sleep(0)  # Let the callers of this batch resume before the next one
+
+    def _execute(self, batch: List[_Request]):
+        snapshot = self.registry.current()
+        if snapshot is not None:
+            # A swap to a policy with a different input size rejects requests validated against the old one
+            mismatched = [r for r in batch if r.states.shape[1] != snapshot.state_size]
+            for request in mismatched:
+                if not request.future.done():
+                    request.future.set_exception(
+                        ValueError(f"Expected states of length {snapshot.state_size}, got {request.states.shape[1]}"))
+            if mismatched:
+                batch = [r for r in batch if r.states.shape[1] == snapshot.state_size]
+                if not batch:
+                    return
+        try:
+            if snapshot is None:
+                raise NoPolicyError(f"No policy exported as {self.registry.name!r} yet")
+            states = batch[0].states if len(batch) == 1 else np.concatenate([r.states for r in batch])
+            q_values = snapshot.q_values(states)
+        except Exception as e:
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+        actions = q_values.argmax(axis=1)
+        self.batches += 1
+        self.requests += len(batch)
+        self.rows += len(states)
+        start = 0
+        for request in batch:
+            end = start + len(request.states)
+            if not request.future.done():  # The caller may have gone away
+                request.future.set_result((actions[start:end], q_values[start:end], snapshot.version))
+            start = end
+
+    def describe(self) -> Dict:
+        return {
+            "maxWaitMs": self.max_wait * 1000,
+            "maxBatch": self.max_batch,
+            "batches": self.batches,
+            "requests": self.requests,
+            "states": self.rows,
+            "meanRequestsPerBatch": self.requests / self.batches if self.batches else None,
+        }
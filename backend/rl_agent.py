@@ -1,24 +1,31 @@
 import numpy as np
 import random
+import threading
 from collections import deque
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 import tensorflow as tf
 from tensorflow import keras
 from tensorflow.keras import layers
+from policy import PolicySnapshot
 
 class DQNAgent:
-    def __init__(self, state_size: int, action_size: int, learning_rate: float = 0.001):
+    def __init__(self, state_size: int, action_size: int, learning_rate: float = 0.001,
+                 gamma: float = 0.95, epsilon_decay: float = 0.995, epsilon_min: float = 0.01,
+                 batch_size: int = 32, memory_size: int = 10000):
         self.state_size = state_size
         self.action_size = action_size
         self.learning_rate = learning_rate
         
         # Hyperparameters
         self.epsilon = 1.0  # Exploration rate
-        self.epsilon_min = 0.01
-        self.epsilon_decay = 0.995
-        self.memory = deque(maxlen=10000)
-        self.batch_size = 32
-        self.gamma = 0.95  # Discount factor
+        self.epsilon_min = epsilon_min
+        self.epsilon_decay = epsilon_decay
+        self.memory = deque(maxlen=memory_size)
+        # Guards the replay buffer when a learner thread samples while the actor appends
+        self.memory_lock = threading.Lock()
+        self.weights_version = 0
+        self.batch_size = batch_size
+        self.gamma = gamma  # Discount factor
         
         # Neural networks
         self.q_network = self._build_model()
@@ -44,22 +51,28 @@ class DQNAgent:
     def remember(self, state: np.ndarray, action: int, reward: float, 
                  next_state: np.ndarray, done: bool):
         """Store experience in replay buffer"""
-        self.memory.append((state, action, reward, next_state, done))
+        with self.memory_lock:
+            self.memory.append((state, action, reward, next_state, done))
     
     def act(self, state: np.ndarray) -> int:
         """Choose action using epsilon-greedy policy"""
+        return self.act_with_q_values(state)[0]
+
+    def act_with_q_values(self, state: np.ndarray) -> Tuple[int, Optional[np.ndarray]]:
+        """Epsilon-greedy action plus the Q-values it was chosen from (None when exploring)"""
         if np.random.random() <= self.epsilon:
-            return random.randrange(self.action_size)
+            return random.randrange(self.action_size), None
         
-        q_values = self.q_network.predict(state.reshape(1, -1), verbose=0)
-        return np.argmax(q_values[0])
+        q_values = self.q_network.predict(state.reshape(1, -1), verbose=0)[0]
+        return int(np.argmax(q_values)), q_values
     
     def replay(self):
         """Train the model on a batch of experiences"""
         if len(self.memory) < self.batch_size:
             return
         
-        batch = random.sample(self.memory, self.batch_size)
+        with self.memory_lock:
+            batch = random.sample(self.memory, self.batch_size)
         states = np.array([e[0] for e in batch])
         actions = np.array([e[1] for e in batch])
         rewards = np.array([e[2] for e in batch])
@@ -82,11 +95,16 @@ class DQNAgent:
         
         # Train the model
         self.q_network.fit(states, targets, epochs=1, verbose=0)
+        self.weights_version += 1
         
         # Decay epsilon
         if self.epsilon > self.epsilon_min:
             self.epsilon *= self.epsilon_decay
     
+    def policy_snapshot(self) -> PolicySnapshot:
+        """Copy the current Q-network weights into a read-only NumPy policy"""
+        return PolicySnapshot(self.q_network.get_weights(), self.weights_version)
+
     def update_target_model(self):
         """Update target network weights"""
         self.target_network.set_weights(self.q_network.get_weights())
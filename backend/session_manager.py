@@ -0,0 +1,324 @@
+import os
+import sys
+import json
+import time
+import uuid
+import signal
+import asyncio
+import resource
+from typing import Any, Dict, List, Optional, Set
+
+from fastapi import WebSocket
+
+from backend.storage import MemStorage
+from backend.frame_log import FrameLogWriter, FRAME_LOG_DIR, log_paths
+from backend.sweep import THREAD_ENV_VARS
+from backend.policy_server import policy_path
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_PATH = os.path.join(BACKEND_DIR, "traffic_simulation.py")
+SUMO_CONFIG_DIR = os.path.join(BACKEND_DIR, "sumo_configs")
+
+# Session config keys forwarded to traffic_simulation.py as --flags
+SIMULATION_FLAGS = ("steps", "learning_rate", "gamma", "epsilon_decay", "batch_size", "memory_size",
+                    "episode_length", "target_sync_episodes", "train_every", "gradient_steps", "sensing",
+                    "detector_length")
+# stdout frames carry the vehicle list and can exceed asyncio's 64 KiB default line limit
+STREAM_LIMIT = 16 * 2**20
+# Seconds between resident-memory checks of a session's process tree
+MEMORY_POLL_INTERVAL = 1.0
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+class SessionLimitError(Exception):
+    """Raised when starting a session would exceed the concurrent session cap"""
+
+
+def resolve_config_file(name: str) -> str:
+    """Path of a file in sumo_configs/; clients name files, they never pass paths"""
+    path = os.path.join(SUMO_CONFIG_DIR, os.path.basename(name))
+    if not os.path.isfile(path):
+        raise ValueError(f"Unknown SUMO file: {name}")
+    return path
+
+
+def process_tree(pid: int) -> List[int]:
+    """`pid` and all its descendants, from /proc (just `pid` where /proc is unavailable)"""
+    children: Dict[int, List[int]] = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return [pid]
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "rb") as f:
+                stat = f.read()
+        except OSError:
+            continue  # Exited since listdir
+        # Fields after the parenthesised command name: state, ppid, ...
+        ppid = int(stat[stat.rindex(b")") + 2:].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+    tree = [pid]
+    for parent in tree:
+        tree.extend(children.get(parent, ()))
+    return tree
+
+
+def resident_bytes(pids: List[int]) -> int:
+    """Summed resident set size of `pids`; processes that have exited count as zero"""
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/statm", "rb") as f:
+                total += int(f.read().split()[1]) * PAGE_SIZE
+        except (OSError, IndexError, ValueError):
+            continue
+    return total
+
+
+class Session:
+    """One simulation subprocess with its own storage namespace and websocket channel"""
+
+    def __init__(self, session_id: str, config: Dict[str, Any], cpus: Optional[Set[int]] = None):
+        self.id = session_id
+        self.config = config
+        self.cpus = cpus
+        self.storage = MemStorage()
+        self.websockets: Set[WebSocket] = set()
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.status = "starting"
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.returncode: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def is_running(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    def command(self) -> List[str]:
+        cmd = [sys.executable, SCRIPT_PATH]
+        if self.config.get("sumo_config"):
+            cmd += ["--config", resolve_config_file(self.config["sumo_config"])]
+        if self.config.get("route_files"):
+            cmd += ["--route-files", ",".join(resolve_config_file(f) for f in self.config["route_files"])]
+        if self.config.get("realtime_factor"):
+            cmd += ["--realtime-factor", str(self.config["realtime_factor"])]
+        for key in SIMULATION_FLAGS:
+            if self.config.get(key) is not None:
+                cmd += ["--" + key.replace("_", "-"), str(self.config[key])]
+        if self.config.get("async_learner"):
+            cmd.append("--async-learner")
+        cmd += ["--policy-export", policy_path(f"session-{self.id}")]
+        return cmd
+
+    async def broadcast(self, data: Dict):
+        for websocket in list(self.websockets):
+            try:
+                await websocket.send_json(data)
+            except Exception:
+                self.websockets.discard(websocket)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "isRunning": self.is_running(),
+            "config": self.config,
+            "pid": self.process.pid if self.process else None,
+            "cpus": sorted(self.cpus) if self.cpus else None,
+            "createdAt": self.created_at,
+            "finishedAt": self.finished_at,
+            "returnCode": self.returncode,
+            "error": self.error,
+            "clients": len(self.websockets),
+            "recording": f"session-{self.id}",
+            "policy": f"session-{self.id}",
+        }
+
+
+class SessionManager:
+    """Run several simulations side by side, each isolated in its own process.
+
+    Every session gets a private `MemStorage` and websocket set, so analysts working on
+    different scenarios never see each other's frames. Isolation is enforced with a
+    per-process CPU-seconds rlimit, CPU pinning and capped library thread pools;
+    `max_sessions` bounds how many run at once. `memory_mb` caps the resident memory of
+    the session's whole process tree (the simulation and the SUMO it starts), checked
+    every MEMORY_POLL_INTERVAL seconds; a session over the cap is killed. Address-space
+    limits are not used, since TensorFlow reserves far more virtual memory than it touches.
+
+    Finished sessions are dropped, together with their frame log, `finished_ttl`
+    seconds after they end (checked whenever the manager is consulted).
+    """
+
+    def __init__(self, max_sessions: int = 4, cpus_per_session: int = 1,
+                 cpu_seconds: Optional[int] = None, memory_mb: Optional[int] = None,
+                 finished_ttl: Optional[float] = 3600.0):
+        self.max_sessions = max_sessions
+        self.cpus_per_session = cpus_per_session
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.finished_ttl = finished_ttl
+        self.sessions: Dict[str, Session] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        if memory_mb and not os.path.isdir("/proc"):
+            print("Warning: /proc is unavailable, session memory limits are not enforced", file=sys.stderr)
+
+    def running(self) -> List[Session]:
+        return [s for s in self.sessions.values() if s.status in ("starting", "running")]
+
+    def get(self, session_id: str) -> Optional[Session]:
+        self._reap()
+        return self.sessions.get(session_id)
+
+    def describe(self) -> List[Dict[str, Any]]:
+        self._reap()
+        return [s.to_dict() for s in self.sessions.values()]
+
+    def _reap(self):
+        """Drop sessions that finished more than `finished_ttl` seconds ago"""
+        if self.finished_ttl is None:
+            return
+        cutoff = time.time() - self.finished_ttl
+        for session in list(self.sessions.values()):
+            if session.finished_at is not None and session.finished_at < cutoff:
+                self._discard(session)
+
+    def _discard(self, session: Session):
+        """Forget a finished session and delete its frame log"""
+        self.sessions.pop(session.id, None)
+        self._tasks.pop(session.id, None)
+        for path in log_paths(FRAME_LOG_DIR, f"session-{session.id}"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _allocate_cpus(self) -> Optional[Set[int]]:
+        """Give the new session the CPUs least used by running sessions"""
+        if not hasattr(os, "sched_getaffinity"):
+            return None
+        available = sorted(os.sched_getaffinity(0))
+        load = {cpu: 0 for cpu in available}
+        for session in self.running():
+            for cpu in session.cpus or ():
+                if cpu in load:
+                    load[cpu] += 1
+        return set(sorted(available, key=lambda cpu: load[cpu])[:self.cpus_per_session])
+
+    def _limit_resources(self, cpus: Optional[Set[int]]):
+        """Runs in the child between fork and exec; SUMO inherits the same limits"""
+        if self.cpu_seconds:
+            resource.setrlimit(resource.RLIMIT_CPU, (self.cpu_seconds, self.cpu_seconds))
+        if cpus:
+            os.sched_setaffinity(0, cpus)
+
+    async def create(self, config: Dict[str, Any]) -> Session:
+        self._reap()
+        if len(self.running()) >= self.max_sessions:
+            raise SessionLimitError(f"At most {self.max_sessions} concurrent sessions")
+        session = Session(uuid.uuid4().hex[:12], config, self._allocate_cpus())
+        command = session.command()  # Validates file names before anything is started
+
+        env = dict(os.environ)
+        for var in THREAD_ENV_VARS:
+            env[var] = str(self.cpus_per_session)
+        env.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+        # Registered before the spawn await so concurrent requests see it against the cap
+        self.sessions[session.id] = session
+        try:
+            session.process = await asyncio.create_subprocess_exec(
+                *command,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                env=env,
+                limit=STREAM_LIMIT,
+                preexec_fn=lambda: self._limit_resources(session.cpus),
+            )
+        except Exception:
+            del self.sessions[session.id]
+            raise
+        session.status = "running"
+        self._tasks[session.id] = asyncio.create_task(self._supervise(session))
+        return session
+
+    async def _supervise(self, session: Session):
+        """Pump the session's output into its storage and websockets until the process exits"""
+        stderr_task = asyncio.create_task(self._log_stderr(session))
+        memory_task = asyncio.create_task(self._watch_memory(session)) if self.memory_mb else None
+        frame_log = FrameLogWriter(f"session-{session.id}")
+        try:
+            async for line in session.process.stdout:
+                try:
+                    frame = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"Session {session.id} stdout (non-JSON): {line.strip()}", file=sys.stderr)
+                    continue
+                await session.storage.insert_frame(frame)
+                frame_log.append(frame.get("simulationTime", 0), line.rstrip(b"\n"))
+                await session.broadcast({"type": "simulation_update", "data": frame, "isRunning": True})
+        except Exception as e:
+            print(f"Error processing session {session.id} output: {e}", file=sys.stderr)
+            if session.is_running():
+                session.process.kill()  # Nobody is draining stdout any more; don't leave it blocked
+        finally:
+            frame_log.close()
+            session.returncode = await session.process.wait()
+            await stderr_task
+            if memory_task is not None:
+                memory_task.cancel()
+            session.finished_at = time.time()
+            if session.status == "running":
+                session.status = "finished" if session.returncode == 0 else "failed"
+            await session.broadcast({"type": "simulation_stopped", "isRunning": False})
+
+    async def _watch_memory(self, session: Session):
+        """Kill the session's process tree once its resident memory exceeds `memory_mb`"""
+        limit = self.memory_mb * 2**20
+        while session.is_running():
+            await asyncio.sleep(MEMORY_POLL_INTERVAL)
+            if not session.is_running():
+                return
+            pids = process_tree(session.process.pid)
+            rss = resident_bytes(pids)
+            if rss <= limit:
+                continue
+            session.status = "failed"
+            session.error = f"Resident memory {rss / 2**20:.0f} MiB exceeded the {self.memory_mb} MiB limit"
+            print(f"Session {session.id}: {session.error}, killing it", file=sys.stderr)
+            # Children first, so SUMO does not outlive the simulation that started it
+            for pid in reversed(pids):
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            return
+
+    async def _log_stderr(self, session: Session):
+        async for line in session.process.stderr:
+            print(f"Session {session.id} (stderr): {line.decode(errors='replace').rstrip()}", file=sys.stderr)
+
+    async def stop(self, session_id: str, timeout: float = 5.0) -> Session:
+        session = self.sessions[session_id]
+        if session.is_running():
+            session.status = "stopped"
+            session.process.terminate()
+            try:
+                await asyncio.wait_for(session.process.wait(), timeout)
+            except asyncio.TimeoutError:
+                session.process.kill()
+        task = self._tasks.get(session_id)
+        if task is not None:
+            await task
+        return session
+
+    async def remove(self, session_id: str):
+        session = await self.stop(session_id)
+        for websocket in list(session.websockets):
+            await websocket.close()
+        self._discard(session)
+
+    async def shutdown(self):
+        await asyncio.gather(*(self.stop(session_id) for session_id in list(self.sessions)))
@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+import random
+import tempfile
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import traci
+import traci.constants as tc
+
+from sumo_bridge import QUEUED_VEHICLE_LENGTH
+
+
+class SnapshotLibrary:
+    """Indexed on-disk collection of SUMO simulation states.
+
+    States are written with `traci.simulation.saveState` as compressed XML; `index.json`
+    records when and why each one was taken so episodes can sample a starting state
+    without opening the state files. Several runs may share a library, so readers
+    reload the index whenever its mtime changes and `capture` merges into the file on
+    disk under a lock.
+    """
+
+    def __init__(self, directory: str, scenario: str = "default"):
+        self.directory = directory
+        self.scenario = scenario
+        self.index_path = os.path.join(directory, "index.json")
+        self.lock_path = os.path.join(directory, "index.lock")
+        self.entries: List[Dict] = []
+        self.mtime_ns: Optional[int] = None
+        self._reload()
+
+    def _reload(self):
+        """Re-read index.json if it changed since it was last read"""
+        try:
+            mtime_ns = os.stat(self.index_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime_ns == self.mtime_ns:
+            return
+        with open(self.index_path) as f:
+            self.entries = json.load(f)
+        self.mtime_ns = mtime_ns
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _save_index(self):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".json.tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.index_path)
+        self.mtime_ns = os.stat(self.index_path).st_mtime_ns
+
+    def capture(self, trigger: str, sim_time: float, stats: Dict, controller_state: Dict) -> Dict:
+        """Save the current SUMO state and index it"""
+        os.makedirs(self.directory, exist_ok=True)
+        # Unique across processes sharing the library, unlike a count of the entries this one has seen
+        snapshot_id = f"{self.scenario}-{int(sim_time)}-{trigger}-{uuid.uuid4().hex[:8]}"
+        filename = f"{snapshot_id}.xml.gz"
+        traci.simulation.saveState(os.path.join(self.directory, filename))
+        entry = {
+            "id": snapshot_id,
+            "file": filename,
+            "scenario": self.scenario,
+            "trigger": trigger,
+            "simTime": sim_time,
+            "controllerState": controller_state,
+            "createdAt": time.time(),
+            **stats,
+        }
+        with self._locked():
+            # Merge with snapshots other processes captured since the index was last read
+            self.mtime_ns = None
+            self._reload()
+            self.entries.append(entry)
+            self._save_index()
+        return entry
+
+    def query(self, trigger: Optional[str] = None, min_queue: int = 0) -> List[Dict]:
+        """Entries of this scenario, optionally filtered by trigger and total queue"""
+        self._reload()
+        return [e for e in self.entries
+                if e["scenario"] == self.scenario
+                and (trigger is None or e["trigger"] == trigger)
+                and e.get("totalQueue", 0) >= min_queue]
+
+    def sample(self, trigger: Optional[str] = None, rng: Optional[random.Random] = None) -> Optional[Dict]:
+        candidates = self.query(trigger)
+        if not candidates:
+            return None
+        return (rng or random).choice(candidates)
+
+    def restore(self, entry: Dict):
+        """Load a snapshot into the running SUMO instance"""
+        traci.simulation.loadState(os.path.join(self.directory, entry["file"]))
+
+
+class SnapshotCapturer:
+    """Decide when the current state is worth keeping.
+
+    Two triggers are watched using lane halting numbers already delivered by the
+    metrics subscriptions: a new peak in total queued vehicles, and spillback, where a
+    lane's queue reaches `spillback_ratio` of its length.
+    """
+
+    def __init__(self, library: SnapshotLibrary, lanes: List[str], min_interval: int = 120,
+                 peak_margin: int = 5, spillback_ratio: float = 0.9):
+        self.library = library
+        self.lanes = list(lanes)
+        self.min_interval = min_interval
+        self.peak_margin = peak_margin
+        self.spillback_ratio = spillback_ratio
+        self.lane_capacity = {lane: max(1.0, traci.lane.getLength(lane) / QUEUED_VEHICLE_LENGTH)
+                              for lane in self.lanes}
+        self.peak_queue = 0
+        self.last_capture_time = -min_interval
+
+    def observe(self, sim_time: float, controller_state: Dict) -> Optional[Dict]:
+        """Check this step's lane queues and capture a snapshot if a trigger fires"""
+        if sim_time - self.last_capture_time < self.min_interval:
+            return None
+        results = traci.lane.getAllSubscriptionResults()
+        halting = {lane: results.get(lane, {}).get(tc.LAST_STEP_VEHICLE_HALTING_NUMBER, 0)
+                   for lane in self.lanes}
+        total_queue = sum(halting.values())
+        spillback = [lane for lane, queued in halting.items()
+                     if queued >= self.spillback_ratio * self.lane_capacity[lane]]
+
+        trigger = None
+        if spillback:
+            trigger = "spillback"
+        elif total_queue >= self.peak_queue + self.peak_margin:
+            trigger = "peak_queue"
+        if trigger is None:
+            return None
+
+        self.peak_queue = max(self.peak_queue, total_queue)
+        self.last_capture_time = sim_time
+        stats = {"totalQueue": total_queue, "maxQueue": max(halting.values(), default=0),
+                 "spillbackLanes": spillback}
+        return self.library.capture(trigger, sim_time, stats, controller_state)
@@ -0,0 +1,62 @@
+import json
+import hashlib
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+def _json_default(obj: Any):
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    if hasattr(obj, "item"):  # NumPy scalars
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class CachedBody:
+    """A pre-serialized response body with its ETag"""
+
+    __slots__ = ("version", "body", "text", "etag")
+
+    def __init__(self, version: Hashable, payload: Any):
+        self.version = version
+        self.text = json.dumps(payload, default=_json_default, separators=(",", ":"))
+        self.body = self.text.encode("utf-8")
+        self.etag = '"' + hashlib.blake2b(self.body, digest_size=12).hexdigest() + '"'
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """True if the client's If-None-Match header already names this body"""
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return self.etag in tags
+
+
+class StatusCache:
+    """Serialized snapshots of hot read endpoints, rebuilt at most once per data version.
+
+    Callers pass the version their payload depends on (e.g. the storage ingest counter
+    plus the run state). While it is unchanged every request is served from the same
+    bytes and ETag, so a burst of reconnecting dashboards costs one build, not one per
+    client.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: Dict[Hashable, CachedBody] = {}
+
+    async def get(self, key: Hashable, version: Hashable,
+                  builder: Callable[[], Awaitable[Any]]) -> CachedBody:
+        entry = self._entries.get(key)
+        if entry is not None and entry.version == version:
+            return entry
+        entry = CachedBody(version, await builder())
+        if key not in self._entries and len(self._entries) >= self.max_entries:
+            # Query-parameterised keys are unbounded; evict the oldest
+            self._entries.pop(next(iter(self._entries)))
+        self._entries[key] = entry
+        return entry
+
+    def clear(self):
+        self._entries.clear()
@@ -1,74 +1,150 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterator, Optional
+from itertools import islice
 from datetime import datetime
 import uuid
-
-def _normalize_timestamp(ts: Any) -> datetime:
-    if isinstance(ts, datetime):
-        return ts
-    if isinstance(ts, str):
-        try:
-            return datetime.fromisoformat(ts)
-        except ValueError:
-            pass # Fall through to return datetime.min
-    return datetime.min
+from backend.sumo_output_parser import RunSummaryIndex, DEFAULT_INDEX_DIR
+from backend.action_log import ActionLog, ACTION_NAMES
 
 class MemStorage:
-    def __init__(self):
+    def __init__(self, run_index_dir: str = DEFAULT_INDEX_DIR):
         self.traffic_states: Dict[str, Dict] = {}
         self.performance_metrics: Dict[str, Dict] = {}
         self.agent_statuses: Dict[str, Dict] = {}
+        self.transitions: Dict[str, Dict] = {}
+        self.agent_actions = ActionLog(capacity=10000)
+        # Maintained on insert so reads never scan the tables
+        self.latest_traffic_state: Optional[Dict] = None
+        self.latest_performance_metrics: Optional[Dict] = None
+        self.latest_agent_status: Optional[Dict] = None
+        # Bumped once per insert call (once per frame for insert_frame); response caches key on it
+        self.version = 0
+        self.run_index = RunSummaryIndex(run_index_dir)
 
     async def get_latest_traffic_state(self) -> Optional[Dict]:
-        if not self.traffic_states:
-            return None
-        return max(self.traffic_states.values(), key=lambda x: _normalize_timestamp(x.get("timestamp")))
+        return self.latest_traffic_state
 
     async def get_latest_performance_metrics(self) -> Optional[Dict]:
-        if not self.performance_metrics:
-            return None
-        return max(self.performance_metrics.values(), key=lambda x: _normalize_timestamp(x.get("timestamp")))
+        return self.latest_performance_metrics
 
     async def get_latest_agent_status(self) -> Optional[Dict]:
-        if not self.agent_statuses:
-            return None
-        return max(self.agent_statuses.values(), key=lambda x: _normalize_timestamp(x.get("timestamp")))
-
-    async def get_baseline_comparison(self) -> Dict[str, Any]:
-        # Simulate some baseline data as there's no distinction in current storage
-        # In a real scenario, baseline metrics would be stored with a flag
-        mock_baseline = [
-            {"avgWaitTime": 35.0, "throughput": 1000, "maxQueueLength": 10, "efficiencyScore": 70, "timestamp": datetime.now()},
-            {"avgWaitTime": 34.5, "throughput": 1020, "maxQueueLength": 9, "efficiencyScore": 72, "timestamp": datetime.now()},
-            {"avgWaitTime": 36.0, "throughput": 980, "maxQueueLength": 11, "efficiencyScore": 68, "timestamp": datetime.now()},
-        ]
-        rl_metrics = sorted(list(self.performance_metrics.values()), key=lambda x: _normalize_timestamp(x.get("timestamp")), reverse=True)[:10]
-        return {"rl": rl_metrics, "baseline": mock_baseline}
+        return self.latest_agent_status
+
+    def _evaluation_rows(self, label: str, limit: int) -> list[Dict]:
+        # Evaluation-harness runs in the shape of live performance metrics
+        return [{
+            "runId": run["runId"],
+            "controller": run["label"],
+            "seed": run.get("seed"),
+            "avgWaitTime": run.get("meanWaitingTime", 0.0),
+            "throughput": run.get("arrivalsPerHour", 0.0),
+            "maxQueueLength": run.get("maxQueue", 0),
+            "efficiencyScore": run.get("efficiencyScore", 0.0),
+            "timestamp": datetime.fromtimestamp(run["createdAt"]),
+        } for run in self.run_index.query(label=label, limit=limit)]
+
+    async def get_baseline_comparison(self, label: Optional[str] = None, limit: int = 20) -> Dict[str, Any]:
+        # Baseline rows are fixed-time runs recorded by the evaluation harness (backend/evaluation.py)
+        rl_metrics = list(islice(reversed(self.performance_metrics.values()), 10))
+        return {
+            "rl": rl_metrics,
+            "baseline": self._evaluation_rows("fixed_time", limit),
+            "actuated": self._evaluation_rows("actuated", limit),
+            "rlEvaluation": self._evaluation_rows("rl", limit),
+            "runs": self.run_index.query(label=label, limit=limit),
+            "runAggregates": self.run_index.aggregate(),
+        }
+
+    async def get_run_intervals(self, run_id: str) -> list[Dict]:
+        return self.run_index.intervals(run_id)
 
     async def get_performance_history(self, limit: int = 10) -> list[Dict]:
-        # Sort performance metrics by timestamp in descending order and return the latest 'limit' items
-        sorted_metrics = sorted(
-            list(self.performance_metrics.values()),
-            key=lambda x: _normalize_timestamp(x.get("timestamp")),
-            reverse=True
-        )
-        return sorted_metrics[:limit]
+        # Records are inserted with increasing timestamps, so newest-first is reverse insertion order
+        return list(islice(reversed(self.performance_metrics.values()), limit))
 
-    async def insert_traffic_state(self, state_data: Dict) -> Dict:
+    def _add_traffic_state(self, state_data: Dict) -> Dict:
         new_id = str(uuid.uuid4())
         state = {"id": new_id, "timestamp": datetime.now(), **state_data}
         self.traffic_states[new_id] = state
+        self.latest_traffic_state = state
         return state
 
-    async def insert_performance_metrics(self, metrics_data: Dict) -> Dict:
+    def _add_performance_metrics(self, metrics_data: Dict) -> Dict:
         new_id = str(uuid.uuid4())
         metrics = {"id": new_id, "timestamp": datetime.now(), **metrics_data}
         self.performance_metrics[new_id] = metrics
+        self.latest_performance_metrics = metrics
         return metrics
 
-    async def insert_agent_status(self, status_data: Dict) -> Dict:
+    def _add_agent_status(self, status_data: Dict) -> Dict:
         new_id = str(uuid.uuid4())
         status = {"id": new_id, "timestamp": datetime.now(), **status_data}
         self.agent_statuses[new_id] = status
+        self.latest_agent_status = status
+        for entry in status_data.get("recentActions", []):
+            self.agent_actions.append_entry(entry)
         return status
 
+    def _add_transition(self, transition_data: Dict) -> Dict:
+        new_id = str(uuid.uuid4())
+        transition = {"id": new_id, "timestamp": datetime.now(), **transition_data}
+        self.transitions[new_id] = transition
+        return transition
+
+    async def insert_traffic_state(self, state_data: Dict) -> Dict:
+        state = self._add_traffic_state(state_data)
+        self.version += 1
+        return state
+
+    async def insert_performance_metrics(self, metrics_data: Dict) -> Dict:
+        metrics = self._add_performance_metrics(metrics_data)
+        self.version += 1
+        return metrics
+
+    async def insert_agent_status(self, status_data: Dict) -> Dict:
+        status = self._add_agent_status(status_data)
+        self.version += 1
+        return status
+
+    async def get_recent_agent_actions(self, limit: int = 10, action: Optional[str] = None,
+                                       start_time: Optional[float] = None,
+                                       end_time: Optional[float] = None) -> list[Dict]:
+        if action is None and start_time is None and end_time is None:
+            return self.agent_actions.tail(limit)
+        return self.agent_actions.query(
+            action=ACTION_NAMES.index(action) if action is not None else None,
+            start_time=start_time, end_time=end_time, limit=limit)
+
+    async def insert_transition(self, transition_data: Dict) -> Dict:
+        transition = self._add_transition(transition_data)
+        self.version += 1
+        return transition
+
+    async def insert_frame(self, frame: Dict):
+        """Store every record carried by one simulation stdout frame, as a single version bump"""
+        self._add_traffic_state(frame.get("intersection", {}))
+        self._add_performance_metrics(frame.get("performance", {}))
+        self._add_agent_status(frame.get("agent", {}))
+        if "transition" in frame:
+            self._add_transition(frame["transition"])
+        self.version += 1
+
+    def iter_records(self, dataset: str) -> Iterator[Dict]:
+        """Iterate over one stored dataset in insertion order.
+
+        Only the list of references is copied up front, so records inserted while an
+        export is streaming do not break iteration and no row data is duplicated.
+        """
+        tables = {
+            "traffic_states": self.traffic_states,
+            "performance": self.performance_metrics,
+            "agent": self.agent_statuses,
+            "transitions": self.transitions,
+        }
+        if dataset == "all":
+            for name, table in tables.items():
+                for record in list(table.values()):
+                    yield {"dataset": name, **record}
+            return
+        yield from list(tables[dataset].values())
+
 storage = MemStorage()
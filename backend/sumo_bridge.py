@@ -1,144 +1,179 @@
+import os
+from operator import itemgetter
 import traci
-import sumolib
+import traci.constants as tc
 import numpy as np
 from typing import Dict, List, Tuple, Optional
 import xml.etree.ElementTree as ET
+from net_index import load_net_index
 
-class SUMOBridge:
-    def __init__(self, config_file: str):
-        self.config_file = config_file
-        self.intersection_id = "TL"
-        self.lanes = ["E2TL_0", "E2TL_1", "E2TL_2", "E2TL_3"]  # N, E, S, W
-        
-    def start_simulation(self, gui: bool = False):
-        """Start SUMO simulation"""
-        sumo_binary = "sumo-gui" if gui else "sumo"
-        sumo_cmd = [sumo_binary, "-c", self.config_file, "--start"]
-        traci.start(sumo_cmd)
-    
-    def get_vehicle_count(self, lane_id: str) -> int:
-        """Get number of vehicles in a lane"""
-        try:
-            return traci.lane.getLastStepVehicleNumber(lane_id)
-        except:
-            return 0
-    
-    def get_waiting_time(self, lane_id: str) -> float:
-        """Get total waiting time for vehicles in a lane"""
-        try:
-            return traci.lane.getWaitingTime(lane_id)
-        except:
-            return 0.0
-    
-    def get_traffic_light_state(self) -> str:
-        """Get current traffic light phase"""
-        try:
-            return traci.trafficlight.getRedYellowGreenState(self.intersection_id)
-        except:
-            return "rrrr"
-    
-    def set_traffic_light_phase(self, phase: int):
-        """Set traffic light phase"""
-        try:
-            traci.trafficlight.setPhase(self.intersection_id, phase)
-        except:
-            pass
-    
-    def get_intersection_state(self) -> Dict:
-        """Get complete intersection state"""
-        state = {
-            'vehicle_counts': {},
-            'waiting_times': {},
-            'current_phase': self.get_traffic_light_state(),
-            'simulation_time': self.get_simulation_time()
-        }
-        
-        for i, lane in enumerate(self.lanes):
-            direction = ['north', 'east', 'south', 'west'][i]
-            state['vehicle_counts'][direction] = self.get_vehicle_count(lane)
-            state['waiting_times'][direction] = self.get_waiting_time(lane)
-        
-        return state
-    
-    def get_simulation_time(self) -> float:
-        """Get current simulation time"""
-        try:
-            return traci.simulation.getTime()
-        except:
-            return 0.0
-    
-    def simulation_step(self):
-        """Advance simulation by one step"""
-        try:
-            traci.simulationStep()
-        except:
-            pass
-    
-    def close_simulation(self):
-        """Close SUMO simulation"""
-        try:
-            traci.close()
-        except:
-            pass
-    
-    def is_simulation_running(self) -> bool:
-        """Check if simulation is still running"""
-        try:
-            return traci.simulation.getMinExpectedNumber() > 0
-        except:
-            return False
-
-class TrafficDataProcessor:
-    """Process and normalize traffic data for RL agent"""
-    
-    @staticmethod
-    def normalize_state(state: Dict) -> np.ndarray:
-        """Convert traffic state to normalized feature vector"""
-        # Extract vehicle counts
-        north_count = state['vehicle_counts'].get('north', 0)
-        south_count = state['vehicle_counts'].get('south', 0)
-        east_count = state['vehicle_counts'].get('east', 0)
-        west_count = state['vehicle_counts'].get('west', 0)
-        
-        # Encode current phase (simplified)
-        phase_state = state['current_phase']
-        phase_encoding = 0
-        if 'g' in phase_state[:2]:  # North-South green
-            phase_encoding = 1
-        elif 'g' in phase_state[2:4]:  # East-West green
-            phase_encoding = 2
-        
-        # Normalize counts (assuming max 20 vehicles per lane)
-        max_vehicles = 20
-        normalized = np.array([
-            min(north_count, max_vehicles) / max_vehicles,
-            min(south_count, max_vehicles) / max_vehicles,
-            min(east_count, max_vehicles) / max_vehicles,
-            min(west_count, max_vehicles) / max_vehicles,
-            phase_encoding / 2  # Normalize phase encoding
-        ])
-        
-        return normalized
-    
-    @staticmethod
-    def calculate_reward(prev_state: Dict, current_state: Dict, action: int) -> float:
-        """Calculate reward for the RL agent"""
-        # Calculate total waiting time reduction
-        prev_wait = sum(prev_state['waiting_times'].values())
-        current_wait = sum(current_state['waiting_times'].values())
-        wait_reduction = prev_wait - current_wait
-        
-        # Calculate throughput (vehicles that passed)
-        prev_total = sum(prev_state['vehicle_counts'].values())
-        current_total = sum(current_state['vehicle_counts'].values())
-        throughput = max(0, prev_total - current_total)
-        
-        # Balance reward components
-        reward = wait_reduction * 0.1 + throughput * 0.5
-        
-        # Penalty for high queue lengths
-        max_queue = max(current_state['vehicle_counts'].values())
-        if max_queue > 15:
-            reward -= (max_queue - 15) * 0.2
-        
-        return reward
+DIRECTIONS = ['north', 'south', 'east', 'west']
+# Effective length of a queued vehicle (average vehicle length plus minGap)
+QUEUED_VEHICLE_LENGTH = 7.5
+
+# Per-lane features, in tensor column order
+# (waiting_time is not in the state; it is kept because the metrics engine shares the lane subscription)
+LANE_FEATURES = ['count', 'halting', 'waiting_time']
+LANE_FEATURE_VARS = [
+    tc.LAST_STEP_VEHICLE_NUMBER,
+    tc.LAST_STEP_VEHICLE_HALTING_NUMBER,
+    tc.VAR_WAITING_TIME,
+]
+
+
+def net_file_from_config(config_file: str) -> str:
+    """Resolve the net-file referenced by a .sumo.cfg"""
+    root = ET.parse(config_file).getroot()
+    net = root.find('./input/net-file')
+    if net is None:
+        raise ValueError(f"No net-file in {config_file}")
+    return os.path.join(os.path.dirname(os.path.abspath(config_file)), net.get('value'))
+
+
+class LaneIndex:
+    """Static lane layout of one signalised intersection, computed once from the net.
+
+    Every incoming lane controlled by the traffic light gets a fixed slot, and
+    `approach` maps each slot to its direction so per-approach totals are a single
+    vectorised reduction. The net is read through the
+    compiled index cache (net_index.py), so this costs milliseconds after the first run.
+    """
+
+    def __init__(self, net_file: str, tls_id: Optional[str] = None,
+                 approach_edges: Optional[Dict[str, str]] = None):
+        net = load_net_index(net_file)
+        self.tls_id = tls_id or net.tls_ids[0]
+        # Signal states of the net's static program, by phase index
+        self.phase_states: List[str] = [state for state, _ in net.programs.get(self.tls_id, [])]
+
+        # Incoming lanes in link-index order
+        connections = net.controlled_connections(self.tls_id)
+        lanes, first = np.unique(net.conn_from[connections], return_index=True)
+        order = np.argsort(first)
+        lanes, first = lanes[order], connections[first[order]]
+
+        self.lane_ids: List[str] = net.lane_ids[lanes].tolist()
+        if approach_edges is None:
+            # Geometric grouping precomputed by the compiler
+            self.approach = np.asarray(net.conn_approach[first], dtype=np.intp)
+        else:
+            edge_direction = {edge: direction for direction, edge in approach_edges.items()}
+            edges = net.edge_ids[net.lane_edge[lanes]].tolist()
+            self.approach = np.array([DIRECTIONS.index(edge_direction[edge]) for edge in edges], dtype=np.intp)
+
+
+class LaneFeatureBuilder:
+    """Read every controlled lane into a preallocated feature tensor once per step.
+
+    All lanes are subscribed to the LANE_FEATURE_VARS set, so a step costs one
+    `getAllSubscriptionResults` call whose values are gathered into `self.raw` with a
+    single itemgetter pass. The variable set is a superset of what OnlineMetricsEngine
+    subscribes to, so subscribing the builder after the metrics engine keeps both working.
+    """
+
+    def __init__(self, lane_index: LaneIndex):
+        self.index = lane_index
+        n = len(lane_index.lane_ids)
+        self.raw = np.zeros((n, len(LANE_FEATURES)), dtype=np.float32)
+        self.approach_totals = np.zeros((len(DIRECTIONS), len(LANE_FEATURES)), dtype=np.float32)
+        self._values = itemgetter(*LANE_FEATURE_VARS)
+        # Stands in for lanes missing from the results (e.g. right after a state load)
+        self._missing = dict.fromkeys(LANE_FEATURE_VARS, 0.0)
+
+    def subscribe(self):
+        for lane_id in self.index.lane_ids:
+            traci.lane.subscribe(lane_id, LANE_FEATURE_VARS)
+
+    def read(self) -> np.ndarray:
+        """Fill and return the raw (lanes x features) tensor from this step's subscriptions"""
+        results = traci.lane.getAllSubscriptionResults()
+        if self.index.lane_ids:
+            self.raw[:] = list(map(self._values, (results.get(lane_id) or self._missing
+                                                   for lane_id in self.index.lane_ids)))
+        return self.raw
+
+    def approach_features(self) -> np.ndarray:
+        """Raw features summed over the lanes of each approach (directions x features)"""
+        self.approach_totals.fill(0.0)
+        np.add.at(self.approach_totals, self.index.approach, self.raw)
+        return self.approach_totals
+
+
+# Phase duration used to hold a phase until the controller changes it (SUMO otherwise advances on its own)
+HOLD_DURATION = 1e6
+
+
+class SignalCommander:
+    """Diffing, per-step batched signal commands for any number of traffic lights.
+
+    Callers queue the desired state as often as they like; `flush()` sends, once per
+    step, only the commands whose value differs from what SUMO was last told. Whole
+    timing plans can be uploaded with `upload_program`, after which SUMO runs the
+    cycle itself and nothing is sent until the plan changes. Call `invalidate()` when
+    SUMO's signal state changed behind the commander's back (e.g. after loadState).
+    """
+
+    def __init__(self):
+        self.sent: Dict[str, tuple] = {}
+        self.pending: Dict[str, tuple] = {}
+        # Program each light ran before the commander replaced it, restored by hold_phase
+        self.base_program: Dict[str, str] = {}
+        self.commands_sent = 0
+        self.commands_skipped = 0
+
+    def hold_phase(self, tls_id: str, phase_index: int):
+        """Switch to `phase_index` of the active program and keep it until told otherwise"""
+        self.pending[tls_id] = ("phase", phase_index)
+
+    def set_state(self, tls_id: str, state: str):
+        """Show an explicit red/yellow/green state string"""
+        self.pending[tls_id] = ("state", state)
+
+    def upload_program(self, tls_id: str, phases: List[Tuple[str, float]], program_id: str = "plan",
+                       start_phase: int = 0):
+        """Install a full cycle of (state, duration) phases and let SUMO run it"""
+        self.pending[tls_id] = ("program", program_id, tuple((state, float(d)) for state, d in phases), start_phase)
+
+    def invalidate(self, tls_id: Optional[str] = None):
+        if tls_id is None:
+            self.sent.clear()
+        else:
+            self.sent.pop(tls_id, None)
+
+    def flush(self) -> int:
+        """Send the queued commands that change something; returns the number of TraCI calls made"""
+        calls = 0
+        for tls_id, command in self.pending.items():
+            if self.sent.get(tls_id) == command:
+                self.commands_skipped += 1
+                continue
+            kind = command[0]
+            if kind == "phase":
+                if tls_id in self.base_program and self.sent.get(tls_id, ("unknown",))[0] != "phase":
+                    # Coming back from an explicit state or uploaded plan: return to the net's program
+                    traci.trafficlight.setProgram(tls_id, self.base_program[tls_id])
+                    calls += 1
+                traci.trafficlight.setPhase(tls_id, command[1])
+                traci.trafficlight.setPhaseDuration(tls_id, HOLD_DURATION)
+                calls += 2
+            elif kind == "state":
+                self._remember_program(tls_id)
+                traci.trafficlight.setRedYellowGreenState(tls_id, command[1])
+                calls += 1
+            else:
+                _, program_id, phases, start_phase = command
+                self._remember_program(tls_id)
+                logic = traci.trafficlight.Logic(program_id, 0, start_phase,
+                                                 [traci.trafficlight.Phase(d, state) for state, d in phases])
+                traci.trafficlight.setProgramLogic(tls_id, logic)
+                traci.trafficlight.setProgram(tls_id, program_id)
+                traci.trafficlight.setPhase(tls_id, start_phase)
+                calls += 3
+            self.sent[tls_id] = command
+        self.pending.clear()
+        self.commands_sent += calls
+        return calls
+
+    def _remember_program(self, tls_id: str):
+        if tls_id not in self.base_program:
+            self.base_program[tls_id] = traci.trafficlight.getProgram(tls_id)
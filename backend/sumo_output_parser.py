@@ -0,0 +1,298 @@
+import os
+import json
+import time
+import fcntl
+import argparse
+import tempfile
+from contextlib import contextmanager
+import xml.etree.ElementTree as ET
+from typing import Callable, Dict, Iterator, List, Optional
+
+# Attributes parsed as numbers from SUMO <step> and <tripinfo> elements
+SUMMARY_FIELDS = ("time", "loaded", "inserted", "running", "waiting", "ended", "arrived",
+                  "collisions", "teleports", "halting", "stopped", "meanWaitingTime",
+                  "meanTravelTime", "meanSpeed", "duration")
+TRIPINFO_FIELDS = ("depart", "departDelay", "arrival", "duration", "routeLength",
+                   "waitingTime", "waitingCount", "timeLoss")
+
+
+def _to_float(value: Optional[str]) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _element_record(elem: ET.Element, fields) -> Dict:
+    record = {name: _to_float(elem.get(name)) for name in fields}
+    if "id" in elem.attrib:
+        record["id"] = elem.get("id")
+    if "vType" in elem.attrib:
+        record["vType"] = elem.get("vType")
+    return record
+
+
+def iter_elements(path: str, tag: str, fields) -> Iterator[Dict]:
+    """Stream `tag` elements from a finished SUMO output file without building the tree"""
+    context = ET.iterparse(path, events=("start", "end"))
+    root = None
+    for event, elem in context:
+        if root is None and event == "start":
+            root = elem
+        elif event == "end" and elem.tag == tag:
+            yield _element_record(elem, fields)
+            # Drop the processed element and detach it from the root
+            elem.clear()
+            root.clear()
+
+
+def follow_elements(path: str, tag: str, fields, poll_interval: float = 1.0,
+                    should_stop: Optional[Callable[[], bool]] = None,
+                    chunk_size: int = 1 << 16) -> Iterator[Dict]:
+    """Stream `tag` elements from a SUMO output file that is still being written.
+
+    New bytes are fed to an incremental pull parser as they appear; the generator ends once
+    the document's closing tag has been parsed or `should_stop` returns True.
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    root = None
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                if should_stop is not None and should_stop():
+                    return
+                time.sleep(poll_interval)
+                continue
+            parser.feed(data)
+            for event, elem in parser.read_events():
+                if root is None and event == "start":
+                    root = elem
+                elif event == "end" and elem.tag == tag:
+                    yield _element_record(elem, fields)
+                    elem.clear()
+                    root.clear()
+                elif event == "end" and elem is root:
+                    return
+
+
+def iter_summary_steps(path: str, follow: bool = False, **kwargs) -> Iterator[Dict]:
+    """Stream <step> records from a SUMO summary output"""
+    if follow:
+        return follow_elements(path, "step", SUMMARY_FIELDS, **kwargs)
+    return iter_elements(path, "step", SUMMARY_FIELDS)
+
+
+def iter_tripinfos(path: str, follow: bool = False, **kwargs) -> Iterator[Dict]:
+    """Stream <tripinfo> records from a SUMO tripinfo output"""
+    if follow:
+        return follow_elements(path, "tripinfo", TRIPINFO_FIELDS, **kwargs)
+    return iter_elements(path, "tripinfo", TRIPINFO_FIELDS)
+
+
+class IntervalKPIAggregator:
+    """Fold summary steps and trip records into fixed-length KPI intervals.
+
+    Only running sums are kept per interval, so memory grows with the number of
+    intervals rather than with the number of steps or vehicles.
+    """
+
+    def __init__(self, interval: float = 300.0):
+        self.interval = interval
+        self.buckets: Dict[int, Dict[str, float]] = {}
+        self._last_arrived = 0.0
+
+    def _bucket(self, t: float) -> Dict[str, float]:
+        index = int(t // self.interval)
+        bucket = self.buckets.get(index)
+        if bucket is None:
+            bucket = {"steps": 0, "running_wait_sum": 0.0, "halting_sum": 0.0, "arrived": 0.0,
+                      "teleports": 0.0, "trips": 0, "trip_wait_sum": 0.0, "time_loss_sum": 0.0}
+            self.buckets[index] = bucket
+        return bucket
+
+    def add_summary_step(self, step: Dict):
+        bucket = self._bucket(step["time"])
+        bucket["steps"] += 1
+        bucket["running_wait_sum"] += step["meanWaitingTime"]
+        bucket["halting_sum"] += step["halting"]
+        # "arrived" is cumulative in summary output, "teleports" is per step
+        bucket["arrived"] += max(0.0, step["arrived"] - self._last_arrived)
+        self._last_arrived = step["arrived"]
+        bucket["teleports"] += step["teleports"]
+
+    def add_trip(self, trip: Dict):
+        bucket = self._bucket(trip["arrival"])
+        bucket["trips"] += 1
+        bucket["trip_wait_sum"] += trip["waitingTime"]
+        bucket["time_loss_sum"] += trip["timeLoss"]
+
+    def intervals(self) -> List[Dict]:
+        """Per-interval KPIs in time order"""
+        result = []
+        for index in sorted(self.buckets):
+            b = self.buckets[index]
+            if b["trips"]:
+                mean_wait = b["trip_wait_sum"] / b["trips"]
+            else:
+                mean_wait = b["running_wait_sum"] / b["steps"] if b["steps"] else 0.0
+            result.append({
+                "begin": index * self.interval,
+                "end": (index + 1) * self.interval,
+                "meanWaitingTime": mean_wait,
+                "meanTimeLoss": b["time_loss_sum"] / b["trips"] if b["trips"] else 0.0,
+                "arrivalsPerHour": b["arrived"] * 3600.0 / self.interval,
+                "meanHalting": b["halting_sum"] / b["steps"] if b["steps"] else 0.0,
+                "teleports": int(b["teleports"]),
+                "trips": b["trips"],
+            })
+        return result
+
+    def totals(self) -> Dict:
+        """Whole-run KPIs"""
+        buckets = self.buckets.values()
+        steps = sum(b["steps"] for b in buckets)
+        trips = sum(b["trips"] for b in buckets)
+        arrived = sum(b["arrived"] for b in buckets)
+        duration = steps if steps else len(self.buckets) * self.interval
+        return {
+            "meanWaitingTime": sum(b["trip_wait_sum"] for b in buckets) / trips if trips else 0.0,
+            "meanTimeLoss": sum(b["time_loss_sum"] for b in buckets) / trips if trips else 0.0,
+            "arrivalsPerHour": arrived * 3600.0 / duration if duration else 0.0,
+            "teleports": int(sum(b["teleports"] for b in buckets)),
+            "trips": trips,
+            "duration": duration,
+        }
+
+
+def summarize_run(summary_path: Optional[str], tripinfo_path: Optional[str],
+                  interval: float = 300.0) -> Dict:
+    """Compute interval and total KPIs for one SUMO run"""
+    aggregator = IntervalKPIAggregator(interval)
+    if summary_path and os.path.exists(summary_path):
+        for step in iter_summary_steps(summary_path):
+            aggregator.add_summary_step(step)
+    if tripinfo_path and os.path.exists(tripinfo_path):
+        for trip in iter_tripinfos(tripinfo_path):
+            aggregator.add_trip(trip)
+    return {"interval": interval, "intervals": aggregator.intervals(), "totals": aggregator.totals()}
+
+
+class RunSummaryIndex:
+    """On-disk index of per-run KPI totals, with interval detail stored per run.
+
+    `index.json` holds one small entry per run so listing and filtering runs never
+    touches the (potentially large) interval files. Runs are added by other processes
+    (the evaluation harness, the parser CLI), so readers reload the file whenever its
+    mtime changes and writers merge into the file on disk under a lock.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.index_path = os.path.join(directory, "index.json")
+        self.lock_path = os.path.join(directory, "index.lock")
+        self.runs: Dict[str, Dict] = {}
+        self.mtime_ns: Optional[int] = None
+        self._reload()
+
+    def _reload(self):
+        """Re-read index.json if it changed since it was last read"""
+        try:
+            mtime_ns = os.stat(self.index_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime_ns == self.mtime_ns:
+            return
+        with open(self.index_path) as f:
+            self.runs = json.load(f)
+        self.mtime_ns = mtime_ns
+
+    def version(self) -> Optional[int]:
+        """mtime of the index as currently loaded, after picking up any newer file"""
+        self._reload()
+        return self.mtime_ns
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _save(self):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".json.tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.runs, f)
+        os.replace(tmp_path, self.index_path)
+        self.mtime_ns = os.stat(self.index_path).st_mtime_ns
+
+    def add_run(self, run_id: str, kpis: Dict, label: str = "rl", **metadata) -> Dict:
+        """Store a run's KPIs under `run_id` and update the index"""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, f"{run_id}.intervals.json"), "w") as f:
+            json.dump(kpis["intervals"], f)
+        entry = {"runId": run_id, "label": label, "interval": kpis["interval"],
+                 "createdAt": time.time(), **kpis["totals"], **metadata}
+        with self._locked():
+            # Merge with runs other processes added since this index was last read
+            self.mtime_ns = None
+            self._reload()
+            self.runs[run_id] = entry
+            self._save()
+        return entry
+
+    def query(self, label: Optional[str] = None, limit: Optional[int] = None) -> List[Dict]:
+        """Run entries, newest first, optionally restricted to one label"""
+        self._reload()
+        runs = [r for r in self.runs.values() if label is None or r["label"] == label]
+        runs.sort(key=lambda r: r["createdAt"], reverse=True)
+        return runs[:limit] if limit else runs
+
+    def intervals(self, run_id: str) -> List[Dict]:
+        """Interval KPIs for one run"""
+        self._reload()
+        path = os.path.join(self.directory, f"{run_id}.intervals.json")
+        if run_id not in self.runs or not os.path.exists(path):
+            return []
+        with open(path) as f:
+            return json.load(f)
+
+    def aggregate(self) -> Dict[str, Dict]:
+        """Mean of each KPI across all runs, grouped by label"""
+        self._reload()
+        groups: Dict[str, Dict] = {}
+        for run in self.runs.values():
+            g = groups.setdefault(run["label"], {"runs": 0, "meanWaitingTime": 0.0, "meanTimeLoss": 0.0,
+                                                 "arrivalsPerHour": 0.0, "teleports": 0.0})
+            g["runs"] += 1
+            for key in ("meanWaitingTime", "meanTimeLoss", "arrivalsPerHour", "teleports"):
+                g[key] += run.get(key, 0.0)
+        for g in groups.values():
+            for key in ("meanWaitingTime", "meanTimeLoss", "arrivalsPerHour", "teleports"):
+                g[key] /= g["runs"]
+        return groups
+
+
+DEFAULT_INDEX_DIR = os.path.join(os.path.dirname(__file__), "sumo_configs", "runs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute KPIs from SUMO summary/tripinfo outputs")
+    parser.add_argument("run_id")
+    parser.add_argument("--summary", help="SUMO summary output file")
+    parser.add_argument("--tripinfo", help="SUMO tripinfo output file")
+    parser.add_argument("--label", default="rl", help="Controller label, e.g. rl, fixed_time, actuated")
+    parser.add_argument("--interval", type=float, default=300.0, help="KPI interval length in seconds")
+    parser.add_argument("--index-dir", default=DEFAULT_INDEX_DIR)
+    args = parser.parse_args()
+
+    kpis = summarize_run(args.summary, args.tripinfo, args.interval)
+    entry = RunSummaryIndex(args.index_dir).add_run(args.run_id, kpis, label=args.label)
+    print(json.dumps(entry, indent=2))
+
+
+if __name__ == "__main__":
+    main()
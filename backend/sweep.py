@@ -0,0 +1,260 @@
+import os
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+import numpy as np
+
+SUMO_CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sumo_configs")
+DEFAULT_CONFIG = os.path.join(SUMO_CONFIG_DIR, "intersection.sumo.cfg")
+
+# Search space used when no --space file is given
+DEFAULT_SPACE = {
+    "learning_rate": {"min": 1e-4, "max": 1e-2, "log": True},
+    "gamma": [0.9, 0.95, 0.99],
+    "epsilon_decay": [0.99, 0.995, 0.999],
+    "batch_size": [32, 64],
+    "memory_size": [5000, 10000, 50000],
+    "target_sync_episodes": [5, 10, 20],
+}
+AGENT_PARAMS = ("learning_rate", "gamma", "epsilon_decay", "batch_size", "memory_size")
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS",
+                   "TF_NUM_INTRAOP_THREADS", "TF_NUM_INTEROP_THREADS")
+
+
+def grid_configs(space: Dict) -> List[Dict]:
+    """Cartesian product of all list-valued dimensions (ranges are not allowed in grid mode)"""
+    for name, values in space.items():
+        if not isinstance(values, list):
+            raise ValueError(f"Grid search needs an explicit list of values for '{name}'")
+    names = list(space)
+    return [dict(zip(names, combo)) for combo in itertools.product(*(space[n] for n in names))]
+
+
+def random_configs(space: Dict, trials: int, seed: int = 0) -> List[Dict]:
+    """Sample `trials` configs; dicts with min/max are ranges (log-uniform if "log" is set)"""
+    rng = random.Random(seed)
+    configs = []
+    for _ in range(trials):
+        config = {}
+        for name, spec in space.items():
+            if isinstance(spec, list):
+                config[name] = rng.choice(spec)
+            elif spec.get("log"):
+                config[name] = float(np.exp(rng.uniform(np.log(spec["min"]), np.log(spec["max"]))))
+            else:
+                config[name] = rng.uniform(spec["min"], spec["max"])
+                if isinstance(spec["min"], int) and isinstance(spec["max"], int):
+                    config[name] = int(round(config[name]))
+        configs.append(config)
+    return configs
+
+
+def _init_worker(cpu_queue, threads_per_job: int):
+    """Pin this worker to one CPU and cap library thread pools before TensorFlow loads"""
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads_per_job)
+    os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+    cpu = cpu_queue.get()
+    if cpu is not None and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, {cpu})
+        except OSError as e:
+            print(f"Could not pin worker {os.getpid()} to CPU {cpu}: {e}", file=sys.stderr)
+
+
+class MedianStopper:
+    """Median stopping rule shared across workers.
+
+    At each checkpoint a trial reports its score; once `min_trials` other trials have
+    reported at that checkpoint, a trial scoring below their median is stopped.
+    """
+
+    def __init__(self, manager, min_trials: int = 3, grace_checkpoints: int = 2):
+        self.scores = manager.dict()
+        self.lock = manager.Lock()
+        self.min_trials = min_trials
+        self.grace_checkpoints = grace_checkpoints
+
+    def report(self, checkpoint: int, score: float) -> bool:
+        """Record a score; returns True if the trial should stop"""
+        with self.lock:
+            previous = self.scores.get(checkpoint, [])
+            self.scores[checkpoint] = previous + [score]
+        if checkpoint < self.grace_checkpoints or len(previous) < self.min_trials:
+            return False
+        return score < float(np.median(previous))
+
+
+def run_trial(job: Dict, stopper: Optional[MedianStopper] = None) -> Dict:
+    """Train one configuration headlessly and return its learning curve summary"""
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(job["threads"])
+    tf.config.threading.set_inter_op_parallelism_threads(job["threads"])
+    from rl_agent import DQNAgent
+    from trace_replay import TraceReplay
+    from traffic_simulation import TrafficSimulation
+
+    random.seed(job["seed"])
+    np.random.seed(job["seed"])
+    tf.random.set_seed(job["seed"])
+
+    params = job["params"]
+    agent = DQNAgent(state_size=5, action_size=4,
+                     **{k: params[k] for k in AGENT_PARAMS if k in params})
+    sim = TrafficSimulation(
+        job["config"],
+        gui=False,
+        agent=agent,
+        trace_replay=TraceReplay(job["replay_trace"]) if job.get("replay_trace") else None,
+        sumo_args=["--seed", str(job["seed"])],
+        simulator=job["simulator"],
+        target_sync_episodes=int(params.get("target_sync_episodes", 10)),
+        emit_frames=False,
+    )
+
+    started = time.time()
+    checkpoint = 0
+    stopped_early = False
+    score = 0.0
+    last_reward = 0.0
+    performance: Dict = {}
+    try:
+        sim.start_sumo()  # Also starts a replay, or the mesoscopic model when asked for or SUMO is missing
+        while sim.simulation_time < job["steps"]:
+            frame = sim.run_step()
+            performance = frame["performance"]
+            sim.advance_episode()
+            if sim.simulation_time % job["report_every"] == 0:
+                score = (sim.total_reward - last_reward) / job["report_every"]
+                last_reward = sim.total_reward
+                checkpoint += 1
+                if stopper is not None and stopper.report(checkpoint, score):
+                    stopped_early = True
+                    break
+    finally:
+        sim.cleanup()
+
+    if sim.trace_replay is not None:
+        simulator = "trace"
+    elif sim.sumo_available:
+        simulator = "sumo"
+    elif sim.meso is not None:
+        simulator = "meso"
+    else:
+        simulator = "random"
+    return {
+        "trial": job["trial"],
+        **params,
+        "simulator": simulator,
+        "score": score,
+        "avgWaitTime": performance.get("avgWaitTime", 0.0),
+        "throughput": performance.get("throughput", 0),
+        "epsilon": sim.agent.epsilon,
+        "steps": sim.simulation_time,
+        "stoppedEarly": stopped_early,
+        "wallTime": round(time.time() - started, 2),
+        "pid": os.getpid(),
+    }
+
+
+def run_sweep(configs: List[Dict], results_path: str, workers: int, threads_per_job: int = 1,
+              steps: int = 3600, report_every: int = 300, replay_trace: Optional[str] = None,
+              simulator: str = "sumo", early_stop: bool = True, seed: int = 0) -> List[Dict]:
+    """Run all configs across a pinned process pool, appending each result to `results_path`"""
+    fieldnames = ["trial", *sorted({k for c in configs for k in c}), "simulator", "score", "avgWaitTime",
+                  "throughput", "epsilon", "steps", "stoppedEarly", "wallTime", "pid"]
+    write_header = not os.path.exists(results_path) or os.path.getsize(results_path) == 0
+    if not write_header:
+        with open(results_path, newline="") as f:
+            existing = next(csv.reader(f), [])
+        if existing != fieldnames:
+            raise ValueError(f"{results_path} has columns {existing}, this sweep writes {fieldnames}; "
+                             "use another --results file")
+    context = multiprocessing.get_context("spawn")
+    manager = context.Manager()
+    cpu_queue = manager.Queue()
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    for i in range(workers):
+        cpu_queue.put(cpus[i % len(cpus)] if workers <= len(cpus) else None)
+    stopper = MedianStopper(manager) if early_stop else None
+
+    jobs = [{
+        "trial": i,
+        "params": params,
+        "seed": seed + i,
+        "steps": steps,
+        "report_every": report_every,
+        "threads": threads_per_job,
+        "config": DEFAULT_CONFIG,
+        "replay_trace": replay_trace,
+        "simulator": simulator,
+    } for i, params in enumerate(configs)]
+
+    results = []
+    with open(results_path, "a", newline="") as f, ProcessPoolExecutor(
+            max_workers=workers, mp_context=context,
+            initializer=_init_worker, initargs=(cpu_queue, threads_per_job)) as pool:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
+        if write_header:
+            writer.writeheader()
+        futures = {pool.submit(run_trial, job, stopper): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Trial {job['trial']} failed: {e}", file=sys.stderr)
+                continue
+            writer.writerow(result)
+            f.flush()
+            results.append(result)
+            print(f"trial {result['trial']}: score={result['score']:.3f} "
+                  f"{'stopped early' if result['stoppedEarly'] else 'completed'} in {result['wallTime']}s",
+                  file=sys.stderr)
+    manager.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel DQN hyperparameter / scenario sweep")
+    parser.add_argument("--space", help="JSON file with the search space (lists or {min,max,log} ranges)")
+    parser.add_argument("--mode", choices=("grid", "random"), default="random")
+    parser.add_argument("--trials", type=int, default=20, help="Number of samples in random mode")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--threads-per-job", type=int, default=1)
+    parser.add_argument("--steps", type=int, default=3600, help="Training steps per trial")
+    parser.add_argument("--report-every", type=int, default=300, help="Steps between early-stopping checkpoints")
+    parser.add_argument("--replay-trace", help="Run every trial against a recorded trace (open-loop, so it exercises the "
+                             "pipeline rather than ranking policies)")
+    parser.add_argument("--simulator", choices=("sumo", "meso"), default="sumo",
+                        help="sumo: a SUMO instance per trial (the mesoscopic model if SUMO is missing); "
+                             "meso: the cell-transmission model only, not yet calibrated against SUMO")
+    parser.add_argument("--no-early-stop", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--results", default="sweep_results.csv")
+    args = parser.parse_args()
+
+    space = DEFAULT_SPACE
+    if args.space:
+        with open(args.space) as f:
+            space = json.load(f)
+    configs = grid_configs(space) if args.mode == "grid" else random_configs(space, args.trials, args.seed)
+    print(f"Running {len(configs)} trials on {args.workers} workers", file=sys.stderr)
+    results = run_sweep(configs, args.results, args.workers, threads_per_job=args.threads_per_job,
+                        steps=args.steps, report_every=args.report_every, replay_trace=args.replay_trace,
+                        simulator=args.simulator, early_stop=not args.no_early_stop, seed=args.seed)
+    best = max(results, key=lambda r: r["score"], default=None)
+    if best:
+        print(json.dumps(best, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import os
+import json
+import struct
+import numpy as np
+from typing import Dict, List, Tuple
+
+TRACE_MAGIC = b"TSTRACE1"
+TRACE_VERSION = 1
+# Header block is padded to this size so the record area stays aligned for np.memmap
+HEADER_ALIGN = 64
+
+PHASE_CODES = {'NS_GREEN': 0, 'EW_GREEN': 1, 'NS_YELLOW': 2, 'EW_YELLOW': 3}
+
+
+def trace_dtype(num_lanes: int) -> np.dtype:
+    """Build the fixed-size record layout for a trace with `num_lanes` observed lanes"""
+    return np.dtype([
+        ('step', '<u4'),
+        ('vehicles', '<u2', (num_lanes,)),
+        ('halting', '<u2', (num_lanes,)),
+        ('phase', 'u1'),
+        ('arrived', '<u2'),
+    ])
+
+
+def _read_header(f) -> Tuple[Dict, int]:
+    magic = f.read(len(TRACE_MAGIC))
+    if magic != TRACE_MAGIC:
+        raise ValueError("Not a traffic trace file (bad magic)")
+    (header_len,) = struct.unpack("<I", f.read(4))
+    header = json.loads(f.read(header_len).decode("utf-8"))
+    raw_size = len(TRACE_MAGIC) + 4 + header_len
+    data_offset = -(-raw_size // HEADER_ALIGN) * HEADER_ALIGN
+    return header, data_offset
+
+
+class TraceRecorder:
+    """Record per-step observations from a live SUMO run into a chunked binary trace.
+
+    Each record slot holds one observed unit; the simulation records one per approach
+    (DIRECTIONS), summed over that approach's lanes, not individual lanes. The header
+    still calls them 'lanes'.
+
+    Records are buffered in a preallocated chunk and appended to the file with a single
+    write once the chunk is full, so recording costs one array assignment per step.
+    """
+
+    def __init__(self, path: str, lanes: List[str], chunk_size: int = 4096):
+        self.path = path
+        self.lanes = list(lanes)
+        self.chunk_size = chunk_size
+        self.dtype = trace_dtype(len(self.lanes))
+        self._chunk = np.zeros(chunk_size, dtype=self.dtype)
+        self._fill = 0
+        self.count = 0
+
+        header = json.dumps({
+            'version': TRACE_VERSION,
+            'lanes': self.lanes,
+            'chunk_size': chunk_size,
+        }).encode("utf-8")
+        raw_size = len(TRACE_MAGIC) + 4 + len(header)
+        padding = -(-raw_size // HEADER_ALIGN) * HEADER_ALIGN - raw_size
+
+        self._file = open(path, "wb")
+        self._file.write(TRACE_MAGIC)
+        self._file.write(struct.pack("<I", len(header)))
+        self._file.write(header)
+        self._file.write(b"\0" * padding)
+
+    def record(self, step: int, vehicles, halting, phase: str, arrived: int):
+        """Append one step of observations"""
+        row = self._chunk[self._fill]
+        row['step'] = step
+        row['vehicles'] = vehicles
+        row['halting'] = halting
+        row['phase'] = PHASE_CODES.get(phase, 0)
+        row['arrived'] = arrived
+        self._fill += 1
+        self.count += 1
+        if self._fill == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered chunk to disk"""
+        if self._fill:
+            self._chunk[:self._fill].tofile(self._file)
+            self._file.flush()
+            self._fill = 0
+
+    def close(self):
+        """Flush remaining records and close the trace file"""
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+
+
+class TraceReplay:
+    """Read a recorded trace back through a read-only memory map.
+
+    Replay is open-loop. The recorded counts came from whatever signal ran during
+    recording and do not respond to the controller's actions, so a replay is for
+    evaluation only (the controller's decisions on recorded states, pipeline
+    throughput), not for learning a policy.
+
+    The record count is derived from the file size, so a trace whose recorder was
+    interrupted is still readable up to its last complete chunk.
+    """
+
+    def __init__(self, path: str, loop: bool = True):
+        self.path = path
+        self.loop = loop
+        with open(path, "rb") as f:
+            self.header, self.data_offset = _read_header(f)
+        self.lanes: List[str] = self.header['lanes']
+        self.dtype = trace_dtype(len(self.lanes))
+
+        record_bytes = os.path.getsize(path) - self.data_offset
+        length = record_bytes // self.dtype.itemsize
+        if length <= 0:
+            raise ValueError(f"Trace {path} contains no records")
+        self.records = np.memmap(path, dtype=self.dtype, mode="r",
+                                 offset=self.data_offset, shape=(length,))
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def _index(self, step: int) -> int:
+        if self.loop:
+            return step % len(self.records)
+        return min(step, len(self.records) - 1)
+
+    def vehicles_at(self, step: int) -> np.ndarray:
+        """Per-approach vehicle counts recorded at `step`"""
+        return self.records['vehicles'][self._index(step)]
+
+    def halting_at(self, step: int) -> np.ndarray:
+        """Per-approach halting counts recorded at `step`"""
+        return self.records['halting'][self._index(step)]
+
+    def arrived_at(self, step: int) -> int:
+        """Number of vehicles that left the network at `step`"""
+        return int(self.records['arrived'][self._index(step)])
+
+    def close(self):
+        """Release the memory map"""
+        self.records = None
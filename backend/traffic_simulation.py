@@ -1,6 +1,7 @@
 import os
 import sys
 import json
+import argparse
 import time
 import random
 import numpy as np
@@ -8,6 +9,24 @@ from typing import Dict, List, Tuple, Optional
 import traci
 import sumolib
 from rl_agent import DQNAgent
+from trace_replay import TraceRecorder, TraceReplay
+from metrics_engine import OnlineMetricsEngine
+from snapshot_library import SnapshotLibrary, SnapshotCapturer
+from async_learner import AsyncLearner
+from action_log import ActionLog, ACTION_NAMES
+from sumo_bridge import DIRECTIONS, LANE_FEATURES, LaneIndex, LaneFeatureBuilder, SignalCommander, net_file_from_config
+from meso_model import MesoscopicModel
+from detectors import (DETECTOR_FEATURES, DEFAULT_DETECTOR_LENGTH, DetectorReader, generate_detectors,
+                       with_additional_file)
+from lookahead import (PHASE_INDEX, LookaheadPlanner, MesoLookahead, SumoLookahead, advance_phase,
+                       phase_after_action)
+
+DEFAULT_SUMO_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sumo_configs", "intersection.sumo.cfg")
+# Incoming approach edges in state order [north, south, east, west]; every lane of each edge is observed
+APPROACH_EDGES = {"north": "N_to_C", "south": "S_to_C", "east": "E_to_C", "west": "W_to_C"}
+# Agent state length per sensing mode: four approach queues and the phase, then (e2) per-approach
+# detector jam length and occupancy
+STATE_SIZE = {"lanes": 5, "e2": 13}
 
 def convert_numpy_types(obj):
     """Recursively convert numpy types to standard Python types for JSON serialization."""
@@ -24,11 +43,44 @@ def convert_numpy_types(obj):
     return obj
 
 class TrafficSimulation:
-    def __init__(self, sumo_config_path: str):
+    def __init__(self, sumo_config_path: str, trace_recorder: Optional[TraceRecorder] = None,
+                 trace_replay: Optional[TraceReplay] = None, sumo_args: Optional[List[str]] = None,
+                 gui: Optional[bool] = None, agent: Optional[DQNAgent] = None,
+                 episode_length: int = 60, target_sync_episodes: int = 10, emit_frames: bool = True,
+                 snapshot_library: Optional[SnapshotLibrary] = None, capture_snapshots: bool = False,
+                 warm_start: bool = False, learner: Optional[AsyncLearner] = None, simulator: str = "sumo",
+                 lookahead_options: Optional[Dict] = None, policy_export: Optional[str] = None,
+                 sensing: str = "lanes", detector_length: float = DEFAULT_DETECTOR_LENGTH):
         self.sumo_config_path = sumo_config_path
         self.sumo_available = False
-        self.agent = DQNAgent(
-            state_size=5,  # [north_queue, south_queue, east_queue, west_queue, current_phase]
+        self.simulator = simulator
+        self.meso: Optional[MesoscopicModel] = None
+        self.trace_recorder = trace_recorder
+        self.trace_replay = trace_replay
+        self.sumo_args = list(sumo_args or [])
+        self.gui = "DISPLAY" in os.environ if gui is None else gui
+        self.snapshot_library = snapshot_library
+        self.capture_snapshots = capture_snapshots
+        self.warm_start = warm_start
+        self.snapshot_capturer: Optional[SnapshotCapturer] = None
+        self.lane_index: Optional[LaneIndex] = None
+        self.features: Optional[LaneFeatureBuilder] = None
+        # "lanes": exact per-lane counts; "e2": queues as seen by lane-area detectors at the stop line
+        self.sensing = sensing
+        self.detector_length = detector_length
+        self.detectors: Optional[DetectorReader] = None
+        self.signals = SignalCommander()
+        # Set once an agent issues actions; until then SUMO runs the net's own (or an uploaded) program
+        self.signal_control = False
+        self.learner = learner
+        self.lookahead_options = lookahead_options
+        self.policy_export = policy_export
+        self.lookahead: Optional[LookaheadPlanner] = None
+        self.last_decision_latency = 0.0
+        self.action_log = ActionLog(capacity=4096)
+        self.last_emitted_seq = 0
+        self.agent = agent or DQNAgent(
+            state_size=STATE_SIZE[sensing],  # [north_queue, south_queue, east_queue, west_queue, current_phase, ...]
             action_size=4,  # [EXTEND_NS, EXTEND_EW, SWITCH_NS, SWITCH_EW]
             learning_rate=0.001
         )
@@ -39,11 +91,13 @@ class TrafficSimulation:
         self.phase_duration = {'green': 30, 'yellow': 5}
         self.episode = 0
         self.total_reward = 0
+        self.episode_length = episode_length
+        self.target_sync_episodes = target_sync_episodes
+        self.emit_frames = emit_frames
         
         # Performance tracking
-        self.wait_times = []
-        self.throughput_counter = 0
-        self.max_queue_length = 0
+        self.metrics = OnlineMetricsEngine(window=300)
+        self.last_total_queue = 0
         
         # Simulated traffic state for fallback mode
         self.simulated_queues = [3, 2, 4, 1]  # [north, south, east, west]
@@ -53,34 +107,137 @@ class TrafficSimulation:
             'normal': [3, 2, 4, 1]
         }
         
-        # Baseline comparison data
-        self.baseline_wait_times = [34.2, 36.1, 32.8, 35.4, 33.9, 37.2, 31.5, 34.8]
-        
     def start_sumo(self):
         """Initialize SUMO simulation with fallback mode"""
+        if self.trace_replay is not None:
+            print(f"Replaying recorded trace {self.trace_replay.path} ({len(self.trace_replay)} steps, open-loop), SUMO not started", file=sys.stderr)
+            return
+        if self.simulator == "meso":
+            self.start_meso()
+            self.start_lookahead()
+            return
         try:
-            sumo_binary = "sumo-gui" if "DISPLAY" in os.environ else "sumo"
-            sumo_cmd = [sumo_binary, "--configuration-file", self.sumo_config_path, "--start", "--quit-on-end"]
+            self.lane_index = LaneIndex(net_file_from_config(self.sumo_config_path), approach_edges=APPROACH_EDGES)
+            self.features = LaneFeatureBuilder(self.lane_index)
+            sumo_args = self.sumo_args
+            if self.sensing == "e2":
+                detector_file = generate_detectors(net_file_from_config(self.sumo_config_path), self.detector_length)
+                sumo_args = with_additional_file(sumo_args, self.sumo_config_path, detector_file)
+                self.detectors = DetectorReader(self.lane_index, self.detector_length)
+            sumo_binary = "sumo-gui" if self.gui else "sumo"
+            sumo_cmd = [sumo_binary, "--configuration-file", self.sumo_config_path, "--start", "--quit-on-end"] + sumo_args
             traci.start(sumo_cmd)
             self.sumo_available = True
             print("SUMO simulation started successfully", file=sys.stderr)
+            if self.snapshot_library is not None:
+                if self.warm_start:
+                    self.warm_start_from_snapshot()
+                if self.capture_snapshots:
+                    self.snapshot_capturer = SnapshotCapturer(self.snapshot_library, self.lane_index.lane_ids)
+            self.subscribe_lanes()
         except Exception as e:
             print(f"SUMO not available, running in simulation mode: {e}", file=sys.stderr)
             self.sumo_available = False
+            self.start_meso()
+        self.start_lookahead()
+
+    def start_meso(self):
+        """Use the cell-transmission model of the configured network instead of SUMO"""
+        route_files = None
+        if "--route-files" in self.sumo_args:
+            route_files = self.sumo_args[self.sumo_args.index("--route-files") + 1].split(",")
+        # Poisson demand drawn from SUMO's --seed, so each evaluation seed sees different traffic
+        seed = None
+        if "--seed" in self.sumo_args:
+            seed = int(self.sumo_args[self.sumo_args.index("--seed") + 1])
+        try:
+            self.meso = MesoscopicModel.from_config(self.sumo_config_path, route_files, approach_edges=APPROACH_EDGES,
+                                                    stochastic=True, seed=seed)
+            print(f"Running the mesoscopic model ({self.meso.n.shape[1]} cells)", file=sys.stderr)
+        except Exception as e:
+            print(f"Mesoscopic model not available, using random traffic: {e}", file=sys.stderr)
+            self.meso = None
     
+    def start_lookahead(self):
+        """Warm up the lookahead workers for whichever simulator is running"""
+        if self.lookahead_options is None:
+            return
+        options = dict(self.lookahead_options)
+        workers = options.pop("workers", 3)
+        if self.sumo_available:
+            backend = SumoLookahead(self.sumo_config_path, self.sumo_args, self.lane_index.tls_id,
+                                    self.lane_index.lane_ids, workers)
+        elif self.meso is not None:
+            backend = MesoLookahead(self.meso, workers)
+        else:
+            print("Lookahead needs SUMO or the mesoscopic model, deciding with the DQN only", file=sys.stderr)
+            return
+        self.lookahead = LookaheadPlanner(backend, **options)
+
+    def subscribe_lanes(self):
+        """(Re)register lane and detector subscriptions; the feature set is a superset of the metrics set"""
+        self.metrics.subscribe(self.lane_index.lane_ids)
+        if self.detectors is None or self.trace_recorder is not None:
+            self.features.subscribe()
+        if self.detectors is not None:
+            self.detectors.subscribe()
+
+    def controller_state(self) -> Dict:
+        """Signal controller state stored with snapshots so it can be restored alongside SUMO"""
+        return {
+            'currentPhase': self.current_phase,
+            'phaseTimeRemaining': self.phase_time_remaining,
+            'cycleNumber': self.cycle_number,
+        }
+
+    def warm_start_from_snapshot(self, trigger: Optional[str] = None) -> bool:
+        """Load a sampled snapshot into SUMO instead of simulating the ramp-up"""
+        entry = self.snapshot_library.sample(trigger)
+        if entry is None:
+            print("No snapshots available for warm start, starting from an empty network", file=sys.stderr)
+            return False
+        try:
+            self.snapshot_library.restore(entry)
+        except Exception as e:
+            print(f"Failed to load snapshot {entry['id']}: {e}", file=sys.stderr)
+            return False
+        state = entry['controllerState']
+        self.current_phase = state['currentPhase']
+        self.phase_time_remaining = state['phaseTimeRemaining']
+        self.cycle_number = state['cycleNumber']
+        # SUMO's clock is now the snapshot's; keep ours (episodes, frames, the step budget) in line
+        self.simulation_time = int(entry['simTime'])
+        self.signals.invalidate()  # loadState restored the snapshot's signal program
+        if self.metrics.lanes:
+            self.subscribe_lanes()
+        print(f"Warm-started from snapshot {entry['id']} (t={entry['simTime']}, {entry['trigger']})", file=sys.stderr)
+        return True
+
     def get_traffic_state(self) -> np.ndarray:
         """Get current traffic state as feature vector"""
-        if self.sumo_available:
+        # Detector jam lengths and occupancies stay zero when SUMO (and so the detectors) is unavailable
+        detector_features = np.zeros(2 * len(DIRECTIONS))
+        if self.trace_replay is not None:
+            north_queue, south_queue, east_queue, west_queue = self.trace_replay.vehicles_at(self.simulation_time)
+        elif self.sumo_available:
             try:
-                # Get vehicle counts per lane from SUMO
-                north_queue = traci.lane.getLastStepVehicleNumber("N_to_C_0")
-                south_queue = traci.lane.getLastStepVehicleNumber("S_to_C_0")
-                east_queue = traci.lane.getLastStepVehicleNumber("E_to_C_0")
-                west_queue = traci.lane.getLastStepVehicleNumber("W_to_C_0")
+                if self.detectors is not None:
+                    # Halting vehicles the stop-line detectors of each approach see
+                    self.detectors.read()
+                    counts = self.detectors.approach_features()[:, DETECTOR_FEATURES.index('halting')]
+                    detector_features = self.detectors.state_features()
+                else:
+                    # Get vehicle counts summed over every lane of each approach from SUMO
+                    self.features.read()
+                    counts = self.features.approach_features()[:, LANE_FEATURES.index('count')]
+                north_queue, south_queue, east_queue, west_queue = (int(c) for c in counts)
             except:
                 # SUMO failed, fall back to simulated data
                 self.sumo_available = False
                 north_queue, south_queue, east_queue, west_queue = self.get_simulated_queues()
+        elif self.meso is not None:
+            counts = self.meso.approach_totals(self.meso.lane_vehicles())[0]
+            north_queue, south_queue, east_queue, west_queue = (int(round(c)) for c in counts)
         else:
             # Use simulated traffic data
             north_queue, south_queue, east_queue, west_queue = self.get_simulated_queues()
@@ -88,8 +245,23 @@ class TrafficSimulation:
         # Current phase encoding (0=NS_GREEN, 1=EW_GREEN, 2=NS_YELLOW, 3=EW_YELLOW)
         phase_encoding = {'NS_GREEN': 0, 'EW_GREEN': 1, 'NS_YELLOW': 2, 'EW_YELLOW': 3}.get(self.current_phase, 0)
         
-        return np.array([north_queue, south_queue, east_queue, west_queue, phase_encoding])
+        state = np.array([north_queue, south_queue, east_queue, west_queue, phase_encoding])
+        if self.sensing == "e2":
+            state = np.concatenate([state, detector_features])
+        return state
     
+    def record_trace_step(self):
+        """Append the per-approach observations of the SUMO step just taken to the trace recorder"""
+        try:
+            self.features.read()
+            totals = self.features.approach_features()
+            vehicles = totals[:, LANE_FEATURES.index('count')]
+            halting = totals[:, LANE_FEATURES.index('halting')]
+            arrived = traci.simulation.getArrivedNumber()
+        except:
+            return
+        self.trace_recorder.record(self.simulation_time, vehicles, halting, self.current_phase, arrived)
+
     def get_simulated_queues(self) -> Tuple[int, int, int, int]:
         """Generate realistic simulated traffic queue data"""
         # Simulate dynamic traffic based on time and previous actions
@@ -133,112 +305,121 @@ class TrafficSimulation:
     
     def apply_action(self, action: int):
         """Apply RL agent action to traffic light"""
-        action_map = {
-            0: "EXTEND_NS",
-            1: "EXTEND_EW", 
-            2: "SWITCH_NS",
-            3: "SWITCH_EW"
-        }
-        
-        action_name = action_map[action]
-        
-        if action_name == "EXTEND_NS" and self.current_phase == "NS_GREEN":
-            self.phase_time_remaining = min(self.phase_time_remaining + 10, 60)
-        elif action_name == "EXTEND_EW" and self.current_phase == "EW_GREEN":
-            self.phase_time_remaining = min(self.phase_time_remaining + 10, 60)
-        elif action_name == "SWITCH_NS" and self.current_phase == "EW_GREEN":
-            self.current_phase = "EW_YELLOW"
-            self.phase_time_remaining = self.phase_duration['yellow']
-        elif action_name == "SWITCH_EW" and self.current_phase == "NS_GREEN":
-            self.current_phase = "NS_YELLOW"
-            self.phase_time_remaining = self.phase_duration['yellow']
-        
-        # Apply to SUMO if available
-        if self.sumo_available:
-            try:
-                if self.current_phase == "NS_GREEN":
-                    traci.trafficlight.setPhase("C", 0)  # North-South green (phase 0 in generated net)
-                elif self.current_phase == "EW_GREEN":
-                    traci.trafficlight.setPhase("C", 2)  # East-West green (phase 2 in generated net)
-                elif self.current_phase == "NS_YELLOW":
-                    traci.trafficlight.setPhase("C", 1)  # North-South yellow (phase 1 in generated net)
-                elif self.current_phase == "EW_YELLOW":
-                    traci.trafficlight.setPhase("C", 3)  # East-West yellow (phase 3 in generated net)
-            except:
-                self.sumo_available = False  # Mark as unavailable if calls fail
+        self.current_phase, self.phase_time_remaining = phase_after_action(
+            self.current_phase, self.phase_time_remaining, action, self.phase_duration)
+
+        # The phase reaches SUMO in simulation_step, and only when it changed
+        self.signal_control = True
+
+    def upload_timing_plan(self, ns_green: float, ew_green: float, yellow: float):
+        """Hand SUMO a whole fixed-time cycle so it runs without per-step commands"""
+        if not self.sumo_available:
+            return
+        states = self.lane_index.phase_states
+        self.signals.upload_program(self.lane_index.tls_id, [
+            (states[PHASE_INDEX['NS_GREEN']], ns_green),
+            (states[PHASE_INDEX['NS_YELLOW']], yellow),
+            (states[PHASE_INDEX['EW_GREEN']], ew_green),
+            (states[PHASE_INDEX['EW_YELLOW']], yellow),
+        ])
+        self.signal_control = False
     
     def update_phase(self):
         """Update traffic light phase based on timer"""
-        self.phase_time_remaining -= 1
-        
-        if self.phase_time_remaining <= 0:
-            if self.current_phase == "NS_GREEN":
-                self.current_phase = "NS_YELLOW"
-                self.phase_time_remaining = self.phase_duration['yellow']
-            elif self.current_phase == "NS_YELLOW":
-                self.current_phase = "EW_GREEN"
-                self.phase_time_remaining = self.phase_duration['green']
-            elif self.current_phase == "EW_GREEN":
-                self.current_phase = "EW_YELLOW"
-                self.phase_time_remaining = self.phase_duration['yellow']
-            elif self.current_phase == "EW_YELLOW":
-                self.current_phase = "NS_GREEN"
-                self.phase_time_remaining = self.phase_duration['green']
-                self.cycle_number += 1
+        self.current_phase, self.phase_time_remaining, cycle_done = advance_phase(
+            self.current_phase, self.phase_time_remaining, self.phase_duration)
+        if cycle_done:
+            self.cycle_number += 1
     
+    def update_metrics(self, state: np.ndarray):
+        """Feed this step's measurements into the online metrics engine"""
+        if self.trace_replay is not None:
+            halting = self.trace_replay.halting_at(self.simulation_time)
+            self.metrics.update(int(sum(state[:4])), int(halting.sum()),
+                                self.trace_replay.arrived_at(self.simulation_time), int(halting.max()))
+            return
+        if self.sumo_available:
+            try:
+                self.metrics.update_from_subscriptions()
+                return
+            except:
+                self.sumo_available = False
+        if self.meso is not None:
+            vehicles = self.meso.lane_vehicles()[0]
+            halting = self.meso.approach_totals(self.meso.lane_halting())[0]
+            self.metrics.update(int(round(vehicles.sum())), int(round(halting.sum())),
+                                int(round(self.meso.last_arrived[0])), int(round(halting.max())))
+            return
+        # Fallback model: queued vehicles are halting, queue reductions are departures
+        total_queue = int(sum(state[:4]))
+        departed = max(0, self.last_total_queue - total_queue)
+        self.last_total_queue = total_queue
+        self.metrics.update(total_queue, total_queue, departed, int(max(state[:4])))
+
     def calculate_performance_metrics(self, state: np.ndarray) -> Dict:
         """Calculate current performance metrics"""
-        # Simulate realistic metrics based on state
-        total_vehicles = sum(state[:4])
-        avg_wait_time = 20.0 + total_vehicles * 0.8 + random.uniform(-2, 2)
-        throughput = max(1200 - total_vehicles * 50, 800) + random.randint(-100, 100)
-        max_queue = int(max(state[:4]))
-        efficiency_score = max(50, 100 - total_vehicles * 2) + random.uniform(-5, 5)
-        
-        # Store for episode tracking
-        self.wait_times.append(avg_wait_time)
-        self.max_queue_length = max(self.max_queue_length, max_queue)
-        if self.simulation_time % 60 == 0:  # Every minute
-            self.throughput_counter += throughput / 60
-        
-        return {
-            'avgWaitTime': avg_wait_time,
-            'throughput': throughput,
-            'maxQueue': max_queue,
-            'efficiencyScore': efficiency_score
-        }
+        self.update_metrics(state)
+        return self.metrics.snapshot()
     
     def get_recent_actions(self) -> List[Dict]:
-        """Get recent agent actions for display"""
-        actions = []
-        current_time = time.time()
-        action_names = ["EXTEND_NS", "EXTEND_EW", "SWITCH_NS", "SWITCH_EW"]
-        
-        for i in range(3):
-            time_offset = i * 7  # 7 seconds apart
-            timestamp = time.strftime("%H:%M:%S", time.localtime(current_time - time_offset))
-            action = action_names[random.randint(0, 3)]
-            actions.append({
-                'time': timestamp,
-                'action': action
-            })
-        
+        """Agent decisions logged since the previous frame"""
+        actions = self.action_log.since(self.last_emitted_seq)
+        self.last_emitted_seq = self.action_log.next_seq - 1
         return actions
     
-    def run_step(self):
-        """Run one simulation step"""
+    def simulation_step(self):
+        """Advance SUMO (or the mesoscopic model standing in for it) by one step"""
+        if self.meso is not None and not self.sumo_available:
+            self.meso.set_phase(PHASE_INDEX[self.current_phase])
+            self.meso.step()
+            return
         if self.sumo_available:
             try:
+                if self.signal_control:
+                    self.signals.hold_phase(self.lane_index.tls_id, PHASE_INDEX[self.current_phase])
+                self.signals.flush()
                 if traci.isLoaded():
                     traci.simulationStep()
             except:
                 self.sumo_available = False  # Disable SUMO if it fails
+            if self.sumo_available and self.trace_recorder is not None:
+                self.record_trace_step()
+            if self.sumo_available and self.snapshot_capturer is not None:
+                try:
+                    self.snapshot_capturer.observe(self.simulation_time, self.controller_state())
+                except Exception as e:
+                    print(f"Snapshot capture failed: {e}", file=sys.stderr)
+
+    def run_controller_step(self, controller) -> Dict:
+        """Run one step under an external controller, without training or frame output.
+
+        `controller.act(state, sim)` returns an action index, or None to leave the
+        signal program untouched for this step.
+        """
+        self.simulation_step()
+        state = self.get_traffic_state()
+        action = controller.act(state, self)
+        if action is not None:
+            self.apply_action(action)
+        self.update_phase()
+        self.simulation_time += 1
+        return self.calculate_performance_metrics(state)
+
+    def run_step(self):
+        """Run one simulation step"""
+        self.simulation_step()
         
         # Get current state
         state = self.get_traffic_state()
         
-        # Agent decides action
-        action = self.agent.act(state)
+        # Agent decides action (from the learner's policy snapshot in async mode)
+        decision_started = time.perf_counter()
+        decider = self.learner if self.learner is not None else self.agent
+        action, q_values = decider.act_with_q_values(state)
+        if self.lookahead is not None:
+            action = self.lookahead.decide(state, action, self.current_phase, self.phase_time_remaining,
+                                           self.phase_duration)
+        self.last_decision_latency = time.perf_counter() - decision_started
         
         # Apply action
         self.apply_action(action)
@@ -246,6 +427,7 @@ class TrafficSimulation:
         # Calculate reward
         reward = self.calculate_reward(state, action)
         self.total_reward += reward
+        self.action_log.append(action, q_values, reward, self.agent.epsilon, self.simulation_time)
         
         # Update phase timing
         self.update_phase()
@@ -255,7 +437,9 @@ class TrafficSimulation:
         
         # Train agent
         self.agent.remember(state, action, reward, next_state, False)
-        if len(self.agent.memory) > 32:
+        if self.learner is not None:
+            self.learner.notify_step()
+        elif len(self.agent.memory) > self.agent.batch_size:
             self.agent.replay()
         
         # Update simulation time
@@ -279,21 +463,74 @@ class TrafficSimulation:
                 'vehicles': []  # Would be populated with individual vehicle data
             },
             'performance': performance,
+            'transition': {
+                'state': state,
+                'action': action,
+                'reward': reward,
+                'nextState': next_state,
+                'simulationTime': self.simulation_time,
+            },
             'agent': {
-                'lastAction': ["EXTEND_NS", "EXTEND_EW", "SWITCH_NS", "SWITCH_EW"][action],
+                'lastAction': ACTION_NAMES[action],
                 'epsilon': self.agent.epsilon,
                 'episode': self.episode,
-                'replayBufferFull': min(100, len(self.agent.memory) / 10000 * 100),
+                'replayBufferFull': min(100, len(self.agent.memory) / self.agent.memory.maxlen * 100),
+                'decisionLatencyMs': self.last_decision_latency * 1000,
                 'recentActions': self.get_recent_actions()
             }
         }
+        if self.lookahead is not None:
+            simulation_data['agent']['lookahead'] = self.lookahead.summary()
+        if self.detectors is not None and self.sumo_available:
+            totals = self.detectors.approach_totals
+            simulation_data['intersection']['detectors'] = {
+                'jamLength': totals[:, DETECTOR_FEATURES.index('jam_length')].tolist(),
+                'halting': totals[:, DETECTOR_FEATURES.index('halting')].tolist(),
+                'occupancy': totals[:, DETECTOR_FEATURES.index('occupancy')].tolist(),
+            }
         
         # Output JSON data for Node.js backend
-        print(json.dumps(simulation_data, default=convert_numpy_types))
-        sys.stdout.flush()
-    
+        if self.emit_frames:
+            print(json.dumps(simulation_data, default=convert_numpy_types))
+            sys.stdout.flush()
+        return simulation_data
+
+    def advance_episode(self):
+        """Episode bookkeeping after a step: count episodes and sync the target network"""
+        if self.simulation_time % self.episode_length == 0:
+            self.episode += 1
+            if self.episode % self.target_sync_episodes == 0:
+                if self.learner is not None:
+                    self.learner.request_target_sync()
+                else:
+                    self.agent.update_target_model()
+            self.export_policy()
+
+    def export_policy(self):
+        """Publish the current greedy policy for the API's predict endpoints"""
+        if self.policy_export is None:
+            return
+        snapshot = self.learner.snapshot if self.learner is not None else self.agent.policy_snapshot()
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.policy_export)), exist_ok=True)
+            # Written aside and renamed so the server never loads a partial archive
+            tmp_path = self.policy_export[:-len(".npz")] + ".tmp.npz"
+            snapshot.save(tmp_path)
+            os.replace(tmp_path, self.policy_export)
+        except OSError as e:
+            print(f"Policy export failed: {e}", file=sys.stderr)
+
     def cleanup(self):
         """Clean up SUMO simulation"""
+        self.export_policy()
+        if self.learner is not None:
+            self.learner.stop()
+        if self.lookahead is not None:
+            self.lookahead.close()
+        if self.trace_recorder is not None:
+            self.trace_recorder.close()
+        if self.trace_replay is not None:
+            self.trace_replay.close()
         if self.sumo_available:
             try:
                 if traci.isLoaded():
@@ -301,27 +538,124 @@ class TrafficSimulation:
             except:
                 pass
 
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the RL traffic signal simulation")
+    parser.add_argument("--config", metavar="PATH", default=DEFAULT_SUMO_CONFIG, help="SUMO configuration file")
+    parser.add_argument("--simulator", choices=("sumo", "meso"), default="sumo",
+                        help="sumo: SUMO via TraCI (the mesoscopic model is the fallback); meso: cell-transmission model only")
+    parser.add_argument("--sensing", choices=("lanes", "e2"), default="lanes",
+                        help="lanes: exact vehicle counts per lane; e2: queues from generated lane-area detectors")
+    parser.add_argument("--detector-length", type=float, default=DEFAULT_DETECTOR_LENGTH,
+                        help="Metres upstream of the stop line each E2 detector covers")
+    parser.add_argument("--route-files", metavar="PATHS",
+                        help="Comma-separated route files overriding those in the SUMO configuration")
+    parser.add_argument("--record-trace", metavar="PATH",
+                        help="Record per-step approach observations from SUMO into a binary trace file")
+    parser.add_argument("--replay-trace", metavar="PATH",
+                        help="Replay a recorded trace instead of SUMO or the random fallback (open-loop: "
+                             "the trace ignores the controller, so use it for evaluation only)")
+    parser.add_argument("--step-delay", type=float, default=0.1,
+                        help="Wall-clock seconds to sleep between steps (0 for memory-speed training)")
+    parser.add_argument("--realtime-factor", type=float,
+                        help="Pace the run at this many simulated seconds per wall-clock second (overrides --step-delay)")
+    parser.add_argument("--steps", type=int, default=36000, help="Simulated seconds to run")
+    parser.add_argument("--snapshot-dir", metavar="DIR", help="SUMO state snapshot library directory")
+    parser.add_argument("--capture-snapshots", action="store_true",
+                        help="Save states at peak-queue and spillback moments into the snapshot library")
+    parser.add_argument("--warm-start", action="store_true",
+                        help="Start from a snapshot sampled from the library instead of an empty network")
+    parser.add_argument("--policy-export", metavar="PATH.npz",
+                        help="Write the greedy policy here every episode, for the API's predict endpoints")
+    lookahead_group = parser.add_argument_group("lookahead")
+    lookahead_group.add_argument("--lookahead", action="store_true",
+                                 help="Check critical DQN decisions by rolling out candidate plans from the current state")
+    lookahead_group.add_argument("--lookahead-horizon", type=int, default=60, help="Seconds simulated per candidate")
+    lookahead_group.add_argument("--lookahead-budget-ms", type=float, default=200.0,
+                                 help="Wall-clock budget per decision before falling back to the DQN action")
+    lookahead_group.add_argument("--lookahead-workers", type=int, default=3,
+                                 help="Warm SUMO workers (or mesoscopic replicas) evaluating candidates in parallel")
+    lookahead_group.add_argument("--lookahead-min-queue", type=int, default=10,
+                                 help="Queued vehicles at which a green-phase decision counts as critical")
+    agent_group = parser.add_argument_group("agent hyperparameters")
+    agent_group.add_argument("--learning-rate", type=float, default=0.001)
+    agent_group.add_argument("--gamma", type=float, default=0.95)
+    agent_group.add_argument("--epsilon-decay", type=float, default=0.995)
+    agent_group.add_argument("--batch-size", type=int, default=32)
+    agent_group.add_argument("--memory-size", type=int, default=10000)
+    agent_group.add_argument("--episode-length", type=int, default=60, help="Steps per episode")
+    agent_group.add_argument("--target-sync-episodes", type=int, default=10,
+                             help="Episodes between target network updates")
+    agent_group.add_argument("--async-learner", action="store_true",
+                             help="Train on a background learner thread; the actor uses policy snapshots")
+    agent_group.add_argument("--train-every", type=int, default=1,
+                             help="Actor steps per learner update (async mode)")
+    agent_group.add_argument("--gradient-steps", type=int, default=1,
+                             help="Replay batches trained per learner update (async mode)")
+    return parser.parse_args(argv)
+
+def build_agent(args: argparse.Namespace) -> DQNAgent:
+    return DQNAgent(
+        state_size=STATE_SIZE[args.sensing],
+        action_size=4,
+        learning_rate=args.learning_rate,
+        gamma=args.gamma,
+        epsilon_decay=args.epsilon_decay,
+        batch_size=args.batch_size,
+        memory_size=args.memory_size,
+    )
+
 def main():
-    # SUMO config file path
-    config_path = os.path.join(os.path.dirname(__file__), "sumo_configs", "intersection.sumo.cfg")
-    
+    args = parse_args()
+
+    config_path = args.config
+    agent = build_agent(args)
+    learner = AsyncLearner(agent, args.train_every, args.gradient_steps) if args.async_learner else None
+
     # Initialize simulation
-    sim = TrafficSimulation(config_path)
+    sim = TrafficSimulation(
+        config_path,
+        sumo_args=["--route-files", args.route_files] if args.route_files else None,
+        trace_recorder=TraceRecorder(args.record_trace, DIRECTIONS) if args.record_trace else None,
+        trace_replay=TraceReplay(args.replay_trace) if args.replay_trace else None,
+        agent=agent,
+        learner=learner,
+        episode_length=args.episode_length,
+        target_sync_episodes=args.target_sync_episodes,
+        snapshot_library=SnapshotLibrary(args.snapshot_dir, scenario=os.path.splitext(os.path.basename(config_path))[0]) if args.snapshot_dir else None,
+        capture_snapshots=args.capture_snapshots,
+        warm_start=args.warm_start,
+        simulator=args.simulator,
+        lookahead_options={
+            "workers": args.lookahead_workers,
+            "horizon": args.lookahead_horizon,
+            "budget": args.lookahead_budget_ms / 1000.0,
+            "min_queue": args.lookahead_min_queue,
+        } if args.lookahead else None,
+        policy_export=args.policy_export,
+        sensing=args.sensing,
+        detector_length=args.detector_length,
+    )
     
     try:
         # Start SUMO (will continue without GUI if not available)
         sim.start_sumo()
+        if learner is not None:
+            learner.start()
         
         # Main simulation loop
-        while sim.simulation_time < 36000:  # Run for 10 hours simulation time
+        paced_from = (time.monotonic(), sim.simulation_time)
+        while sim.simulation_time < args.steps:  # Default: 10 hours simulation time
             sim.run_step()
-            time.sleep(0.1)  # Real-time delay
+            if args.realtime_factor:
+                # Sleep against a fixed schedule so step cost doesn't accumulate as drift
+                delay = paced_from[0] + (sim.simulation_time - paced_from[1]) / args.realtime_factor - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            elif args.step_delay > 0:
+                time.sleep(args.step_delay)  # Real-time delay
             
             # Episode management
-            if sim.simulation_time % 60 == 0:  # Every minute, instead of every hour (3600 steps)
-                sim.episode += 1
-                if sim.episode % 10 == 0:
-                    sim.agent.update_target_model()
+            sim.advance_episode()
     
     except KeyboardInterrupt:
         print("Simulation interrupted by user", file=sys.stderr)
@@ -114,45 +114,46 @@ async def start_websocket_server(host: str = "localhost", port: int = 8765):
     logger.info("WebSocket server started successfully")
     return server
 
+def generate_mock_data() -> Dict:
+    """Random frame shaped like the simulation's stdout frames"""
+    import random
+
+    return {
+        'simulationTime': random.randint(1000, 50000),
+        'cycleNumber': random.randint(100, 2000),
+        'intersection': {
+            'northQueue': random.randint(0, 12),
+            'southQueue': random.randint(0, 15),
+            'eastQueue': random.randint(0, 8),
+            'westQueue': random.randint(0, 10),
+            'currentPhase': random.choice(['NS_GREEN', 'EW_GREEN', 'NS_YELLOW', 'EW_YELLOW']),
+            'phaseTimeRemaining': random.randint(5, 30),
+            'vehicles': []
+        },
+        'performance': {
+            'avgWaitTime': random.uniform(18, 35),
+            'throughput': random.randint(1200, 2000),
+            'maxQueue': random.randint(8, 15),
+            'efficiencyScore': random.uniform(75, 95)
+        },
+        'agent': {
+            'lastAction': random.choice(['EXTEND_NS', 'EXTEND_EW', 'SWITCH_NS', 'SWITCH_EW']),
+            'epsilon': random.uniform(0.01, 0.1),
+            'episode': random.randint(10000, 20000),
+            'replayBufferFull': random.uniform(85, 100),
+            'recentActions': [
+                {'time': '14:32:41', 'action': 'EXTEND_EW'},
+                {'time': '14:32:35', 'action': 'SWITCH_NS'},
+                {'time': '14:32:28', 'action': 'EXTEND_NS'}
+            ]
+        }
+    }
+
 # Example usage for testing
 async def simulate_data_updates():
     """Simulate periodic data updates for testing"""
-    import random
-    
     while True:
-        # Generate mock simulation data
-        mock_data = {
-            'simulationTime': random.randint(1000, 50000),
-            'cycleNumber': random.randint(100, 2000),
-            'intersection': {
-                'northQueue': random.randint(0, 12),
-                'southQueue': random.randint(0, 15),
-                'eastQueue': random.randint(0, 8),
-                'westQueue': random.randint(0, 10),
-                'currentPhase': random.choice(['NS_GREEN', 'EW_GREEN', 'NS_YELLOW', 'EW_YELLOW']),
-                'phaseTimeRemaining': random.randint(5, 30),
-                'vehicles': []
-            },
-            'performance': {
-                'avgWaitTime': random.uniform(18, 35),
-                'throughput': random.randint(1200, 2000),
-                'maxQueue': random.randint(8, 15),
-                'efficiencyScore': random.uniform(75, 95)
-            },
-            'agent': {
-                'lastAction': random.choice(['EXTEND_NS', 'EXTEND_EW', 'SWITCH_NS', 'SWITCH_EW']),
-                'epsilon': random.uniform(0.01, 0.1),
-                'episode': random.randint(10000, 20000),
-                'replayBufferFull': random.uniform(85, 100),
-                'recentActions': [
-                    {'time': '14:32:41', 'action': 'EXTEND_EW'},
-                    {'time': '14:32:35', 'action': 'SWITCH_NS'},
-                    {'time': '14:32:28', 'action': 'EXTEND_NS'}
-                ]
-            }
-        }
-        
-        await websocket_manager.broadcast(mock_data)
+        await websocket_manager.broadcast(generate_mock_data())
         await asyncio.sleep(2)  # Update every 2 seconds
 
 if __name__ == "__main__":
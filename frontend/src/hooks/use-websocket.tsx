@@ -15,6 +15,15 @@ const WEBSOCKET_URL = process.env.NODE_ENV === 'production'
   ? `wss://${window.location.host}/ws`
   : `ws://localhost:8000/ws`;
 
+// Frames carry only the actions logged since the previous frame, so keep a rolling window here
+const MAX_RECENT_ACTIONS = 10;
+
+function mergeRecentActions(prev: SimulationData | undefined, next: SimulationData): SimulationData {
+  const newest = [...next.agent.recentActions].reverse();
+  const recentActions = [...newest, ...(prev?.agent.recentActions ?? [])].slice(0, MAX_RECENT_ACTIONS);
+  return { ...next, agent: { ...next.agent, recentActions } };
+}
+
 export function useWebSocket(): UseWebSocketReturn {
   const [simulationData, setSimulationData] = useState<SimulationData>();
   const [isConnected, setIsConnected] = useState(false);
@@ -57,7 +66,7 @@ export function useWebSocket(): UseWebSocketReturn {
         // Assuming FastAPI sends { "type": "simulation_update", "data": simulationData }
         if (message.type === 'simulation_update') {
           const validatedData = SimulationDataSchema.parse(message.data);
-          setSimulationData(validatedData);
+          setSimulationData((prev) => mergeRecentActions(prev, validatedData));
           setIsRunning(message.isRunning); // Update isRunning from message
           setError(undefined);
         } else if (message.type === 'initial_data') {